@@ -0,0 +1,74 @@
+import os
+import json
+import logging
+import threading
+from contextlib import contextmanager
+
+import httplib2
+from google.oauth2 import service_account
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build
+
+logger = logging.getLogger(__name__)
+
+# =====================================================
+# CLIENTE DE GOOGLE CALENDAR (UNO POR PROCESO)
+# =====================================================
+# Antes cada sync volvía a leer GOOGLE_CREDENTIALS_JSON, creaba credenciales
+# nuevas y llamaba a build(), que carga el documento de descubrimiento.
+# Ahora eso se hace una sola vez:
+# - Credenciales de service account: AuthorizedHttp renueva el token solo.
+# - Documento de descubrimiento estático (viene con google-api-python-client).
+# - Un único transporte HTTP reutilizado (conexión keep-alive).
+#
+# httplib2.Http no es thread-safe: el cliente se usa con `calendar_service()`,
+# que además serializa los syncs (dos syncs a la vez solo duplicarían eventos).
+
+SCOPES = ['https://www.googleapis.com/auth/calendar']
+CALENDAR_HTTP_TIMEOUT = int(os.getenv("CALENDAR_HTTP_TIMEOUT", "30"))
+
+_lock = threading.RLock()
+_service = None
+
+
+class CalendarAuthError(Exception):
+    """No se pudieron cargar las credenciales o crear el cliente."""
+
+
+def _load_credentials():
+    json_creds_env = os.getenv('GOOGLE_CREDENTIALS_JSON')
+    if json_creds_env:
+        return service_account.Credentials.from_service_account_info(json.loads(json_creds_env), scopes=SCOPES)
+    if os.path.exists('credentials.json'):
+        return service_account.Credentials.from_service_account_file('credentials.json', scopes=SCOPES)
+    raise CalendarAuthError("ERROR: No se encontraron credenciales")
+
+
+def _build_service():
+    creds = _load_credentials()
+    http = AuthorizedHttp(creds, http=httplib2.Http(timeout=CALENDAR_HTTP_TIMEOUT))
+    service = build('calendar', 'v3', http=http, static_discovery=True, cache_discovery=False)
+    logger.info("📡 Cliente de Google Calendar creado.")
+    return service
+
+
+@contextmanager
+def calendar_service():
+    """Entrega el cliente compartido de Calendar (lo crea la primera vez)."""
+    global _service
+    with _lock:
+        if _service is None:
+            try:
+                _service = _build_service()
+            except CalendarAuthError:
+                raise
+            except Exception as e:
+                raise CalendarAuthError(e) from e
+        yield _service
+
+
+def reset_calendar_service():
+    """Descarta el cliente (ej: tras rotar las credenciales); el próximo uso crea uno nuevo."""
+    global _service
+    with _lock:
+        _service = None
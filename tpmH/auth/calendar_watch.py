@@ -0,0 +1,135 @@
+import os
+import hmac
+import uuid
+import secrets
+import logging
+from datetime import datetime, timedelta, timezone
+
+from googleapiclient.errors import HttpError
+
+from auth.calendar_client import calendar_service
+from db.models import CalendarSyncState
+from db.postgres_db import PostgresSession
+
+logger = logging.getLogger(__name__)
+
+# =====================================================
+# CANALES PUSH DE GOOGLE CALENDAR (events.watch)
+# =====================================================
+# Google avisa por POST a CALENDAR_WEBHOOK_URL cada vez que cambia el
+# calendario (ver auth/calendar_webhook.py). El canal vence solo: este módulo
+# lo crea, lo guarda en calendar_sync_state y lo renueva antes de que expire
+# (se crea el nuevo y después se detiene el viejo, así no quedan huecos).
+#
+# Sin CALENDAR_WEBHOOK_URL (ej: desarrollo local sin https público) no se
+# crea ningún canal y el sync sigue solo por el planificador.
+
+# Duración pedida a Google (puede darnos menos; se usa la que responde)
+CALENDAR_WATCH_TTL_SECONDS = int(os.getenv("CALENDAR_WATCH_TTL_SECONDS", "604800"))
+# Se renueva si al canal le queda menos que esto
+CALENDAR_WATCH_RENEW_MARGIN_SECONDS = int(os.getenv("CALENDAR_WATCH_RENEW_MARGIN_SECONDS", "86400"))
+
+
+def _webhook_url():
+    # Se lee al usarla: este módulo puede importarse antes de load_dotenv()
+    return os.getenv("CALENDAR_WEBHOOK_URL")
+
+
+def push_enabled():
+    return bool(_webhook_url())
+
+
+def _from_millis(value):
+    if not value:
+        return None
+    return datetime.fromtimestamp(int(value) / 1000, tz=timezone.utc)
+
+
+def _as_utc(value):
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _stop_channel(service, channel_id, resource_id):
+    """Detiene un canal viejo. Si Google ya no lo conoce no es un error."""
+    try:
+        service.channels().stop(body={"id": channel_id, "resourceId": resource_id}).execute()
+        logger.info(f"📡 Canal {channel_id} detenido.")
+    except HttpError as e:
+        if e.resp.status not in (404, 410):
+            logger.warning(f"⚠️ No se pudo detener el canal {channel_id}: {e}")
+
+
+def ensure_watch_channel(calendar_id, force=False):
+    """
+    Deja un canal push vigente para `calendar_id`: si no hay, o le queda menos
+    de CALENDAR_WATCH_RENEW_MARGIN_SECONDS, crea uno nuevo y detiene el viejo.
+    Retorna un dict con el canal y si se renovó.
+    """
+    if not push_enabled():
+        return {"renewed": False, "msg": "Push desactivado (falta CALENDAR_WEBHOOK_URL)"}
+
+    now = datetime.now(timezone.utc)
+    session = PostgresSession()
+    try:
+        state = session.get(CalendarSyncState, calendar_id)
+        if state is None:
+            state = CalendarSyncState(calendar_id=calendar_id)
+            session.add(state)
+
+        expiration = _as_utc(state.channel_expiration)
+        if (not force and state.channel_id and expiration
+                and expiration - now > timedelta(seconds=CALENDAR_WATCH_RENEW_MARGIN_SECONDS)):
+            return {"renewed": False, "channel_id": state.channel_id, "expiration": expiration.isoformat()}
+
+        old_channel = (state.channel_id, state.channel_resource_id)
+        channel_id = f"tpmh-{uuid.uuid4()}"
+        token = secrets.token_urlsafe(32)
+
+        with calendar_service() as service:
+            channel = service.events().watch(calendarId=calendar_id, body={
+                "id": channel_id,
+                "type": "web_hook",
+                "address": _webhook_url(),
+                "token": token,
+                "params": {"ttl": str(CALENDAR_WATCH_TTL_SECONDS)},
+            }).execute()
+
+            state.channel_id = channel_id
+            state.channel_resource_id = channel.get("resourceId")
+            state.channel_token = token
+            state.channel_expiration = _from_millis(channel.get("expiration"))
+            session.commit()
+
+            if old_channel[0] and old_channel[1]:
+                _stop_channel(service, *old_channel)
+
+        logger.info(f"📡 Canal push {channel_id} activo hasta {state.channel_expiration}.")
+        return {
+            "renewed": True,
+            "channel_id": channel_id,
+            "expiration": _as_utc(state.channel_expiration).isoformat() if state.channel_expiration else None,
+        }
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def find_channel(channel_id, token):
+    """
+    Retorna el calendar_id del canal vigente `channel_id` si `token` coincide,
+    o None (canal viejo, desconocido o token inválido).
+    """
+    session = PostgresSession()
+    try:
+        state = session.query(CalendarSyncState).filter(CalendarSyncState.channel_id == channel_id).first()
+        if state is None or not state.channel_token:
+            return None
+        if not hmac.compare_digest(state.channel_token, token or ""):
+            return None
+        return state.calendar_id
+    finally:
+        session.close()
@@ -0,0 +1,61 @@
+import logging
+
+from fastapi import Request, Response
+from nicegui import app
+
+from auth.calendar_watch import find_channel
+from auth.routes import CALENDAR_WEBHOOK_PATH
+from components.sync_scheduler import request_calendar_sync
+from db.executor import run_db
+
+logger = logging.getLogger(__name__)
+
+# =====================================================
+# WEBHOOK DE NOTIFICACIONES PUSH DE GOOGLE CALENDAR
+# =====================================================
+# Google hace POST a esta ruta (sin cuerpo; todo viene en cabeceras) cuando
+# cambia algo en el calendario vigilado. No se descarga nada aquí: solo se
+# pide una corrida del sync incremental (syncToken) y se responde enseguida.
+# Varios avisos seguidos se agrupan en una sola corrida (ver PeriodicJob).
+# La ruta se registra explícitamente desde main() (register_calendar_webhook).
+#
+# Prueba local (con el canal guardado en calendar_sync_state):
+#
+#   curl -X POST http://localhost:8080/calendar/notifications \
+#        -H "X-Goog-Channel-ID: <channel_id>" \
+#        -H "X-Goog-Channel-Token: <channel_token>" \
+#        -H "X-Goog-Resource-State: exists"
+
+# 'sync' es el aviso inicial al crear el canal: no hay cambios que traer
+SYNC_STATES = {'exists', 'not_exists'}
+
+
+def _log_result(fut):
+    if not fut.cancelled() and fut.exception() is not None:
+        logger.warning(f"⚠️ Sync pedido por notificación push falló: {fut.exception()}")
+
+
+async def calendar_notification(request: Request):
+    channel_id = request.headers.get('X-Goog-Channel-ID')
+    state = request.headers.get('X-Goog-Resource-State')
+    if not channel_id or not state:
+        return Response(status_code=400)
+
+    calendar_id = await run_db(find_channel, channel_id, request.headers.get('X-Goog-Channel-Token'))
+    if calendar_id is None:
+        logger.warning(f"⚠️ Notificación de canal desconocido o token inválido: {channel_id}")
+        return Response(status_code=404)
+
+    if state in SYNC_STATES:
+        fut = request_calendar_sync(calendar_id)
+        if fut is None:
+            logger.warning(f"⚠️ Notificación para un calendario que no se sincroniza aquí: {calendar_id}")
+        else:
+            fut.add_done_callback(_log_result)
+            logger.info(f"📡 Notificación push #{request.headers.get('X-Goog-Message-Number')}: sync pedido.")
+    return Response(status_code=200)
+
+
+def register_calendar_webhook():
+    """Registra la ruta del webhook en la app (se llama una vez desde main())."""
+    app.add_api_route(CALENDAR_WEBHOOK_PATH, calendar_notification, methods=['POST'])
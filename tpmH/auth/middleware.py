@@ -0,0 +1,83 @@
+from fastapi.responses import RedirectResponse
+from nicegui import app
+
+from auth.routes import CALENDAR_WEBHOOK_PATH
+
+# =====================================================
+# MIDDLEWARE DE AUTENTICACIÓN (ASGI PURO)
+# =====================================================
+# Antes era un BaseHTTPMiddleware: cada petición (incluidos los assets de
+# /_nicegui y los archivos de /uploads) pasaba por una tarea y un stream
+# extra solo para hacer unos startswith. Ahora es un middleware ASGI directo:
+# - Las reglas se arman una vez: prefijos públicos en una tupla (un solo
+#   startswith en C) y rutas exactas en frozensets.
+# - Las rutas estáticas pasan de largo sin tocar app.storage.user.
+# - Solo se construye una respuesta cuando hay que redirigir.
+#
+# Medición:  python -m auth.middleware_bench
+
+# No bloquear NiceGUI ni estáticos (prefijo de texto, igual que antes)
+PUBLIC_PREFIXES = ('/_nicegui', '/static', '/components', '/uploads')
+# Avisos de Google (sin sesión)
+PUBLIC_PATHS = frozenset({CALENDAR_WEBHOOK_PATH})
+
+unrestricted_page_routes = frozenset({
+    '/login', '/signup', '/resetpass', '/MainPage', '/method', '/planScreen'
+})
+# Páginas que un usuario logueado no necesita ver
+LOGGED_IN_REDIRECT_PATHS = frozenset({'/login', '/signup', '/MainPage', '/'})
+
+
+def is_public_path(path, prefixes=PUBLIC_PREFIXES, paths=PUBLIC_PATHS):
+    return path.startswith(prefixes) or path in paths
+
+
+def _user_storage():
+    return app.storage.user
+
+
+class AuthMiddleware:
+    """Redirige según sesión y rol. `storage` permite medirlo sin NiceGUI (ver middleware_bench)."""
+
+    def __init__(self, asgi_app, storage=_user_storage):
+        self.asgi_app = asgi_app
+        self.storage = storage
+
+    async def __call__(self, scope, receive, send):
+        # Websockets / lifespan: no se tocan
+        if scope['type'] != 'http':
+            await self.asgi_app(scope, receive, send)
+            return
+
+        # A. No bloquear NiceGUI ni estáticos
+        path = scope['path']
+        if is_public_path(path):
+            await self.asgi_app(scope, receive, send)
+            return
+
+        redirect = self._redirect_for(path)
+        if redirect is None:
+            await self.asgi_app(scope, receive, send)
+        else:
+            await RedirectResponse(redirect)(scope, receive, send)
+
+    def _redirect_for(self, path):
+        """Ruta a la que redirigir, o None si se deja pasar."""
+        # B. Verificar estado de autenticación y ROL
+        user = self.storage()
+
+        # C. USUARIO LOGUEADO
+        if user.get('authenticated', False):
+            # Si intenta entrar al Login, Signup o Landing Page estando ya logueado
+            if path in LOGGED_IN_REDIRECT_PATHS:
+                # Redirección inteligente según rol (default 'client')
+                return '/admin' if user.get('role', 'client') == 'admin' else '/mainscreen'
+            return None
+
+        # D. VISITANTE (NO LOGUEADO)
+        if path == '/':
+            return '/MainPage'
+        if path in unrestricted_page_routes:
+            return None
+        # Redirigir al login guardando la intención
+        return f'/login?redirect_to={path}'
@@ -0,0 +1,112 @@
+import asyncio
+import time
+
+from fastapi import Request
+from fastapi.responses import RedirectResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from auth.middleware import AuthMiddleware, unrestricted_page_routes
+from auth.routes import CALENDAR_WEBHOOK_PATH
+
+# =====================================================
+# MICRO-BENCHMARK DEL MIDDLEWARE DE AUTENTICACIÓN
+# =====================================================
+# Mide el costo por petición del middleware (sin red ni NiceGUI): la app
+# interna responde 200 vacío y la sesión es un dict fijo. Compara:
+#   - sin middleware (piso)
+#   - BaseHTTPMiddleware (la versión anterior, copiada abajo)
+#   - AuthMiddleware ASGI (auth/middleware.py)
+#
+# Uso:  python -m auth.middleware_bench [peticiones_por_caso]
+
+VISITOR = {}
+STUDENT = {'authenticated': True, 'role': 'client'}
+
+CASES = [
+    ("asset /_nicegui", '/_nicegui/3.4.1/static/quasar.umd.prod.js', VISITOR),
+    ("media /uploads", '/uploads/material/clase1.pdf', VISITOR),
+    ("pagina alumno", '/mainscreen', STUDENT),
+    ("visitante -> login", '/mainscreen', VISITOR),
+]
+
+
+class LegacyAuthMiddleware(BaseHTTPMiddleware):
+    """La implementación anterior (main.py), con la sesión inyectada."""
+
+    def __init__(self, asgi_app, storage):
+        super().__init__(asgi_app)
+        self.storage = storage
+
+    async def dispatch(self, request: Request, call_next):
+        if (request.url.path.startswith('/_nicegui') or
+                request.url.path.startswith('/static') or
+                request.url.path.startswith('/components') or
+                request.url.path.startswith('/uploads') or
+                request.url.path == CALENDAR_WEBHOOK_PATH):
+            return await call_next(request)
+
+        authenticated = self.storage().get('authenticated', False)
+        role = self.storage().get('role', 'client')
+        path = request.url.path
+
+        if authenticated:
+            if path in {'/login', '/signup', '/MainPage', '/'}:
+                if role == 'admin':
+                    return RedirectResponse('/admin')
+                return RedirectResponse('/mainscreen')
+            return await call_next(request)
+        if path == '/':
+            return RedirectResponse('/MainPage')
+        if path in unrestricted_page_routes:
+            return await call_next(request)
+        return RedirectResponse(f'/login?redirect_to={path}')
+
+
+async def _ok_app(scope, receive, send):
+    await send({'type': 'http.response.start', 'status': 200, 'headers': [(b'content-length', b'0')]})
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+def _scope(path):
+    return {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': 'GET', 'scheme': 'http', 'server': ('127.0.0.1', 8080),
+        'client': ('127.0.0.1', 50000), 'root_path': '', 'path': path,
+        'raw_path': path.encode(), 'query_string': b'', 'headers': [(b'host', b'localhost')],
+    }
+
+
+async def _receive():
+    return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+
+async def _time_per_request(asgi_app, path, requests):
+    """Microsegundos promedio por petición y el status de la última respuesta."""
+    status = []
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    for _ in range(min(200, requests)):  # calentamiento
+        await asgi_app(_scope(path), _receive, send)
+    started = time.perf_counter()
+    for _ in range(requests):
+        await asgi_app(_scope(path), _receive, send)
+    return (time.perf_counter() - started) / requests * 1e6, status[-1]
+
+
+async def run(requests=20000):
+    print(f"{'caso':<20} {'sin mw':>9} {'BaseHTTP':>9} {'ASGI':>9}   (µs/petición, status)")
+    for label, path, session in CASES:
+        storage = lambda session=session: session  # noqa: E731
+        base_us, _ = await _time_per_request(_ok_app, path, requests)
+        legacy_us, legacy_status = await _time_per_request(LegacyAuthMiddleware(_ok_app, storage), path, requests)
+        asgi_us, asgi_status = await _time_per_request(AuthMiddleware(_ok_app, storage), path, requests)
+        assert legacy_status == asgi_status, (label, legacy_status, asgi_status)
+        print(f"{label:<20} {base_us:>9.1f} {legacy_us:>9.1f} {asgi_us:>9.1f}   ({asgi_status})")
+
+
+if __name__ == "__main__":
+    import sys
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 20000))
@@ -0,0 +1,335 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from passlib.hash import pbkdf2_sha256
+
+from db.executor import run_db
+from db.models import User
+from db.postgres_db import PostgresSession
+
+logger = logging.getLogger(__name__)
+
+# =====================================================
+# SERVICIO DE CONTRASEÑAS (HASH EN PROCESOS + LÍMITE DE INTENTOS)
+# =====================================================
+# pbkdf2_sha256 gasta cientos de ms de CPU por llamada. Hecho dentro de un
+# handler congela el loop de NiceGUI, y en un hilo tampoco alcanza (el GIL lo
+# sigue compartiendo con el loop). Por eso el hash y la verificación corren
+# en un ProcessPoolExecutor pequeño:
+#
+#     ok = await verify_password(clave, hash_guardado)
+#
+# Además:
+# - Al iniciar sesión, si el hash guardado usa parámetros viejos (menos
+#   rondas que PBKDF2_ROUNDS) se recalcula y se guarda sin que el usuario
+#   note nada.
+# - Cada intento (login / cambio de contraseña) consume un token del cubo
+#   del usuario y del cubo de la IP. Una ráfaga de intentos se corta aquí,
+#   antes de gastar CPU, y no degrada las páginas del resto.
+# - El pool se crea al arrancar (start_password_pool, primer hook de
+#   on_startup): los procesos se hacen fork antes de que existan los hilos
+#   del pool de BD, del outbox y del scheduler.
+# - La IP sale de X-Forwarded-For cuando hay proxies de confianza delante
+#   (Render): ver client_ip().
+
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", "2"))
+# 0 = el valor por defecto de passlib
+PBKDF2_ROUNDS = int(os.getenv("PBKDF2_ROUNDS", "0"))
+
+# Cubo por usuario: ráfaga de N intentos, luego 1 token cada X segundos
+LOGIN_USER_BURST = int(os.getenv("LOGIN_USER_BURST", "5"))
+LOGIN_USER_REFILL_SECONDS = float(os.getenv("LOGIN_USER_REFILL_SECONDS", "30"))
+# Cubo por IP: más holgado (varios alumnos pueden compartir red)
+LOGIN_IP_BURST = int(os.getenv("LOGIN_IP_BURST", "20"))
+LOGIN_IP_REFILL_SECONDS = float(os.getenv("LOGIN_IP_REFILL_SECONDS", "3"))
+# Proxies de confianza delante de la app (Render agrega uno). 0 = IP directa
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "1" if os.getenv("RENDER") else "0"))
+
+# min_desired_rounds: needs_update() marca los hashes con menos rondas
+_rounds = PBKDF2_ROUNDS or pbkdf2_sha256.default_rounds
+_hasher = pbkdf2_sha256.using(default_rounds=_rounds, min_desired_rounds=_rounds)
+
+
+# --- TRABAJO EN LOS PROCESOS (funciones de módulo: deben poder serializarse) ---
+def _hash_sync(password):
+    return _hasher.hash(password)
+
+
+def _verify_sync(password, password_hash):
+    """Retorna (ok, hash_nuevo). hash_nuevo solo si ok y el guardado está desactualizado."""
+    try:
+        if not _hasher.verify(password, password_hash):
+            return False, None
+    except (ValueError, TypeError):
+        # Hash vacío o con otro formato: no coincide
+        return False, None
+    if _hasher.needs_update(password_hash):
+        return True, _hasher.hash(password)
+    return True, None
+
+
+# --- POOL DE PROCESOS ---
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _mp_context():
+    # main.py ejecuta main() también como '__mp_main__': con 'spawn' (o
+    # 'forkserver') cada proceso hijo levantaría otra app. 'fork' solo copia
+    # el proceso; por eso se hace al arrancar, antes de que haya hilos.
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return None
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PASSWORD_WORKERS, mp_context=_mp_context())
+            logger.info(f"🔐 Pool de contraseñas iniciado ({PASSWORD_WORKERS} procesos).")
+        return _pool
+
+
+def _noop():
+    return None
+
+
+def start_password_pool():
+    """
+    Crea el pool y lanza sus procesos ya (se llama en on_startup, antes que
+    los demás hooks). Con 'fork' el primer submit crea todos los procesos.
+    """
+    pool = _get_pool()
+    pool.submit(_noop).result()
+
+
+def _reset_pool(broken):
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+async def _run_cpu(fn, *args):
+    """Ejecuta `fn` en el pool de procesos. Si un proceso murió, se recrea el pool una vez."""
+    loop = asyncio.get_running_loop()
+    pool = _get_pool()
+    try:
+        return await loop.run_in_executor(pool, fn, *args)
+    except BrokenProcessPool:
+        # Caso raro (un proceso murió): este fork sí ocurre con hilos vivos
+        logger.warning("⚠️ Pool de contraseñas roto, se recrea.")
+        _reset_pool(pool)
+        return await loop.run_in_executor(_get_pool(), fn, *args)
+
+
+def shutdown_password_pool():
+    """Cierra el pool de procesos (se llama al apagar la app)."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+        logger.info("Pool de contraseñas cerrado.")
+
+
+async def hash_password(password):
+    return await _run_cpu(_hash_sync, password)
+
+
+async def verify_password(password, password_hash):
+    """Retorna (ok, hash_nuevo) — ver _verify_sync."""
+    if not password_hash:
+        return False, None
+    return await _run_cpu(_verify_sync, password, password_hash)
+
+
+# =====================================================
+# LIMITADOR (TOKEN BUCKET)
+# =====================================================
+class TokenBucketLimiter:
+    """
+    Un cubo por clave con `burst` tokens que se recarga a 1 token cada
+    `refill_seconds`. Acotado a `maxsize` claves (se descarta la menos usada).
+    """
+
+    def __init__(self, burst, refill_seconds, maxsize=10000):
+        self.burst = burst
+        self.refill_seconds = refill_seconds
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()  # clave -> (tokens, actualizado_en)
+
+    def _tokens(self, key, now):
+        tokens, updated = self._buckets.get(key, (self.burst, now))
+        return min(self.burst, tokens + (now - updated) / self.refill_seconds)
+
+    def retry_after(self, key, now):
+        """Segundos hasta que `key` tenga un token (0 si ya lo tiene)."""
+        missing = 1 - self._tokens(key, now)
+        return max(0.0, missing * self.refill_seconds)
+
+    def consume(self, key, now):
+        self._buckets[key] = (self._tokens(key, now) - 1, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.maxsize:
+            self._buckets.popitem(last=False)
+
+
+def client_ip(client):
+    """
+    IP del visitante de un cliente de NiceGUI. Detrás de TRUSTED_PROXY_HOPS
+    proxies la IP real es la que agregó el más externo de ellos en
+    X-Forwarded-For (lo anterior lo puede escribir cualquiera).
+    """
+    request = getattr(client, 'request', None)
+    if request is None:
+        return None
+    if TRUSTED_PROXY_HOPS > 0:
+        forwarded = [ip.strip() for ip in request.headers.get('x-forwarded-for', '').split(',') if ip.strip()]
+        if forwarded:
+            return forwarded[-min(TRUSTED_PROXY_HOPS, len(forwarded))]
+    return request.client.host if request.client else None
+
+
+_user_limiter = TokenBucketLimiter(LOGIN_USER_BURST, LOGIN_USER_REFILL_SECONDS)
+_ip_limiter = TokenBucketLimiter(LOGIN_IP_BURST, LOGIN_IP_REFILL_SECONDS)
+
+
+def check_attempt(username, ip):
+    """
+    Consume un intento del usuario y de la IP (solo si ambos cubos tienen token).
+    Retorna 0 si se permite o los segundos a esperar. Se llama desde el loop.
+    """
+    now = time.monotonic()
+    checks = [(_user_limiter, (username or "").lower())]
+    if ip:
+        checks.append((_ip_limiter, ip))
+    wait = max(limiter.retry_after(key, now) for limiter, key in checks)
+    if wait > 0:
+        logger.warning(f"⚠️ Intentos limitados para '{username}' desde {ip} ({wait:.0f}s).")
+        return wait
+    for limiter, key in checks:
+        limiter.consume(key, now)
+    return 0
+
+
+# =====================================================
+# OPERACIONES DE CUENTA
+# =====================================================
+# Retornan {"success": bool, "error": código, ...}. Códigos de error:
+# "throttled" (con "retry_after"), "invalid", "not_found", "email",
+# "inactive", "server" (con "detail").
+
+def _load_user_sync(username):
+    session = PostgresSession()
+    try:
+        user = session.query(User).filter_by(username=username).first()
+        if user is None:
+            return None
+        return {
+            'username': user.username,
+            'password_hash': user.password_hash,
+            'role': user.role,
+            'name': user.name,
+            'surname': user.surname,
+            'email': getattr(user, 'email', ''),
+            'time_zone': getattr(user, 'time_zone', ''),
+            'status': getattr(user, 'status', 'Active'),
+        }
+    finally:
+        session.close()
+
+
+def _set_hash_sync(username, new_hash, expected_hash=None):
+    """
+    Guarda `new_hash`. Con `expected_hash` solo si el hash guardado sigue
+    siendo ése (un rehash no pisa un cambio de contraseña simultáneo).
+    Por PostgresSession: el outbox lo replica a SQLite.
+    """
+    session = PostgresSession()
+    try:
+        user = session.query(User).filter_by(username=username).first()
+        if user is None or (expected_hash is not None and user.password_hash != expected_hash):
+            return False
+        user.password_hash = new_hash
+        session.commit()
+        return True
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+async def authenticate(username, password, ip=None):
+    """Login. Si es correcto retorna también "user" (dict con los datos de la sesión)."""
+    wait = check_attempt(username, ip)
+    if wait:
+        return {"success": False, "error": "throttled", "retry_after": wait}
+    try:
+        user = await run_db(_load_user_sync, username)
+        ok, new_hash = await verify_password(password, user['password_hash'] if user else None)
+        if not ok:
+            return {"success": False, "error": "invalid"}
+        if user['status'] != 'Active':
+            return {"success": False, "error": "inactive"}
+        if new_hash:
+            try:
+                if await run_db(_set_hash_sync, username, new_hash, user['password_hash']):
+                    logger.info(f"🔐 Hash de '{username}' actualizado a los parámetros actuales.")
+            except Exception as e:
+                # El login no falla por esto; se reintenta en el próximo
+                logger.error(f"❌ No se pudo actualizar el hash de '{username}': {e}")
+        del user['password_hash']
+        return {"success": True, "user": user}
+    except Exception as e:
+        logger.error(f"❌ Error en login de '{username}': {e}")
+        return {"success": False, "error": "server", "detail": str(e)}
+
+
+async def change_password(username, old_password, new_password, ip=None):
+    """Cambio con la contraseña actual (pantalla /reset)."""
+    wait = check_attempt(username, ip)
+    if wait:
+        return {"success": False, "error": "throttled", "retry_after": wait}
+    try:
+        user = await run_db(_load_user_sync, username)
+        if user is None:
+            return {"success": False, "error": "not_found"}
+        ok, _ = await verify_password(old_password, user['password_hash'])
+        if not ok:
+            return {"success": False, "error": "invalid"}
+        new_hash = await hash_password(new_password)
+        await run_db(_set_hash_sync, username, new_hash)
+        return {"success": True}
+    except Exception as e:
+        logger.error(f"❌ Error cambiando contraseña de '{username}': {e}")
+        return {"success": False, "error": "server", "detail": str(e)}
+
+
+async def reset_password(username, email, new_password, ip=None):
+    """Cambio validando usuario + email (pantalla /resetpass)."""
+    wait = check_attempt(username, ip)
+    if wait:
+        return {"success": False, "error": "throttled", "retry_after": wait}
+    try:
+        user = await run_db(_load_user_sync, username)
+        if user is None:
+            return {"success": False, "error": "not_found"}
+        if not user['email'] or email.lower() != user['email'].lower():
+            return {"success": False, "error": "email"}
+        new_hash = await hash_password(new_password)
+        await run_db(_set_hash_sync, username, new_hash)
+        return {"success": True}
+    except Exception as e:
+        logger.error(f"❌ Error restableciendo contraseña de '{username}': {e}")
+        return {"success": False, "error": "server", "detail": str(e)}
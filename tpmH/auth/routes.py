@@ -0,0 +1,8 @@
+# =====================================================
+# RUTAS HTTP FIJAS (SIN DEPENDENCIAS)
+# =====================================================
+# Constantes que comparten el middleware y los endpoints. Este módulo no
+# importa nada: el middleware (y su benchmark) lo usan sin arrastrar la BD.
+
+# Webhook de notificaciones push de Google Calendar (auth/calendar_webhook.py)
+CALENDAR_WEBHOOK_PATH = '/calendar/notifications'
@@ -1,156 +1,162 @@
-from db.sqlite_db import SQLiteSession
-from db.postgres_db import PostgresSession
-from db.models import User, SchedulePref, AsignedClasses, ScheduleProf, ScheduleProfEsp
-from nicegui import ui
+import json
 import logging
+import time
+
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from db.sqlite_db import sqlite_engine
+from db.postgres_db import PostgresEngine
+from db.models import User, SchedulePref, AsignedClasses, ScheduleProf, ScheduleProfEsp
+from db.class_times import prof_bounds
+from components.availability import invalidate_all
+from components.query_cache import invalidate_class_queries
 
 logger = logging.getLogger(__name__)
 
-def sync_sqlite_to_postgres():
-    sqlite_sess = SQLiteSession()
-    pg_sess = PostgresSession()
+# =====================================================
+# RECONCILIACIÓN SQLITE -> POSTGRES (INSERTA LO QUE FALTA)
+# =====================================================
+# Antes se hacía un query(...).filter_by(...).first() a Neon por cada fila
+# de SQLite. Ahora, por tabla:
+# 1. Se leen las filas de SQLite y las claves que YA están en Neon (una consulta).
+# 2. Se insertan las que faltan con INSERT ... ON CONFLICT DO NOTHING, por lotes.
+#
+# Se escribe con una conexión Core (no PostgresSession): son filas que vienen
+# del respaldo y no deben volver a replicarse hacia SQLite (db/replication.py).
+# Por lo mismo, las cachés se invalidan a mano al terminar.
+#
+# Uso sin interfaz:  python -m auth.sync
 
-    try:
-        total_users = 0
-        total_rangos = 0
-        total_clases = 0
-        total_hgen = 0
-        total_hesp = 0
-
-        # -----------------------------
-        # SYNC USERS
-        # -----------------------------
-        sqlite_users = sqlite_sess.query(User).all()
-        for u in sqlite_users:
-            if not pg_sess.query(User).filter_by(email=u.email).first():
-                pg_sess.add(User(
-                    username=u.username,
-                    name=u.name,
-                    surname=u.surname,
-                    email=u.email,
-                    role=u.role,
-                    time_zone=u.time_zone,
-                    password_hash=u.password_hash
-                ))
-                total_users += 1
-
-        # -----------------------------
-        # SYNC RANGOS_HORARIOS
-        # -----------------------------
-        sqlite_rangos = sqlite_sess.query(SchedulePref).all()
-        for r in sqlite_rangos:
-            exists = pg_sess.query(SchedulePref).filter_by(
-                username=r.username,
-                start_time=r.start_time,
-                end_time=r.end_time
-            ).first()
-
-            if not exists:
-                pg_sess.add(SchedulePref(
-                    username=r.username,
-                    name=r.name,
-                    surname=r.surname,
-                    duration=r.duration,
-                    days=r.days,
-                    start_time=r.start_time,
-                    end_time=r.end_time,
-                    package=r.package
-                ))
-                total_rangos += 1
-
-        # -----------------------------
-        # SYNC CLASES_ASIGNADAS
-        # -----------------------------
-        sqlite_clases = sqlite_sess.query(AsignedClasses).all()
-        for c in sqlite_clases:
-            exists = pg_sess.query(AsignedClasses).filter_by(
-                username=c.username,
-                date=c.date,
-                start_time=c.start_time
-            ).first()
-
-            if not exists:
-                pg_sess.add(AsignedClasses(
-                    username=c.username,
-                    name=c.name,
-                    surname=c.surname,
-                    date=c.date,
-                    duration=c.duration,
-                    days=c.days,
-                    start_time=c.start_time,
-                    end_time=c.end_time,
-                    package=c.package
-                ))
-                total_clases += 1
-        
-        # -----------------------------
-        # SYNC HORARIO_PROF
-        # -----------------------------
-        sqlite_clases = sqlite_sess.query(ScheduleProf).all()
-        for d in sqlite_clases:
-            exists = pg_sess.query(ScheduleProf).filter_by(
-                username=d.username,
-                start_time=d.start_time,
-                end_time=d.end_time
-            ).first()
-
-            if not exists:
-                pg_sess.add(ScheduleProf(
-                    username=d.username,
-                    name=d.name,
-                    surname=d.surname,
-                    days=d.days,
-                    start_time=d.start_time,
-                    end_time=d.end_time,
-                    availability=d.availability
-                ))
-                total_hgen += 1
-        
-         # -----------------------------
-        # SYNC HORARIO_PROF
-        # -----------------------------
-        sqlite_clases = sqlite_sess.query(ScheduleProfEsp).all()
-        for g in sqlite_clases:
-            exists = pg_sess.query(ScheduleProfEsp).filter_by(
-                username=g.username,
-                start_time=g.start_time,
-                end_time=g.end_time
-            ).first()
-
-            if not exists:
-                pg_sess.add(ScheduleProfEsp(
-                    username=g.username,
-                    name=g.name,
-                    surname=g.surname,
-                    date= g.date,
-                    days=g.days,
-                    start_time=g.start_time,
-                    end_time=g.end_time,
-                    avai=g.avai
-                ))
-                total_hesp += 1
-
-        # COMMIT FINAL
-        pg_sess.commit()
-
-        # -----------------------------
-        # NOTIFICACIONES
-        # -----------------------------
-        msg = (
-            f"Sincronización completa:\n"
-            f"• {total_users} usuarios\n"
-            f"• {total_rangos} rangos horarios\n"
-            f"• {total_clases} clases asignadas\n"
-            f"• {total_hesp} horarios especificos\n"
-            f"• {total_hgen} horarios generales"
+SYNC_BATCH_SIZE = 500
+
+
+def _dialect_insert(conn):
+    return postgresql.insert if conn.dialect.name == "postgresql" else sqlite.insert
+
+
+def _read_rows(model, columns):
+    """Filas de SQLite como dicts con `columns`."""
+    table = model.__table__
+    with sqlite_engine.connect() as conn:
+        return [dict(r._mapping) for r in conn.execute(select(*[table.c[c] for c in columns]))]
+
+
+def _existing_keys(conn, model, key):
+    """Claves (tuplas) que ya existen en Neon, con una sola consulta."""
+    table = model.__table__
+    return set(conn.execute(select(*[table.c[c] for c in key])).tuples())
+
+
+def _missing_rows(rows, existing, key):
+    """Filas cuya clave no está en `existing` (tampoco repetidas dentro de `rows`)."""
+    seen = set(existing)
+    missing = []
+    for row in rows:
+        k = tuple(row[c] for c in key)
+        if k in seen:
+            continue
+        seen.add(k)
+        missing.append(row)
+    return missing
+
+
+def _insert_batches(conn, model, rows, on_conflict=None):
+    """
+    INSERT por lotes de SYNC_BATCH_SIZE filas. `on_conflict(stmt)` permite
+    agregar ON CONFLICT DO NOTHING / DO UPDATE. Retorna cuántas filas se escribieron.
+    """
+    written = 0
+    for i in range(0, len(rows), SYNC_BATCH_SIZE):
+        stmt = _dialect_insert(conn)(model.__table__).values(rows[i:i + SYNC_BATCH_SIZE])
+        if on_conflict is not None:
+            stmt = on_conflict(stmt)
+        written += conn.execute(stmt).rowcount
+    return written
+
+
+def _with_class_bounds(rows):
+    """Las inserciones Core no pasan por el evento de db/class_times.py: start_at/end_at a mano."""
+    for row in rows:
+        row["start_at"], row["end_at"] = prof_bounds(
+            row.get("date_prof") or row["date"],
+            row.get("start_prof_time") if row.get("start_prof_time") is not None else row["start_time"],
+            row.get("end_prof_time") if row.get("end_prof_time") is not None else row["end_time"],
+            row.get("duration"),
         )
-        ui.notify(msg, type="positive")
+    return rows
+
+
+def _timed(stats, name, fn, *args):
+    started = time.monotonic()
+    count = fn(*args)
+    stats[name] = {"rows": count, "seconds": round(time.monotonic() - started, 3)}
+    return count
+
+
+def _insert_missing(conn, model, columns, key):
+    rows = _read_rows(model, columns)
+    missing = _missing_rows(rows, _existing_keys(conn, model, key), key)
+    if model is AsignedClasses:
+        _with_class_bounds(missing)
+    return _insert_batches(conn, model, missing, lambda stmt: stmt.on_conflict_do_nothing())
+
+
+def _sync_users(conn):
+    # email y username son únicos en Neon: ON CONFLICT DO NOTHING cubre ambos
+    rows = _read_rows(User, ["username", "name", "surname", "email", "role", "time_zone", "password_hash"])
+    missing = _missing_rows(rows, _existing_keys(conn, User, ["email"]), ["email"])
+    return _insert_batches(conn, User, missing, lambda stmt: stmt.on_conflict_do_nothing())
+
+
+def _format_msg(stats, labels):
+    lines = [f"• {stats[name]['rows']} {label} ({stats[name]['seconds']}s)" for name, label in labels]
+    return "Sincronización completa:\n" + "\n".join(lines)
+
+
+def sync_sqlite_to_postgres():
+    """
+    Inserta en Neon lo que está en SQLite y falta allá. Todo en una transacción.
+    Retorna {"success", "stats": {tabla: {"rows", "seconds"}}, "msg"} o {"success": False, "error"}.
+    """
+    stats = {}
+    try:
+        with PostgresEngine.begin() as conn:
+            _timed(stats, "users", _sync_users, conn)
+            _timed(stats, "rangos_horarios", _insert_missing, conn, SchedulePref,
+                   ["username", "name", "surname", "duration", "days", "start_time", "end_time", "package"],
+                   ["username", "start_time", "end_time"])
+            _timed(stats, "clases_asignadas", _insert_missing, conn, AsignedClasses,
+                   ["username", "name", "surname", "date", "duration", "days", "start_time", "end_time", "package"],
+                   ["username", "date", "start_time"])
+            _timed(stats, "horario_prof", _insert_missing, conn, ScheduleProf,
+                   ["username", "name", "surname", "days", "start_time", "end_time", "availability"],
+                   ["username", "start_time", "end_time"])
+            _timed(stats, "horario_prof_esp", _insert_missing, conn, ScheduleProfEsp,
+                   ["username", "name", "surname", "date", "days", "start_time", "end_time", "avai"],
+                   ["username", "start_time", "end_time"])
+
+        # Conexión Core: el hook de commit de PostgresSession no lo ve
+        if stats["clases_asignadas"]["rows"] or stats["users"]["rows"]:
+            invalidate_class_queries()
+        if stats["clases_asignadas"]["rows"] or stats["horario_prof"]["rows"] or stats["horario_prof_esp"]["rows"]:
+            invalidate_all()
+
+        msg = _format_msg(stats, [
+            ("users", "usuarios"),
+            ("rangos_horarios", "rangos horarios"),
+            ("clases_asignadas", "clases asignadas"),
+            ("horario_prof_esp", "horarios especificos"),
+            ("horario_prof", "horarios generales"),
+        ])
         logger.info(msg)
+        return {"success": True, "stats": stats, "msg": msg}
 
     except Exception as ex:
-        ui.notify(f"Error sincronizando datos: {ex}", type="negative")
         logger.exception(ex)
+        return {"success": False, "error": str(ex)}
+
 
-    finally:
-        sqlite_sess.close()
-        pg_sess.close()
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(sync_sqlite_to_postgres(), indent=2, ensure_ascii=False))
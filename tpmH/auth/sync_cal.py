@@ -1,16 +1,17 @@
-import os
-import json
 import logging
+import os
 import random
 from datetime import datetime, timedelta, timezone
 from zoneinfo import ZoneInfo
 from dateutil import parser
+from sqlalchemy import or_
 from dotenv import load_dotenv
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 
-from db.models import AsignedClasses
+from auth.calendar_client import calendar_service, CalendarAuthError
+from db.models import AsignedClasses, CalendarSyncState, CalendarEvent
 from db.postgres_db import PostgresSession
+from db.class_times import class_bounds, get_prof_timezone
 
 # --- CONFIGURACIÓN DE LOGS ---
 logging.basicConfig(
@@ -22,141 +23,371 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-def sync_google_calendar_logic(teacher_email):
+
+# =====================================================
+# SINCRONIZACIÓN INCREMENTAL (syncToken + copia local)
+# =====================================================
+# La primera vez (o si Google responde 410) se descargan todos los eventos
+# desde hoy; Google devuelve un nextSyncToken que se guarda en
+# calendar_sync_state. Las siguientes veces se pide solo lo que cambió desde
+# ese token. Los eventos quedan en calendar_events (con su etag), así las
+# fases A/B trabajan con la copia local en vez de re-descargar el calendario.
+#
+# En modo incremental las fases solo miran lo que cambió:
+# - Fase A: los eventos nuevos/modificados/cancelados que trajo el syncToken;
+#   sus clases se buscan por calendar_event_id (o por firma si no tienen vínculo).
+# - Fase B: las clases sin evento o modificadas desde el último sync
+#   (updated_at, con un margen para transacciones que confirmaron tarde).
+# La sync completa (primera vez, 410 o cada CALENDAR_FULL_SYNC_INTERVAL_SECONDS)
+# vuelve a revisar todo desde hoy, como chequeo de consistencia.
+
+CALENDAR_FULL_SYNC_INTERVAL_SECONDS = int(os.getenv("CALENDAR_FULL_SYNC_INTERVAL_SECONDS", "86400"))
+CALENDAR_LOCAL_CHANGES_MARGIN_SECONDS = int(os.getenv("CALENDAR_LOCAL_CHANGES_MARGIN_SECONDS", "900"))
+
+class SyncTokenExpired(Exception):
+    """Google invalidó el syncToken (HTTP 410): hay que hacer sync completa."""
+
+
+def _list_events(service, calendar_id, sync_token=None, time_min=None):
+    """Descarga todas las páginas de events().list. Retorna (eventos, nextSyncToken)."""
+    params = {"calendarId": calendar_id, "singleEvents": True, "maxResults": 2500}
+    if sync_token:
+        params["syncToken"] = sync_token
+    else:
+        params["timeMin"] = time_min
+
+    items = []
+    page_token = None
+    while True:
+        try:
+            result = service.events().list(pageToken=page_token, **params).execute()
+        except HttpError as e:
+            if sync_token and getattr(e.resp, "status", None) == 410:
+                raise SyncTokenExpired() from e
+            raise
+        items.extend(result.get("items", []))
+        page_token = result.get("nextPageToken")
+        if not page_token:
+            return items, result.get("nextSyncToken")
+
+
+def _link_class(cls, event_row):
+    """Guarda en la clase el id/etag de su evento de Calendar."""
+    cls.calendar_event_id = event_row.event_id
+    cls.calendar_etag = event_row.etag
+    cls.calendar_updated = event_row.updated
+
+
+def _store_event(session, calendar_id, event, local_tz, row=None):
+    """Crea/actualiza la fila de calendar_events de un evento de Google."""
+    if row is None:
+        row = session.get(CalendarEvent, (calendar_id, event["id"]))
+    if row is None:
+        row = CalendarEvent(calendar_id=calendar_id, event_id=event["id"])
+        session.add(row)
+    row.etag = event.get("etag")
+    row.summary = event.get("summary", "Sin Nombre")
+    row.start_local = parser.parse(event["start"]["dateTime"]).astimezone(local_tz).strftime("%Y-%m-%dT%H:%M:%S")
+    row.end_local = parser.parse(event["end"]["dateTime"]).astimezone(local_tz).strftime("%Y-%m-%dT%H:%M:%S")
+    row.updated = event.get("updated")
+    return row
+
+
+def _apply_event_changes(session, calendar_id, events, today_start_iso, full, local_tz):
+    """
+    Vuelca los eventos recibidos a calendar_events. Los cancelados se borran,
+    los de etag igual se saltan. En modo completo se borra además lo que
+    Google ya no devolvió. Retorna (ids de los eventos nuevos o que cambiaron,
+    ids de los cancelados/desaparecidos).
+    """
+    ids = [e["id"] for e in events if e.get("id")]
+    stored = {}
+    for i in range(0, len(ids), 500):
+        chunk = ids[i:i + 500]
+        for row in session.query(CalendarEvent).filter(
+            CalendarEvent.calendar_id == calendar_id, CalendarEvent.event_id.in_(chunk)
+        ):
+            stored[row.event_id] = row
+
+    changed = set()
+    removed = set()
+    for event in events:
+        row = stored.get(event.get("id"))
+        start_raw = event.get("start", {}).get("dateTime")
+        # Cancelados y eventos de día completo no ocupan horario
+        if event.get("status") == "cancelled" or not start_raw:
+            if row is not None:
+                session.delete(row)
+            if event.get("id"):
+                removed.add(event["id"])
+            continue
+        if row is not None and row.etag == event.get("etag"):
+            continue
+        try:
+            _store_event(session, calendar_id, event, local_tz, row)
+            changed.add(event["id"])
+        except Exception as e:
+            logger.error(f"  ❌ Evento de Google ilegible '{event.get('summary')}': {e}")
+
+    session.flush()
+    if full:
+        seen = set(ids)
+        for row in session.query(CalendarEvent).filter(CalendarEvent.calendar_id == calendar_id):
+            if row.event_id not in seen:
+                session.delete(row)
+                removed.add(row.event_id)
+    # Lo anterior a hoy ya no se compara con nada
+    session.query(CalendarEvent).filter(
+        CalendarEvent.calendar_id == calendar_id,
+        CalendarEvent.start_local < today_start_iso
+    ).delete(synchronize_session=False)
+    return changed, removed
+
+
+def _as_utc(value):
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _query_in(query, column, values, chunk=500):
+    """query.filter(column IN values) por bloques; lista vacía si no hay valores."""
+    values = list(values)
+    rows = []
+    for i in range(0, len(values), chunk):
+        rows.extend(query.filter(column.in_(values[i:i + chunk])).all())
+    return rows
+
+
+def _is_preply(cls):
+    """Clases de Preply: las maneja Preply en Google, Calendar manda sobre la BD."""
+    full_name = f"{cls.name} {cls.surname}".lower()
+    return cls.package == "Preply" or "- preply lesson" in full_name
+
+
+def _preply_times(dt_start, dt_end):
+    """(fecha, día, inicio HHMM, fin HHMM, duración) de una clase Preply a partir de su evento."""
+    raw_end_int = int(dt_end.strftime("%H%M"))
+    if dt_end.minute >= 45:
+        next_h = dt_end + timedelta(hours=1)
+        end_int = int(next_h.replace(minute=0).strftime("%H%M"))
+    else:
+        end_int = raw_end_int
+
+    duration_minutes = float((dt_end - dt_start).total_seconds() / 60)
+    if 20 <= duration_minutes <= 40: str_duration = "30"
+    elif 45 <= duration_minutes <= 60: str_duration = "50"
+    else: str_duration = str(int(duration_minutes))
+
+    day_name = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"][dt_start.weekday()]
+    return dt_start.strftime("%Y-%m-%d"), day_name, int(dt_start.strftime("%H%M")), end_int, str_duration
+
+
+# Google acepta hasta 50 llamadas por petición batch de Calendar
+CALENDAR_BATCH_LIMIT = 50
+
+
+def _execute_batched(service, calls):
+    """
+    Envía `calls` [(clave, petición)] por el endpoint batch de Google, en
+    grupos de CALENDAR_BATCH_LIMIT. Retorna {clave: (respuesta, error)}.
+    """
+    results = {}
+    for i in range(0, len(calls), CALENDAR_BATCH_LIMIT):
+        chunk = calls[i:i + CALENDAR_BATCH_LIMIT]
+        keys = {str(n): key for n, (key, _) in enumerate(chunk)}
+
+        def callback(request_id, response, exception, keys=keys):
+            results[keys[request_id]] = (response, exception)
+
+        batch = service.new_batch_http_request(callback=callback)
+        for n, (_, request) in enumerate(chunk):
+            batch.add(request, request_id=str(n))
+        try:
+            batch.execute()
+        except Exception as e:
+            # Falló la petición batch completa: todas las del grupo quedan con error
+            for key in keys.values():
+                results.setdefault(key, (None, e))
+    return results
+
+
+def sync_google_calendar_logic(teacher_email, full_resync=False):
     """
     Sincronización Híbrida:
     
     FASE A (Google -> BD):
     1. Si el evento de Google YA existe en BD -> No hace nada (está sync).
+       Se reconoce por calendar_event_id; las clases viejas sin id se
+       reconocen por firma (nombre, fecha, hora) y quedan vinculadas.
     2. Si el evento NO existe en BD:
        - Si es "Preply": SE AGREGA A LA BD (Se asume clase nueva legítima).
        - Si NO es Preply: SE IGNORA (Se asume basura/fantasma).
          * (Código comentado incluido para borrarlo de Google si se desea).
+    3. Las clases Preply las maneja Google: si su evento vinculado cambió
+       (etag) se copia la fecha/hora nueva, y si se canceló la clase pasa a
+       'Cancelada' (libera el horario).
          
     FASE B (BD -> Google):
     1. Si está en BD y no en Google -> Se sube a Google.
+    2. Si está vinculada y cambió (nombre/hora) -> events().patch del mismo evento.
+
+    De Google solo se descargan los cambios desde el último sync (syncToken);
+    las fases trabajan sobre la copia local calendar_events y, en incremental,
+    solo con los eventos y clases que cambiaron.
+    `full_resync=True` fuerza la descarga completa.
     """
+    try:
+        with calendar_service() as service:
+            return _sync_with_service(service, teacher_email, full_resync)
+    except CalendarAuthError as e:
+        logger.error(f"❌ Error crítico en autenticación: {e}")
+        raise e
+
+
+def _sync_with_service(service, teacher_email, full_resync):
     logger.info("==================================================")
     logger.info("🚀 INICIANDO SYNC (LÓGICA HÍBRIDA PREPLY/DB)")
     logger.info("==================================================")
     
-    LOCAL_TZ = ZoneInfo("America/Caracas")
+    LOCAL_TZ = ZoneInfo(get_prof_timezone())
 
-    # --- 1. CONFIGURACIÓN DE CREDENCIALES ---
-    creds = None
-    SCOPES = ['https://www.googleapis.com/auth/calendar']
-    
-    try:
-        json_creds_env = os.getenv('GOOGLE_CREDENTIALS_JSON')
-        if json_creds_env:
-            creds_dict = json.loads(json_creds_env)
-            creds = service_account.Credentials.from_service_account_info(creds_dict, scopes=SCOPES)
-        elif os.path.exists('credentials.json'):
-            creds = service_account.Credentials.from_service_account_file('credentials.json', scopes=SCOPES)
-        else:
-            raise Exception("ERROR: No se encontraron credenciales")
-
-        service = build('calendar', 'v3', credentials=creds)
-        logger.info("📡 Conexión con Google Calendar establecida.")
-
-    except Exception as e:
-        logger.error(f"❌ Error crítico en autenticación: {e}")
-        raise e
-    
     session = PostgresSession()
-    
-    # =========================================================================
-    # 2. PREPARACIÓN DE SNAPSHOTS (MEMORIA)
-    # =========================================================================
-    
-    db_signatures = set()
-    
-    try:
-        # Cargamos TODO lo que está activo en la BD
-        all_db_classes = session.query(AsignedClasses).filter(
-            AsignedClasses.status.notin_(['Cancelada', 'Cancelled'])
-        ).all()
-        
-        logger.info("--- 📸 CARGANDO SNAPSHOT DB ---")
-        for c in all_db_classes:
-            d_ref = c.date_prof if c.date_prof else c.date
-            n_ref = c.name.strip().lower() if c.name else ""
-            s_ref = c.surname.strip().lower() if c.surname else ""
-            
-            if d_ref and c.start_prof_time is not None:
-                # FIRMA LOCAL: (nombre, apellido, fecha YYYY-MM-DD, inicio HHMM)
-                signature = (n_ref, s_ref, d_ref, int(c.start_prof_time))
-                db_signatures.add(signature)
-                
-        logger.info(f"💾 Snapshot BD cargado: {len(db_signatures)} clases existentes.")
-        
-    except Exception as e:
-        logger.error(f"⚠️ Error cargando snapshot de BD: {e}")
 
-    # --- 3. OBTENER EVENTOS DE GOOGLE ---
-    
+    # --- 2. OBTENER CAMBIOS DE GOOGLE (INCREMENTAL CON syncToken) ---
     now_local = datetime.now(LOCAL_TZ)
     start_of_day_local = now_local.replace(hour=0, minute=0, second=0, microsecond=0)
-    start_of_day_utc = start_of_day_local.astimezone(timezone.utc)
-    time_min_iso = start_of_day_utc.isoformat().replace("+00:00", "Z")
-    
-    google_events = []
-    page_token = None
-    
+    today_start_iso = start_of_day_local.strftime("%Y-%m-%dT%H:%M:%S")
+
     try:
-        logger.info(f"📥 Solicitando eventos a Google desde {time_min_iso}...")
-        while True:
-            events_result = service.events().list(
-                calendarId=teacher_email, 
-                timeMin=time_min_iso,
-                maxResults=2500,
-                singleEvents=True,
-                orderBy='startTime',
-                pageToken=page_token
-            ).execute()
-            items = events_result.get('items', [])
-            google_events.extend(items)
-            page_token = events_result.get('nextPageToken')
-            if not page_token:
-                break
-        logger.info(f"📥 Total eventos descargados de Google: {len(google_events)}")
+        state = session.get(CalendarSyncState, teacher_email)
+        if state is None:
+            state = CalendarSyncState(calendar_id=teacher_email)
+            session.add(state)
+
+        google_events = None
+        # Marca del sync anterior: la Fase B busca clases modificadas desde ahí
+        previous_sync = _as_utc(state.last_sync)
+        last_full_sync = _as_utc(state.last_full_sync)
+        full = (full_resync or not state.sync_token or previous_sync is None or last_full_sync is None
+                or datetime.now(timezone.utc) - last_full_sync > timedelta(seconds=CALENDAR_FULL_SYNC_INTERVAL_SECONDS))
+        if not full:
+            try:
+                logger.info("📥 Solicitando a Google solo los cambios (syncToken)...")
+                google_events, next_token = _list_events(service, teacher_email, sync_token=state.sync_token)
+            except SyncTokenExpired:
+                logger.warning("⚠️ syncToken vencido (410). Se hace sincronización completa.")
+                full = True
+        if full:
+            time_min_iso = start_of_day_local.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
+            logger.info(f"📥 Solicitando eventos a Google desde {time_min_iso} (completa)...")
+            google_events, next_token = _list_events(service, teacher_email, time_min=time_min_iso)
+        logger.info(f"📥 Eventos recibidos de Google: {len(google_events)}")
+
+        changed_event_ids, removed_event_ids = _apply_event_changes(
+            session, teacher_email, google_events, today_start_iso, full, LOCAL_TZ
+        )
+        changed = len(changed_event_ids)
+        logger.info(f"💾 Copia local de Calendar actualizada: {changed} eventos nuevos/modificados.")
 
     except Exception as e:
+        session.rollback()
         session.close()
         raise Exception(f"Error conectando al calendario: {e}")
-    
+
     count_ignored = 0
     count_preply_added = 0
     count_uploaded_google = 0
     count_deleted= 0
+    count_patched = 0
+    count_preply_moved = 0
+    count_preply_cancelled = 0
+    errors = []
     header_msg = "📅 Clase gestionada por Tuprofemaria"
     
-    google_signatures = set()
 
     try:
+        # =========================================================================
+        # 3. PREPARACIÓN: SOLO LO QUE CAMBIÓ
+        # =========================================================================
+        # Solo clases desde hoy: los eventos de Google también son desde hoy.
+        today_str = now_local.strftime("%Y-%m-%d")
+        active_filter = (
+            AsignedClasses.date_prof >= today_str,
+            AsignedClasses.status.notin_(['Cancelada', 'Cancelled'])
+        )
+
+        # Eventos a revisar: en incremental, los que trajo el syncToken; en completa, todos
+        event_query = session.query(CalendarEvent).filter(
+            CalendarEvent.calendar_id == teacher_email,
+            CalendarEvent.start_local >= today_start_iso
+        )
+        if full:
+            calendar_events = event_query.all()
+        else:
+            calendar_events = _query_in(event_query, CalendarEvent.event_id, changed_event_ids)
+        events_by_id = {e.event_id: e for e in calendar_events}
+
+        # Clases vinculadas a esos eventos (y a los cancelados en Google)
+        classes_by_event = {
+            c.calendar_event_id: c
+            for c in _query_in(session.query(AsignedClasses).filter(*active_filter),
+                               AsignedClasses.calendar_event_id, set(events_by_id) | set(removed_event_ids))
+        }
+
+        # Firmas (nombre, apellido, fecha, inicio) de las clases que podrían ser de un
+        # evento sin vínculo: solo las fechas de esos eventos
+        unlinked_dates = {e.start_local[:10] for e in calendar_events if e.event_id not in classes_by_event}
+        db_signatures = {}
+        for c in _query_in(session.query(AsignedClasses).filter(*active_filter),
+                           AsignedClasses.date_prof, unlinked_dates):
+            n_ref = c.name.strip().lower() if c.name else ""
+            s_ref = c.surname.strip().lower() if c.surname else ""
+            if c.start_prof_time is not None:
+                db_signatures.setdefault((n_ref, s_ref, c.date_prof, int(c.start_prof_time)), c)
+        logger.info(f"💾 Fase A: {len(calendar_events)} eventos a revisar ({len(classes_by_event)} con clase vinculada).")
+
         # =========================================================================
         # FASE A: PROCESAMIENTO GOOGLE (FILTRO + EXCEPCIÓN PREPLY)
         # =========================================================================
         logger.info("--- 🔽 FASE A: ANALIZANDO EVENTOS DE GOOGLE ---")
+        ghost_deletes = []
 
-        for event in google_events:
-            event_id = event.get('id')
-            summary = event.get('summary', 'Sin Nombre')
-            start_raw = event['start'].get('dateTime')
-            end_raw = event['end'].get('dateTime')
-            status = event.get('status') 
-            
-            if status == 'cancelled': continue
-            if not start_raw: continue 
+        # Preply cancelada/borrada en Google -> se cancela en la BD (libera el horario)
+        for event_id in removed_event_ids:
+            cls = classes_by_event.get(event_id)
+            if cls is None or not _is_preply(cls):
+                continue
+            logger.info(f"🚫 [PREPLY CANCELADA EN GOOGLE] {cls.name} {cls.surname} {cls.date_prof}")
+            cls.status = "Cancelada"
+            del classes_by_event[event_id]
+            count_preply_cancelled += 1
+
+        for event in calendar_events:
+            event_id = event.event_id
+            summary = event.summary or 'Sin Nombre'
             
             try:
-                dt_start_gcal = parser.parse(start_raw).astimezone(LOCAL_TZ)
-                dt_end_gcal = parser.parse(end_raw).astimezone(LOCAL_TZ)
+                dt_start_gcal = datetime.fromisoformat(event.start_local).replace(tzinfo=LOCAL_TZ)
+                dt_end_gcal = datetime.fromisoformat(event.end_local).replace(tzinfo=LOCAL_TZ)
                 
-                # Firma para evitar re-subida en Fase B
-                g_summ_norm = summary.strip().lower()
-                g_start_iso_clean = dt_start_gcal.strftime("%Y-%m-%dT%H:%M:%S")
-                google_signatures.add((g_summ_norm, g_start_iso_clean))
+                # CASO 0: evento vinculado por id a una clase activa -> está sync
+                # (si la clase cambió de hora/nombre, la Fase B hace el patch)
+                linked_class = classes_by_event.get(event_id)
+                if linked_class is not None:
+                    # Excepto Preply: la mueve Preply en Google, se trae el horario nuevo
+                    if _is_preply(linked_class) and linked_class.calendar_etag != event.etag:
+                        date_str, day_name, start_int, end_int, str_duration = _preply_times(dt_start_gcal, dt_end_gcal)
+                        if (linked_class.date_prof, linked_class.start_prof_time, linked_class.end_prof_time) != (date_str, start_int, end_int):
+                            logger.info(f"✏️ [PREPLY MOVIDA EN GOOGLE] {summary}: {linked_class.date_prof} {linked_class.start_prof_time} -> {date_str} {start_int}")
+                            linked_class.date = linked_class.date_prof = date_str
+                            linked_class.days = day_name
+                            linked_class.start_time = linked_class.start_prof_time = start_int
+                            linked_class.end_time = linked_class.end_prof_time = end_int
+                            linked_class.duration = str_duration
+                            count_preply_moved += 1
+                        _link_class(linked_class, event)
+                    continue
                 
                 # Datos para comparación
                 date_str = dt_start_gcal.strftime("%Y-%m-%d")
@@ -173,9 +404,14 @@ def sync_google_calendar_logic(teacher_email):
                 
                 # === LÓGICA PRINCIPAL DE FASE A ===
                 
-                if candidate_sig in db_signatures:
-                    # CASO 1: YA EXISTE EN BD -> Todo correcto, no hacemos nada.
+                match = db_signatures.get(candidate_sig)
+                if match is not None and (match.calendar_event_id is None
+                                          or session.get(CalendarEvent, (teacher_email, match.calendar_event_id)) is None):
+                    # CASO 1: YA EXISTE EN BD (sin vínculo) -> la vinculamos a este evento.
+                    _link_class(match, event)
+                    classes_by_event[event_id] = match
                     continue
+                # (Si la clase ya está vinculada a OTRO evento vivo, este es un duplicado)
 
                 # CASO 2: NO EXISTE EN BD (Es un intruso o una clase nueva externa)
                 
@@ -184,17 +420,7 @@ def sync_google_calendar_logic(teacher_email):
                     logger.info(f"🆕 [PREPLY DETECTADO] Agregando a BD: {summary}")
                     
                     # --- Lógica de Inserción ---
-                    raw_end_int = int(dt_end_gcal.strftime("%H%M"))
-                    if dt_end_gcal.minute >= 45:
-                        next_h = dt_end_gcal + timedelta(hours=1)
-                        end_int = int(next_h.replace(minute=0).strftime("%H%M"))
-                    else:
-                        end_int = raw_end_int
-                        
-                    duration_minutes = float((dt_end_gcal - dt_start_gcal).total_seconds() / 60)
-                    if 20 <= duration_minutes <= 40: str_duration = "30"
-                    elif 45 <= duration_minutes <= 60: str_duration = "50"
-                    else: str_duration = str(int(duration_minutes))
+                    _, day_name, _, end_int, str_duration = _preply_times(dt_start_gcal, dt_end_gcal)
 
                     clean_name = "".join(c for c in name_val if c.isalnum())
                     clean_surname = "".join(c for c in surname_val if c.isalnum())
@@ -205,7 +431,7 @@ def sync_google_calendar_logic(teacher_email):
                         name=name_val,
                         surname=surname_val,
                         date=date_str,
-                        days=["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"][dt_start_gcal.weekday()],
+                        days=day_name,
                         duration=str_duration,
                         start_time=start_int,
                         end_time=end_int,
@@ -217,8 +443,9 @@ def sync_google_calendar_logic(teacher_email):
                         class_count="1/1",
                         total_classes=0
                     )
+                    _link_class(new_class, event)
                     session.add(new_class)
-                    db_signatures.add(candidate_sig) # La añadimos al set para no procesarla de nuevo
+                    classes_by_event[event_id] = new_class
                     count_preply_added += 1
                     continue
 
@@ -228,100 +455,159 @@ def sync_google_calendar_logic(teacher_email):
                 logger.info(f"🚫 IGNORADO (No en BD y no es Preply): {summary}")
                 count_ignored += 1
                 
-                # --- OPCIÓN DE BORRADO (COMENTADA) ---
-                # Si quisieras que lo que no está en tu BD se borre de Google (si no es Preply):
-                try:
-                     
-                     logger.info(f"🗑️ Borrando evento fantasma de Google: {summary}")
-                     service.events().delete(calendarId=teacher_email, eventId=event_id).execute()
-                     count_deleted += 1
-                except Exception as e_del:
-                     logger.error(f"Error borrando: {e_del}")
-                # -------------------------------------
+                # --- BORRADO DE FANTASMAS ---
+                # Lo que no está en la BD (y no es Preply) se borra de Google (en batch, abajo)
+                logger.info(f"🗑️ Borrando evento fantasma de Google: {summary}")
+                ghost_deletes.append((event, service.events().delete(calendarId=teacher_email, eventId=event_id)))
 
             except Exception as e:
                 logger.error(f"  ❌ Error procesando evento Google '{summary}': {e}")
                 continue
 
-        # Guardamos los cambios si agregamos Preplys
+        for event, (_, error) in _execute_batched(service, ghost_deletes).items():
+            # 404/410: ya no existía en Google, igual sale de la copia local
+            if error is None or getattr(getattr(error, "resp", None), "status", None) in (404, 410):
+                session.delete(event)
+                count_deleted += 1
+            else:
+                logger.error(f"Error borrando '{event.summary}': {error}")
+                errors.append(f"Borrar '{event.summary}': {error}")
+
+        # Guardamos los Preplys agregados/movidos/cancelados y la copia local de Calendar
+        # (las cachés de clases y disponibilidad se invalidan solas al confirmar)
         session.commit()
 
         # =========================================================================
         # FASE B: BD -> GOOGLE (SUBIDA DE FALTANTES)
         # =========================================================================
         logger.info("--- 🔼 FASE B: SUBIENDO FALTANTES (BD -> GOOGLE) ---")
-        
-        today_str = datetime.now(LOCAL_TZ).strftime("%Y-%m-%d")
-        
-        local_classes = session.query(AsignedClasses).filter(
-            AsignedClasses.date_prof >= today_str,
-            AsignedClasses.status != 'Cancelada'
-        ).all()
+        uploads = []
+        patches = []
+
+        # Clases a revisar: sin evento, modificadas desde el sync anterior o tocadas en la
+        # Fase A. En completa, todas desde hoy.
+        class_query = session.query(AsignedClasses).filter(*active_filter)
+        if not full:
+            since = previous_sync - timedelta(seconds=CALENDAR_LOCAL_CHANGES_MARGIN_SECONDS)
+            class_query = class_query.filter(or_(
+                AsignedClasses.calendar_event_id.is_(None),
+                AsignedClasses.updated_at >= since
+            ))
+        local_classes = {c.id: c for c in class_query.all()}
+        for c in classes_by_event.values():
+            if c.id is not None and c.status != "Cancelada":
+                local_classes.setdefault(c.id, c)
+        local_classes = list(local_classes.values())
+        # Sus eventos vinculados (para comparar antes de hacer patch)
+        linked_ids = {c.calendar_event_id for c in local_classes if c.calendar_event_id} - set(events_by_id)
+        for e in _query_in(session.query(CalendarEvent).filter(CalendarEvent.calendar_id == teacher_email),
+                           CalendarEvent.event_id, linked_ids):
+            events_by_id[e.event_id] = e
+        logger.info(f"💾 Fase B: {len(local_classes)} clases a revisar.")
         
         for local_class in local_classes:
             full_name = f"{local_class.name} {local_class.surname}"
             
-            # Protección: Si es Preply no deberíamos necesitar subirla porque Preply 
-            # ya sincroniza con Google, pero si falta, el código intentará subirla.
-            # Puedes descomentar esto si prefieres que NUNCA suba Preplys manualmente:
-            if "- preply lesson" in full_name.lower() or local_class.package == "Preply":
+            # Preply ya sincroniza con Google (y la Fase A trae sus cambios): no se sube
+            if _is_preply(local_class) or local_class.status == "Cancelada":
                 continue 
 
-            current_date_prof = local_class.date_prof if local_class.date_prof else local_class.date
-            
             try:
-                s_time_str = str(local_class.start_prof_time).zfill(4)
-                start_dt_obj = datetime.strptime(f"{current_date_prof} {s_time_str[:2]}:{s_time_str[2:]}", "%Y-%m-%d %H:%M")
-                start_dt_obj = start_dt_obj.replace(tzinfo=LOCAL_TZ)
-                
-                e_time_str = str(local_class.end_prof_time).zfill(4)
-                end_dt_obj = datetime.strptime(f"{current_date_prof} {e_time_str[:2]}:{e_time_str[2:]}", "%Y-%m-%d %H:%M")
-                end_dt_obj = end_dt_obj.replace(tzinfo=LOCAL_TZ)
-                
-                if local_class.end_prof_time < local_class.start_prof_time:
-                    end_dt_obj += timedelta(days=1)
-                
-                check_summ = full_name.strip().lower()
-                check_start_iso = start_dt_obj.strftime("%Y-%m-%dT%H:%M:%S")
-                check_sig = (check_summ, check_start_iso)
-                
-                # Si ya está en Google (detectado en Fase A), no subir
-                if check_sig in google_signatures:
+                start_at, end_at = class_bounds(local_class)
+                if start_at is None:
                     continue
-
-                logger.info(f"  🚀 SUBIENDO A CALENDAR: {full_name}")
+                start_dt_obj = start_at.astimezone(LOCAL_TZ)
+                end_dt_obj = end_at.astimezone(LOCAL_TZ)
                 
-                event_body = {
-                    "summary": full_name,
-                    "location": "Online - TuProfemaria App",
-                    "description": f"{header_msg}\nClase creada desde el Panel Admin.",
+                time_body = {
                     "start": {
                         "dateTime": start_dt_obj.isoformat(),
-                        "timeZone": "America/Caracas"
+                        "timeZone": LOCAL_TZ.key
                     },
                     "end": {
                         "dateTime": end_dt_obj.isoformat(),
-                        "timeZone": "America/Caracas"
+                        "timeZone": LOCAL_TZ.key
                     }
                 }
+
+                # Ya tiene evento en Google: solo se corrige lo que cambió (patch)
+                linked = events_by_id.get(local_class.calendar_event_id) if local_class.calendar_event_id else None
+                if linked is not None:
+                    if ((linked.summary or "").strip() == full_name.strip()
+                            and linked.start_local == start_dt_obj.strftime("%Y-%m-%dT%H:%M:%S")
+                            and linked.end_local == end_dt_obj.strftime("%Y-%m-%dT%H:%M:%S")):
+                        continue
+                    logger.info(f"  ✏️ ACTUALIZANDO EN CALENDAR: {full_name}")
+                    patches.append((local_class.id, service.events().patch(
+                        calendarId=teacher_email, eventId=linked.event_id,
+                        body={"summary": full_name, **time_body}
+                    )))
+                    continue
+
+                logger.info(f"  🚀 SUBIENDO A CALENDAR: {full_name}")
                 
-                service.events().insert(calendarId=teacher_email, body=event_body).execute()
+                event_body = {
+                    "summary": full_name,
+                    "location": "Online - TuProfemaria App",
+                    "description": f"{header_msg}\nClase creada desde el Panel Admin.",
+                    **time_body
+                }
                 
-                google_signatures.add(check_sig)
-                count_uploaded_google += 1
+                uploads.append((local_class.id, service.events().insert(calendarId=teacher_email, body=event_body)))
 
             except Exception as e_post:
                 logger.error(f"  ❌ Error subiendo clase ID {local_class.id}: {e_post}")
                 continue
 
-        final_msg = f"Sync Finalizado: 🆕 {count_preply_added} Preplys agregadas, 🚫 {count_ignored} ignorados, ⬆️ {count_uploaded_google} subidos, 🗑️ {count_deleted} borradas"
+        classes_by_id = {c.id: c for c in local_classes}
+        for class_id, (created, error) in _execute_batched(service, uploads).items():
+            if error is not None:
+                logger.error(f"  ❌ Error subiendo clase ID {class_id}: {error}")
+                errors.append(f"Subir clase {class_id}: {error}")
+                continue
+            # La registramos ya: el próximo sync incremental la recibirá con el mismo etag
+            _link_class(classes_by_id[class_id], _store_event(session, teacher_email, created, LOCAL_TZ))
+            count_uploaded_google += 1
+
+        for class_id, (patched, error) in _execute_batched(service, patches).items():
+            local_class = classes_by_id[class_id]
+            if error is not None:
+                if getattr(getattr(error, "resp", None), "status", None) in (404, 410):
+                    # El evento ya no existe en Google: se vuelve a subir en el próximo sync
+                    stale = events_by_id.get(local_class.calendar_event_id)
+                    if stale is not None:
+                        session.delete(stale)
+                    local_class.calendar_event_id = None
+                logger.error(f"  ❌ Error actualizando clase ID {class_id}: {error}")
+                errors.append(f"Actualizar clase {class_id}: {error}")
+                continue
+            _link_class(local_class, _store_event(session, teacher_email, patched, LOCAL_TZ))
+            count_patched += 1
+
+        # El token se guarda al final: si algo falló antes, el próximo sync repite estos cambios
+        state.sync_token = next_token
+        state.last_sync = datetime.now(timezone.utc)
+        if full:
+            state.last_full_sync = state.last_sync
+        session.commit()
+
+        final_msg = f"Sync Finalizado: 🆕 {count_preply_added} Preplys agregadas, 🔁 {count_preply_moved} movidas, ❌ {count_preply_cancelled} canceladas, 🚫 {count_ignored} ignorados, ⬆️ {count_uploaded_google} subidos, ✏️ {count_patched} actualizados, 🗑️ {count_deleted} borradas"
+        if errors:
+            final_msg += f", ❌ {len(errors)} errores"
         logger.info("==================================================")
         logger.info(final_msg)
         
         return {
             "msg": final_msg,
             "preply_added": count_preply_added,
-            "updated_count": count_uploaded_google
+            "preply_moved": count_preply_moved,
+            "preply_cancelled": count_preply_cancelled,
+            "updated_count": count_uploaded_google,
+            "patched_count": count_patched,
+            "deleted_count": count_deleted,
+            "errors": errors,
+            "full_resync": full,
+            "changed_events": changed
         }
 
     except Exception as e:
@@ -1,109 +1,86 @@
-from db.sqlite_db import SQLiteSession
-from db.postgres_db import PostgresSession
-from db.models import User, SchedulePref, AsignedClasses
-from nicegui import ui
+import json
 import logging
 
+from sqlalchemy import delete
+
+from db.postgres_db import PostgresEngine
+from db.models import User, SchedulePref, AsignedClasses
+from components.availability import invalidate_all
+from components.query_cache import invalidate_class_queries
+from auth.sync import (
+    _read_rows, _existing_keys, _insert_batches, _insert_missing, _timed, _format_msg
+)
+
 logger = logging.getLogger(__name__)
 
-def sync_sqlite_to_postgres_edit():
-    sqlite_sess = SQLiteSession()
-    pg_sess = PostgresSession()
+# =====================================================
+# RECONCILIACIÓN SQLITE -> POSTGRES (EDICIÓN DE PERFIL)
+# =====================================================
+# Igual que auth/sync.py, pero los usuarios solo se ACTUALIZAN (no se crean
+# aquí, eso es del sign-up) y los rangos horarios de cada alumno se reemplazan.
+# Como en auth/sync.py, la conexión es Core: las cachés se invalidan a mano.
+#
+# Uso sin interfaz:  python -m auth.sync_edit
+
+USER_EDIT_COLUMNS = ["name", "surname", "email", "time_zone", "role", "package", "status", "password_hash"]
+
+
+def _update_users(conn):
+    rows = _read_rows(User, ["username"] + USER_EDIT_COLUMNS)
+    existing = {username for (username,) in _existing_keys(conn, User, ["username"])}
+    skipped = [r["username"] for r in rows if r["username"] not in existing]
+    if skipped:
+        logger.info(f"{len(skipped)} usuarios no existen en PG, se omiten para no sobrescribir sign-up")
+    rows = [r for r in rows if r["username"] in existing]
+    # Todas las filas ya existen: el ON CONFLICT las actualiza en bloque
+    return _insert_batches(conn, User, rows, lambda stmt: stmt.on_conflict_do_update(
+        index_elements=["username"],
+        set_={c: stmt.excluded[c] for c in USER_EDIT_COLUMNS},
+    ))
 
+
+def _replace_ranges(conn):
+    rows = _read_rows(SchedulePref, ["username", "name", "surname", "duration", "days", "start_time", "end_time", "package"])
+    usernames = {r["username"] for r in rows}
+    if usernames:
+        conn.execute(delete(SchedulePref.__table__).where(SchedulePref.__table__.c.username.in_(usernames)))
+    return _insert_batches(conn, SchedulePref, rows)
+
+
+def sync_sqlite_to_postgres_edit():
+    """
+    Lleva a Neon los cambios de perfil guardados en SQLite. Todo en una transacción.
+    Retorna {"success", "stats": {tabla: {"rows", "seconds"}}, "msg"} o {"success": False, "error"}.
+    """
+    stats = {}
     try:
-        total_users = 0
-        total_rangos = 0
-        total_clases = 0
-
-        # -----------------------------
-        # SYNC USERS (solo actualiza)
-        # -----------------------------
-        sqlite_users = sqlite_sess.query(User).all()
-        for u in sqlite_users:
-            pg_user = pg_sess.query(User).filter_by(username=u.username).first()
-            if pg_user:
-                # Actualiza datos existentes
-                pg_user.name = u.name
-                pg_user.surname = u.surname
-                pg_user.email = u.email
-                pg_user.time_zone = u.time_zone
-                pg_user.role = u.role
-                pg_user.package = u.package
-                pg_user.status = u.status
-                pg_user.password_hash = u.password_hash
-                total_users += 1
-            else:
-                # No se crea usuario nuevo aquí (solo edit-profile)
-                logger.info(f"Usuario {u.username} no existe en PG, se omite para no sobrescribir sign-up")
-     
-
-       # -----------------------------
-        # SYNC RANGOS_HORARIOS
-        # -----------------------------
-        sqlite_rangos = sqlite_sess.query(SchedulePref).all()
-
-        # Primero, borrar los rangos existentes en PostgreSQL
-        for r in set(u.username for u in sqlite_rangos):  # usuarios que tienen rangos en SQLite
-            pg_sess.query(SchedulePref).filter(SchedulePref.username == r).delete()
-
-        # Luego, agregar todos los rangos de SQLite
-        for r in sqlite_rangos:
-            pg_sess.add(SchedulePref(
-                username=r.username,
-                name=r.name,
-                surname=r.surname,
-                duration=r.duration,
-                days=r.days,
-                start_time=r.start_time,
-                end_time=r.end_time,
-                package=r.package
-            ))
-            total_rangos += 1
-
-        # -----------------------------
-        # SYNC CLASES_ASIGNADAS
-        # -----------------------------
-        sqlite_clases = sqlite_sess.query(AsignedClasses).all()
-        for c in sqlite_clases:
-            exists = pg_sess.query(AsignedClasses).filter_by(
-                username=c.username,
-                date=c.date,
-                start_time=c.start_time
-            ).first()
-
-            if not exists:
-                pg_sess.add(AsignedClasses(
-                    username=c.username,
-                    name=c.name,
-                    surname=c.surname,
-                    date=c.date,
-                    duration=c.duration,
-                    days=c.days,
-                    start_time=c.start_time,
-                    end_time=c.end_time,
-                    package=c.package
-                ))
-                total_clases += 1
-
-        # COMMIT FINAL
-        pg_sess.commit()
-
-        # -----------------------------
-        # NOTIFICACIONES
-        # -----------------------------
-        msg = (
-            f"Sincronización completa:\n"
-            f"• {total_users} usuarios\n"
-            f"• {total_rangos} rangos horarios\n"
-            f"• {total_clases} clases asignadas"
-        )
-        ui.notify(msg, type="positive")
+        with PostgresEngine.begin() as conn:
+            _timed(stats, "users", _update_users, conn)
+            _timed(stats, "rangos_horarios", _replace_ranges, conn)
+            _timed(stats, "clases_asignadas", _insert_missing, conn, AsignedClasses,
+                   ["username", "name", "surname", "date", "duration", "days", "start_time", "end_time", "package"],
+                   ["username", "date", "start_time"])
+
+        # Conexión Core: el hook de commit de PostgresSession no lo ve
+        # (nombres y zonas de los alumnos se muestran en el panel de clases)
+        if stats["users"]["rows"] or stats["clases_asignadas"]["rows"]:
+            invalidate_class_queries()
+        if stats["clases_asignadas"]["rows"]:
+            invalidate_all()
+
+        msg = _format_msg(stats, [
+            ("users", "usuarios"),
+            ("rangos_horarios", "rangos horarios"),
+            ("clases_asignadas", "clases asignadas"),
+        ])
         logger.info(msg)
+        return {"success": True, "stats": stats, "msg": msg}
 
     except Exception as ex:
-        ui.notify(f"Error sincronizando datos: {ex}", type="negative")
         logger.exception(ex)
+        return {"success": False, "error": str(ex)}
+
 
-    finally:
-        sqlite_sess.close()
-        pg_sess.close()
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(sync_sqlite_to_postgres_edit(), indent=2, ensure_ascii=False))
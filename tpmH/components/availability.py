@@ -0,0 +1,295 @@
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_, and_
+
+from db.models import ScheduleProf, ScheduleProfEsp, AsignedClasses
+from components.share_data import days_of_week, ACTIVE_STATUSES
+from components.query_cache import QueryCache
+
+logger = logging.getLogger(__name__)
+
+# =====================================================
+# MOTOR ÚNICO DE DISPONIBILIDAD (HORARIO PROFESORA)
+# =====================================================
+# Todas las pantallas (ScheduleMaker, reagendar alumno, reagendar admin)
+# calculan los huecos libres con este módulo, así el resultado es idéntico
+# en todas partes. Todo se trabaja en MINUTOS (0-1440) del día de la profesora.
+
+MINUTES_PER_DAY = 1440
+STEP_MINUTES = 30
+
+POSITIVE_STATUS = ("Libre", "Available", "Disponible")
+# Estados de clase que OCUPAN el horario de la profesora: solo las clases por
+# dar. Finalizadas, completadas, canceladas, etc. no bloquean nada.
+BLOCKING_CLASS_STATUSES = ACTIVE_STATUSES
+# Slots ya calculados que guarda cada día (duración, paso, clase excluida)
+SLOT_MEMO_SIZE = 16
+
+
+def hhmm_to_minutes(value):
+    """Convierte HHMM (int o str, ej: 930 / '0930') a minutos desde medianoche."""
+    v = int(value)
+    return (v // 100) * 60 + (v % 100)
+
+
+def minutes_to_hhmm(minutes):
+    """Convierte minutos desde medianoche a entero HHMM (ej: 570 -> 930)."""
+    return (minutes // 60) * 100 + (minutes % 60)
+
+
+class DayAvailability:
+    """
+    Índice de disponibilidad de UN día de la profesora.
+
+    - open_ranges: intervalos (inicio, fin) en minutos donde la profesora trabaja.
+    - busy: lista de (inicio, fin, class_id) en minutos que bloquean el horario.
+      class_id es None para bloqueos que no son clases (horario 'Ocupado').
+
+    Los bloqueos se vuelcan a un arreglo de sumas prefijas de 1441 posiciones,
+    de modo que "¿está libre [s, s+N)?" se responde en O(1) y generar todos
+    los slots del día es una sola pasada.
+    """
+
+    def __init__(self, date_str, open_ranges, busy):
+        self.date = date_str
+        self.open_ranges = sorted(open_ranges)
+        self.busy = busy
+        # Resultados ya calculados: (duración, paso, clase_excluida) -> (libres, ocupados).
+        # Acotado a SLOT_MEMO_SIZE (cada clase excluida al reagendar es una clave nueva).
+        self._slot_memo = {}
+        self._memo_lock = threading.Lock()  # el día vive en la caché compartida entre hilos
+
+    def _busy_prefix(self, exclude_class_id=None):
+        # Diferencias -> minutos ocupados -> sumas prefijas
+        diff = [0] * (MINUTES_PER_DAY + 1)
+        for start, end, class_id in self.busy:
+            if exclude_class_id is not None and class_id == exclude_class_id:
+                continue
+            if start >= end:
+                continue
+            diff[start] += 1
+            diff[end] -= 1
+
+        prefix = [0] * (MINUTES_PER_DAY + 1)
+        depth = 0
+        occupied = 0
+        for minute in range(MINUTES_PER_DAY):
+            depth += diff[minute]
+            if depth > 0:
+                occupied += 1
+            prefix[minute + 1] = occupied
+        return prefix
+
+    def slots(self, duration_mins, step=STEP_MINUTES, exclude_class_id=None):
+        """
+        Retorna (libres, ocupados): listas ordenadas de inicios HHMM (hora profesora)
+        para clases de `duration_mins` minutos.
+        """
+        if not self.open_ranges or duration_mins <= 0:
+            return [], []
+
+        memo_key = (duration_mins, step, exclude_class_id)
+        with self._memo_lock:
+            cached = self._slot_memo.get(memo_key)
+        if cached is not None:
+            free, busy = cached
+            return list(free), list(busy)
+
+        prefix = self._busy_prefix(exclude_class_id)
+
+        # Inicios candidatos: cada rango avanza en pasos de `step` desde su inicio
+        starts = set()
+        for r_start, r_end in self.open_ranges:
+            curr = r_start
+            while curr + duration_mins <= r_end:
+                starts.add(curr)
+                curr += step
+
+        free, busy = [], []
+        for s in sorted(starts):
+            if prefix[s + duration_mins] - prefix[s] == 0:
+                free.append(minutes_to_hhmm(s))
+            else:
+                busy.append(minutes_to_hhmm(s))
+
+        with self._memo_lock:
+            if memo_key not in self._slot_memo and len(self._slot_memo) >= SLOT_MEMO_SIZE:
+                # Se descarta el más antiguo (los dict conservan el orden de inserción)
+                self._slot_memo.pop(next(iter(self._slot_memo)))
+            self._slot_memo[memo_key] = (tuple(free), tuple(busy))
+        return free, busy
+
+    def free_slots(self, duration_mins, step=STEP_MINUTES, exclude_class_id=None):
+        return self.slots(duration_mins, step, exclude_class_id)[0]
+
+
+def _rule_interval(start_time, end_time):
+    """Convierte una regla HHMM a minutos. Un fin 0000 o menor al inicio se lee como medianoche."""
+    if start_time is None or end_time is None:
+        return None
+    start = hhmm_to_minutes(start_time)
+    end = hhmm_to_minutes(end_time)
+    if end <= start:
+        end = MINUTES_PER_DAY
+    return start, end
+
+
+def build_days(date_strs, general_rules, specific_rules, classes):
+    """
+    Construye {fecha: DayAvailability} a partir de filas ya cargadas.
+
+    Reglas:
+    1. Disponible = reglas generales 'Libre' del día de la semana
+       + reglas específicas 'Libre' de la fecha.
+    2. Bloqueado = reglas específicas NO libres de la fecha
+       + clases por dar, BLOCKING_CLASS_STATUSES (hora profesora). Las clases que cruzan
+       medianoche también bloquean el inicio del día siguiente.
+    """
+    general_by_day = {}
+    for r in general_rules:
+        if str(getattr(r, 'availability', '')) in POSITIVE_STATUS:
+            interval = _rule_interval(r.start_time, r.end_time)
+            if interval:
+                general_by_day.setdefault(r.days, []).append(interval)
+
+    open_by_date = {}
+    busy_by_date = {d: [] for d in date_strs}
+
+    for r in specific_rules:
+        interval = _rule_interval(r.start_time, r.end_time)
+        if not interval or r.date not in busy_by_date:
+            continue
+        if str(getattr(r, 'avai', '')) in POSITIVE_STATUS:
+            open_by_date.setdefault(r.date, []).append(interval)
+        else:
+            busy_by_date[r.date].append((interval[0], interval[1], None))
+
+    for c in classes:
+        sp = c.start_prof_time if c.start_prof_time is not None else c.start_time
+        ep = c.end_prof_time if c.end_prof_time is not None else c.end_time
+        c_date = c.date_prof or c.date
+        if sp is None or ep is None or not c_date:
+            continue
+        start, end = hhmm_to_minutes(sp), hhmm_to_minutes(ep)
+
+        if c_date in busy_by_date:
+            busy_by_date[c_date].append((start, end if end >= start else MINUTES_PER_DAY, c.id))
+
+        # Clase que termina pasada la medianoche: bloquea el día siguiente
+        if end < start:
+            try:
+                next_day = (datetime.strptime(c_date, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+            except ValueError:
+                continue
+            if next_day in busy_by_date:
+                busy_by_date[next_day].append((0, end, c.id))
+
+    days = {}
+    for d in date_strs:
+        weekday = days_of_week[datetime.strptime(d, '%Y-%m-%d').weekday()]
+        open_ranges = general_by_day.get(weekday, []) + open_by_date.get(d, [])
+        days[d] = DayAvailability(d, open_ranges, busy_by_date[d])
+    return days
+
+
+def load_days(session, date_strs):
+    """
+    Carga la disponibilidad de varias fechas (ej: una semana) con 3 consultas en total.
+    Retorna {fecha: DayAvailability}.
+    """
+    date_strs = sorted(set(date_strs))
+    if not date_strs:
+        return {}
+
+    weekdays = {days_of_week[datetime.strptime(d, '%Y-%m-%d').weekday()] for d in date_strs}
+    # Incluimos el día anterior de cada fecha para detectar clases que cruzan medianoche
+    class_dates = set(date_strs)
+    for d in date_strs:
+        class_dates.add((datetime.strptime(d, '%Y-%m-%d') - timedelta(days=1)).strftime('%Y-%m-%d'))
+
+    general_rules = session.query(ScheduleProf).filter(ScheduleProf.days.in_(weekdays)).all()
+    specific_rules = session.query(ScheduleProfEsp).filter(ScheduleProfEsp.date.in_(date_strs)).all()
+    classes = session.query(AsignedClasses).filter(
+        or_(
+            AsignedClasses.date_prof.in_(class_dates),
+            and_(AsignedClasses.date_prof.is_(None), AsignedClasses.date.in_(class_dates))
+        ),
+        AsignedClasses.status.in_(BLOCKING_CLASS_STATUSES)
+    ).all()
+
+    return build_days(date_strs, general_rules, specific_rules, classes)
+
+
+# =====================================================
+# CACHÉ EN MEMORIA (POR FECHA Y PROFESORA)
+# =====================================================
+# Una QueryCache acotada (LRU + TTL) con claves (fecha, profesora): el espacio
+# de cada entrada es su fecha, así se invalidan solo las fechas afectadas.
+# Cada DayAvailability guarda además los slots ya calculados por duración.
+#
+# No hay invalidaciones a mano: el hook de commit de PostgresSession
+# (components/cache_invalidation.py) borra las fechas de las clases y
+# horarios que cambiaron.
+
+AVAILABILITY_CACHE_SIZE = int(os.getenv("AVAILABILITY_CACHE_SIZE", "256"))
+AVAILABILITY_CACHE_TTL = int(os.getenv("AVAILABILITY_CACHE_TTL", "300"))
+
+availability_cache = QueryCache(maxsize=AVAILABILITY_CACHE_SIZE, ttl_seconds=AVAILABILITY_CACHE_TTL)
+
+
+def get_days(session, date_strs, teacher=None):
+    """{fecha: DayAvailability}; solo consulta la BD por las fechas que no están en caché."""
+    generation = availability_cache.generation
+    found = {}
+    for d in set(date_strs):
+        day = availability_cache.get((d, teacher))
+        if day is not None:
+            found[d] = day
+    missing = [d for d in set(date_strs) if d not in found]
+
+    if missing:
+        loaded = load_days(session, missing)
+        # Si hubo una escritura mientras se cargaba, no se guarda (datos viejos)
+        for d, day in loaded.items():
+            availability_cache.set((d, teacher), day, generation)
+        found.update(loaded)
+    return found
+
+
+def class_dates(date_prof, start_prof_time=None, end_prof_time=None):
+    """Fechas (profesora) que ocupa una clase: su día y el siguiente si cruza medianoche."""
+    if not date_prof:
+        return []
+    dates = [date_prof]
+    try:
+        if start_prof_time is not None and end_prof_time is not None and int(end_prof_time) < int(start_prof_time):
+            dates.append((datetime.strptime(date_prof, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d'))
+    except (TypeError, ValueError):
+        pass
+    return dates
+
+
+def invalidate_dates(date_strs):
+    date_strs = [d for d in date_strs if d]
+    if date_strs:
+        availability_cache.invalidate_namespaces(date_strs)
+
+
+def invalidate_all():
+    availability_cache.invalidate()
+
+
+def load_day(session, date_str):
+    return get_days(session, [date_str])[date_str]
+
+
+def get_teacher_slots(session, date_str, duration_mins, exclude_class_id=None):
+    """
+    Punto de entrada para las pantallas: huecos de `duration_mins` para la
+    fecha (hora profesora). Retorna (libres, ocupados) como listas HHMM.
+    Usa la caché: solo consulta la BD si la fecha no está cargada.
+    """
+    return load_day(session, date_str).slots(duration_mins, exclude_class_id=exclude_class_id)
@@ -0,0 +1,121 @@
+import logging
+
+from sqlalchemy import event, inspect
+
+from db.models import AsignedClasses, ScheduleProf, ScheduleProfEsp, User
+from components.availability import class_dates, invalidate_all, invalidate_dates
+from components.query_cache import invalidate_class_queries
+
+logger = logging.getLogger(__name__)
+
+# =====================================================
+# INVALIDACIÓN DE CACHÉS AL CONFIRMAR (HOOK DE SESIÓN)
+# =====================================================
+# Antes cada pantalla llamaba a invalidate_dates() / invalidate_class_queries()
+# después de su commit (una veintena de llamadas a mano; faltaba una y la
+# caché servía datos viejos). Ahora las sesiones de PostgresSession anotan
+# qué tocaron, igual que el outbox de replicación (db/replication.py):
+# - after_flush: clases y horarios nuevos/modificados/borrados. De las clases
+#   se anotan las fechas de antes y de después (una clase movida libera su
+#   día viejo y ocupa el nuevo).
+# - do_orm_execute: INSERT/UPDATE/DELETE masivos. No se sabe qué fechas
+#   tocaron: se invalida toda la disponibilidad.
+# - after_commit: se invalidan las cachés. Si hay rollback no se toca nada.
+#
+# Las escrituras que no pasan por PostgresSession (conexiones Core, ej:
+# auth/sync.py) siguen invalidando a mano.
+
+_SESSION_KEY = "cache_invalidation"
+
+_CLASS_TIME_ATTRS = ("date_prof", "date", "start_prof_time", "end_prof_time")
+# Tablas que ve el panel de clases (class_query_cache)
+_CLASS_QUERY_TABLES = {AsignedClasses.__tablename__, User.__tablename__}
+# Tablas de las que sale la disponibilidad
+_AVAILABILITY_TABLES = {AsignedClasses.__tablename__, ScheduleProf.__tablename__, ScheduleProfEsp.__tablename__}
+
+
+def _touched(session):
+    return session.info.setdefault(_SESSION_KEY, {"tables": set(), "dates": set(), "all_dates": False})
+
+
+def _old_and_new(obj, attrs):
+    """
+    Valores de `attrs` antes y después del flush (sin cargar nada de la BD).
+    None si alguno no está cargado (objeto expirado): no se sabe la fecha.
+    """
+    state = inspect(obj)
+    if any(attr in state.unloaded for attr in attrs):
+        return None
+    old, new = [], []
+    for attr in attrs:
+        current = state.dict.get(attr)
+        deleted = state.attrs[attr].history.deleted
+        old.append(deleted[0] if deleted else current)
+        new.append(current)
+    return old, new
+
+
+def _class_dates(values):
+    date_prof, date, start_prof, end_prof = values
+    return class_dates(date_prof or date, start_prof, end_prof)
+
+
+def _after_flush(session, flush_context):
+    touched = _touched(session)
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if obj in session.dirty and not session.is_modified(obj, include_collections=False):
+            continue
+        touched["tables"].add(inspect(obj).mapper.local_table.name)
+        if isinstance(obj, AsignedClasses):
+            states = _old_and_new(obj, _CLASS_TIME_ATTRS)
+            if states is None:
+                touched["all_dates"] = True
+                continue
+            for values in states:
+                touched["dates"].update(_class_dates(values))
+        elif isinstance(obj, ScheduleProfEsp):
+            states = _old_and_new(obj, ("date",))
+            if states is None:
+                touched["all_dates"] = True
+                continue
+            for (date,) in states:
+                touched["dates"].add(date)
+        elif isinstance(obj, ScheduleProf):
+            # Regla semanal: afecta a todas las fechas de ese día
+            touched["all_dates"] = True
+
+
+def _do_orm_execute(orm_execute_state):
+    state = orm_execute_state
+    if not (state.is_insert or state.is_update or state.is_delete):
+        return
+    table = state.statement.table.name
+    touched = _touched(state.session)
+    touched["tables"].add(table)
+    if table in _AVAILABILITY_TABLES:
+        touched["all_dates"] = True
+
+
+def _after_commit(session):
+    touched = session.info.pop(_SESSION_KEY, None)
+    if not touched or not touched["tables"]:
+        return
+    if touched["tables"] & _CLASS_QUERY_TABLES:
+        invalidate_class_queries()
+    if touched["tables"] & _AVAILABILITY_TABLES:
+        if touched["all_dates"]:
+            invalidate_all()
+        else:
+            invalidate_dates(touched["dates"])
+
+
+def _after_rollback(session):
+    session.info.pop(_SESSION_KEY, None)
+
+
+def install_cache_invalidation(session_factory):
+    """Engancha la invalidación de cachés a una sessionmaker (o clase Session) de Neon."""
+    event.listen(session_factory, "after_flush", _after_flush)
+    event.listen(session_factory, "do_orm_execute", _do_orm_execute)
+    event.listen(session_factory, "after_commit", _after_commit)
+    event.listen(session_factory, "after_rollback", _after_rollback)
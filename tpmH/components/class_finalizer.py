@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+
+from sqlalchemy import update, func, case
+
+from db.postgres_db import PostgresSession
+from db.executor import run_db
+from db.models import AsignedClasses, User
+from components.share_data import PACKAGE_LIMITS, ACTIVE_STATUSES
+
+logger = logging.getLogger(__name__)
+
+# =====================================================
+# AUTO-FINALIZACIÓN DE CLASES (TAREA DE FONDO)
+# =====================================================
+# Antes una clase pasaba de 'Pendiente' a 'Finalizada' solo cuando alguien
+# abría /myclassesAdmin o "Mis Clases". Ahora lo hace esta tarea cada
+# FINALIZE_INTERVAL_SECONDS con un único UPDATE que compara end_at en SQL,
+# y las pantallas solo leen.
+
+FINALIZE_INTERVAL_SECONDS = int(os.getenv("FINALIZE_INTERVAL_SECONDS", "300"))
+
+# Estados que cuentan en el historial del alumno (total_classes)
+FINALIZED_STATUSES = {'Completada', 'Cancelada', 'No Asistió', 'Finalizada'}
+# Estados que CONSUMEN una clase del paquete (para class_count)
+CONSUMED_STATUSES = {'Completada', 'No Asistió'}
+
+
+def refresh_user_counters(session, usernames):
+    """
+    Recalcula User.total_classes y User.class_count ("usadas/límite") de los
+    alumnos indicados con una sola consulta agrupada. No hace commit.
+    """
+    usernames = set(usernames)
+    if not usernames:
+        return
+    status = AsignedClasses.status
+    rows = session.query(
+        AsignedClasses.username,
+        func.sum(case((status.in_(FINALIZED_STATUSES), 1), else_=0)),
+        func.sum(case((status.in_(CONSUMED_STATUSES), 1), else_=0)),
+    ).filter(
+        AsignedClasses.username.in_(usernames),
+        status.notlike('%Prueba_Pendiente%')
+    ).group_by(AsignedClasses.username).all()
+    counts = {username: (int(total or 0), int(consumed or 0)) for username, total, consumed in rows}
+
+    for user in session.query(User).filter(User.username.in_(usernames)).all():
+        total, consumed = counts.get(user.username, (0, 0))
+        pkg_limit = PACKAGE_LIMITS.get(user.package, 0)
+        user.total_classes = total
+        user.class_count = f"{consumed}/{pkg_limit}" if pkg_limit > 0 else f"{consumed}"
+
+
+def finalize_past_classes(now=None):
+    """
+    Marca como 'Finalizada' toda clase activa cuyo end_at ya pasó y actualiza
+    los contadores de sus alumnos. Retorna cuántas clases se finalizaron.
+    """
+    now = now or datetime.now(timezone.utc)
+    session = PostgresSession()
+    try:
+        usernames = session.execute(
+            update(AsignedClasses)
+            .where(AsignedClasses.status.in_(ACTIVE_STATUSES), AsignedClasses.end_at <= now)
+            .values(status='Finalizada')
+            .returning(AsignedClasses.username)
+            .execution_options(synchronize_session=False)
+        ).scalars().all()
+
+        if not usernames:
+            session.rollback()
+            return 0
+
+        refresh_user_counters(session, usernames)
+        session.commit()
+        logger.info(f"✅ Auto-finalización: {len(usernames)} clases de {len(set(usernames))} alumnos.")
+        return len(usernames)
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+# --- CICLO DE VIDA (app.on_startup / app.on_shutdown) ---
+_task = None
+
+
+async def _finalizer_loop():
+    while True:
+        try:
+            await run_db(finalize_past_classes)
+        except Exception as e:
+            logger.error(f"❌ Auto-finalización falló: {e}")
+        await asyncio.sleep(FINALIZE_INTERVAL_SECONDS)
+
+
+async def start_class_finalizer():
+    global _task
+    if _task is None or _task.done():
+        _task = asyncio.get_running_loop().create_task(_finalizer_loop(), name="class-finalizer")
+        logger.info(f"Auto-finalización de clases cada {FINALIZE_INTERVAL_SECONDS}s.")
+
+
+async def stop_class_finalizer():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
@@ -1,14 +1,20 @@
 import os
+import io
+import json
+import time
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime, time as dt_time, timedelta, timezone
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, make_transient
+from sqlalchemy import create_engine, select, delete, insert, Table, Column, MetaData, JSON, Integer, String, DateTime
+from sqlalchemy.dialects import postgresql, sqlite
 
 # --- 1. CARGA DE ENTORNO Y LOGS ---
 load_dotenv() # <--- ESTO ES CRUCIAL PARA LEER EL .ENV
 
 logging.basicConfig(
-    level=logging.INFO, 
+    level=logging.INFO,
     format='%(asctime)s | %(levelname)s | %(message)s',
     datefmt='%H:%M:%S'
 )
@@ -17,96 +23,395 @@ logger = logging.getLogger(__name__)
 # --- 2. IMPORTA TUS MODELOS ---
 # Asegúrate de que la ruta 'db.models' sea correcta según tu estructura de carpetas
 from db.models import (
-    Base, User, SchedulePref, AsignedClasses, ScheduleProf, 
-    ScheduleProfEsp, TeacherProfile, Material, HWork, 
-    StudentMaterial, StudentHWork
+    Base, User, SchedulePref, AsignedClasses, ScheduleProf,
+    ScheduleProfEsp, TeacherProfile, Material, HWork,
+    StudentMaterial, StudentHWork, BackupTombstone
 )
+from db.migrations import run_migrations
 
 # Lista de tablas a clonar
 MODELS_TO_SYNC = [
-    User, TeacherProfile, Material, HWork, 
-    ScheduleProf, ScheduleProfEsp, SchedulePref, 
+    User, TeacherProfile, Material, HWork,
+    ScheduleProf, ScheduleProfEsp, SchedulePref,
     AsignedClasses, StudentMaterial, StudentHWork
 ]
 
+# =====================================================
+# RESPALDO EN STREAMING (NEON -> SUPABASE)
+# =====================================================
+# Antes cada tabla se cargaba entera en memoria (.all()), se borraba el
+# destino y se re-agregaban los objetos ORM uno por uno: memoria y tiempo
+# crecían con la tabla, y un fallo a mitad dejaba la tabla de Supabase vacía.
+#
+# Ahora, por tabla:
+# 1. Se lee de Neon con cursor del servidor, de a BACKUP_CHUNK_ROWS filas.
+# 2. Cada bloque se escribe en una tabla de paso (`_stage_<tabla>`) con
+#    COPY FROM STDIN (Postgres) o INSERT por lotes (otros motores).
+# 3. Solo si la carga terminó bien, una transacción corta reemplaza el
+#    contenido de la tabla real por el de la tabla de paso y la borra.
+#    Si algo falla antes, la tabla de Supabase queda como estaba.
+#
+# RESPALDO DIFERENCIAL
+# Las tablas respaldadas tienen updated_at y los borrados quedan en
+# backup_tombstones (ver db/models.py y la migración 0006). El modo 'diff'
+# manda solo las filas cambiadas desde la última marca de cada tabla
+# (guardada en Supabase, tabla backup_state) y borra las de los tombstones.
+# La marca se toma con un margen (BACKUP_DIFF_OVERLAP_SECONDS) para no perder
+# transacciones que confirmaron tarde; reenviar una fila no hace daño (upsert).
+#
+# El modo 'auto' (el del planificador) hace 'full' si la última copia
+# completa tiene más de BACKUP_FULL_INTERVAL_SECONDS, como chequeo de
+# consistencia, y 'diff' el resto de las veces.
+#
+# TABLAS EN PARALELO
+# Las tablas no dependen entre sí (no hay claves foráneas), así que se
+# copian a la vez en un pool de BACKUP_WORKERS hilos, cada uno con su propia
+# conexión a Neon y a Supabase. Para que todas vean el mismo instante de Neon,
+# una conexión abre una transacción REPEATABLE READ, exporta su snapshot
+# (pg_export_snapshot) y lo mantiene abierto mientras los hilos lo importan
+# con SET TRANSACTION SNAPSHOT. El respaldo tarda ~ lo que la tabla más grande.
+
+BACKUP_WORKERS = int(os.getenv("BACKUP_WORKERS", "4"))
+BACKUP_CHUNK_ROWS = int(os.getenv("BACKUP_CHUNK_ROWS", "5000"))
+BACKUP_DIFF_OVERLAP_SECONDS = int(os.getenv("BACKUP_DIFF_OVERLAP_SECONDS", "300"))
+BACKUP_FULL_INTERVAL_SECONDS = int(os.getenv("BACKUP_FULL_INTERVAL_SECONDS", "86400"))
+
+STAGE_PREFIX = "_stage_"
+
+# Marca de agua por tabla (solo existe en el destino)
+_state_meta = MetaData()
+
+backup_state = Table(
+    "backup_state", _state_meta,
+    Column("table_name", String, primary_key=True),
+    Column("watermark", DateTime(timezone=True)),
+    Column("last_full_at", DateTime(timezone=True)),
+    Column("last_run_at", DateTime(timezone=True)),
+)
+
+_engines = {}
+
+
+def _get_engine(url):
+    """Un motor por URL y por proceso (antes se creaba uno nuevo en cada respaldo)."""
+    engine = _engines.get(url)
+    if engine is None:
+        # Un hilo por tabla + la conexión que sostiene el snapshot
+        engine = _engines[url] = create_engine(url, pool_pre_ping=True, pool_size=BACKUP_WORKERS + 1)
+    return engine
+
+
+def _stage_table(table):
+    """Tabla de paso con las mismas columnas (sin índices ni restricciones)."""
+    return Table(
+        f"{STAGE_PREFIX}{table.name}", MetaData(),
+        *[Column(c.name, c.type) for c in table.columns]
+    )
+
+
+# --- COPY FROM STDIN (formato texto de Postgres) ---
+def _copy_value(value, is_json):
+    if value is None:
+        return "\\N"
+    if is_json:
+        value = json.dumps(value)
+    elif isinstance(value, bool):
+        value = "t" if value else "f"
+    elif isinstance(value, (datetime, date, dt_time)):
+        value = value.isoformat()
+    else:
+        value = str(value)
+    return (value.replace("\\", "\\\\").replace("\t", "\\t")
+                 .replace("\n", "\\n").replace("\r", "\\r"))
+
+
+def _copy_rows(dest_conn, stage, rows):
+    json_cols = [isinstance(c.type, JSON) for c in stage.columns]
+    buf = io.StringIO()
+    for row in rows:
+        buf.write("\t".join(_copy_value(v, j) for v, j in zip(row, json_cols)))
+        buf.write("\n")
+    buf.seek(0)
+    columns = ", ".join(f'"{c.name}"' for c in stage.columns)
+    cursor = dest_conn.connection.driver_connection.cursor()
+    try:
+        cursor.copy_expert(f'COPY "{stage.name}" ({columns}) FROM STDIN', buf)
+    finally:
+        cursor.close()
+
+
+def _write_chunk(dest_conn, stage, rows):
+    if dest_conn.dialect.name == "postgresql":
+        _copy_rows(dest_conn, stage, rows)
+    else:
+        dest_conn.execute(insert(stage), [row._asdict() for row in rows])
+
+
+def _begin_apply(dest_conn):
+    """Apaga el trigger de seguimiento en Supabase para esta transacción (ver migración 0006)."""
+    if dest_conn.dialect.name == "postgresql":
+        dest_conn.exec_driver_sql("SET LOCAL backup.applying = 'on'")
+
+
+def _upsert(dest_conn, table, rows):
+    """INSERT ... ON CONFLICT (id) DO UPDATE por lotes."""
+    if not rows:
+        return
+    dialect_insert = postgresql.insert if dest_conn.dialect.name == "postgresql" else sqlite.insert
+    stmt = dialect_insert(table)
+    pk = [c.name for c in table.primary_key.columns]
+    stmt = stmt.on_conflict_do_update(
+        index_elements=pk,
+        set_={c.name: stmt.excluded[c.name] for c in table.columns if c.name not in pk},
+    )
+    dest_conn.execute(stmt, [row._asdict() for row in rows])
+
+
+def _save_state(dest_conn, table_name, watermark, full):
+    values = {"watermark": watermark, "last_run_at": datetime.now(timezone.utc)}
+    if full:
+        values["last_full_at"] = values["last_run_at"]
+    updated = dest_conn.execute(
+        backup_state.update().where(backup_state.c.table_name == table_name).values(**values)
+    ).rowcount
+    if not updated:
+        dest_conn.execute(backup_state.insert().values(table_name=table_name, **values))
+
+
+def _load_state(dest_engine):
+    with dest_engine.connect() as conn:
+        return {row.table_name: row for row in conn.execute(select(backup_state))}
+
+
+def _as_utc(value):
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _reset_sequence(dest_conn, table):
+    """Tras copiar ids explícitos, la secuencia del id en Supabase queda atrás: se adelanta."""
+    pk = list(table.primary_key.columns)
+    if dest_conn.dialect.name != "postgresql" or len(pk) != 1 or not isinstance(pk[0].type, Integer):
+        return
+    seq = dest_conn.exec_driver_sql(
+        f"SELECT pg_get_serial_sequence('{table.name}', '{pk[0].name}')"
+    ).scalar()
+    if seq:
+        dest_conn.exec_driver_sql(
+            f'SELECT setval(\'{seq}\', COALESCE((SELECT MAX("{pk[0].name}") FROM "{table.name}"), 0) + 1, false)'
+        )
+
+
+@contextmanager
+def _exported_snapshot(source_engine):
+    """Abre una transacción REPEATABLE READ en Neon y entrega el id de su snapshot (None si no es Postgres)."""
+    if source_engine.dialect.name != "postgresql":
+        yield None
+        return
+    with source_engine.connect() as conn:
+        conn.execution_options(isolation_level="REPEATABLE READ")
+        with conn.begin():
+            yield conn.exec_driver_sql("SELECT pg_export_snapshot()").scalar()
+
+
+@contextmanager
+def _source_connection(source_engine, snapshot=None):
+    """Conexión de lectura a Neon dentro del snapshot compartido (si hay)."""
+    with source_engine.connect() as conn:
+        if snapshot:
+            conn.execution_options(isolation_level="REPEATABLE READ")
+        with conn.begin():
+            if snapshot:
+                conn.exec_driver_sql(f"SET TRANSACTION SNAPSHOT '{snapshot}'")
+            yield conn
+
+
+def _copy_table(source_engine, dest_engine, model, watermark, snapshot=None):
+    """Copia una tabla completa vía tabla de paso. Retorna (filas, borradas, segundos)."""
+    table = model.__table__
+    stage = _stage_table(table)
+    started = time.monotonic()
+    count = 0
+
+    # A. Tabla de paso vacía
+    with dest_engine.begin() as dest_conn:
+        stage.drop(dest_conn, checkfirst=True)
+        stage.create(dest_conn)
+
+    try:
+        # B. Neon (cursor del servidor) -> tabla de paso, por bloques
+        with _source_connection(source_engine, snapshot) as src_conn, dest_engine.begin() as dest_conn:
+            result = src_conn.execution_options(yield_per=BACKUP_CHUNK_ROWS).execute(select(*table.columns))
+            for rows in result.partitions():
+                _write_chunk(dest_conn, stage, rows)
+                count += len(rows)
+
+        # C. Cambio atómico: la tabla real pasa a tener el contenido de la de paso
+        with dest_engine.begin() as dest_conn:
+            _begin_apply(dest_conn)
+            dest_conn.execute(delete(table))
+            dest_conn.execute(insert(table).from_select([c.name for c in table.columns], select(*stage.columns)))
+            stage.drop(dest_conn)
+            _reset_sequence(dest_conn, table)
+            _save_state(dest_conn, table.name, watermark, full=True)
+    except Exception:
+        with dest_engine.begin() as dest_conn:
+            stage.drop(dest_conn, checkfirst=True)
+        raise
+
+    return count, 0, time.monotonic() - started
+
+
+def _diff_table(source_engine, dest_engine, model, since, watermark, snapshot=None):
+    """
+    Manda a Supabase las filas con updated_at >= since y borra las de los
+    tombstones, todo en una transacción del destino. Retorna (filas, borradas, segundos).
+    """
+    table = model.__table__
+    tomb = BackupTombstone.__table__
+    started = time.monotonic()
+    count = 0
+
+    with _source_connection(source_engine, snapshot) as src_conn, dest_engine.begin() as dest_conn:
+        _begin_apply(dest_conn)
+
+        deleted_ids = src_conn.execute(
+            select(tomb.c.row_id).distinct()
+            .where(tomb.c.table_name == table.name, tomb.c.deleted_at >= since)
+        ).scalars().all()
+        # Un id borrado que volvió a aparecer (re-insertado) lo repone el upsert de abajo
+        for i in range(0, len(deleted_ids), BACKUP_CHUNK_ROWS):
+            dest_conn.execute(delete(table).where(table.c.id.in_(deleted_ids[i:i + BACKUP_CHUNK_ROWS])))
+
+        result = src_conn.execution_options(yield_per=BACKUP_CHUNK_ROWS).execute(
+            select(*table.columns).where(table.c.updated_at >= since)
+        )
+        for rows in result.partitions():
+            _upsert(dest_conn, table, rows)
+            count += len(rows)
+
+        _reset_sequence(dest_conn, table)
+        _save_state(dest_conn, table.name, watermark, full=False)
+
+    return count, len(deleted_ids), time.monotonic() - started
+
+
+def _prune_tombstones(source_engine, before):
+    """Tras una copia completa los tombstones anteriores ya no hacen falta."""
+    tomb = BackupTombstone.__table__
+    with source_engine.begin() as conn:
+        return conn.execute(delete(tomb).where(tomb.c.deleted_at < before)).rowcount
+
+
+def _backup_table(engine_source, engine_dest, model, prev, mode, run_started, snapshot):
+    """Trabajo de un hilo: copia completa o diferencial de una tabla. Retorna sus estadísticas."""
+    table_name = model.__tablename__
+    last_full = _as_utc(prev.last_full_at) if prev else None
+    full = (
+        mode == "full" or prev is None or prev.watermark is None
+        or (mode == "auto" and (last_full is None
+                                or run_started - last_full > timedelta(seconds=BACKUP_FULL_INTERVAL_SECONDS)))
+    )
+    if full:
+        count, deleted, seconds = _copy_table(engine_source, engine_dest, model, run_started, snapshot)
+    else:
+        since = _as_utc(prev.watermark) - timedelta(seconds=BACKUP_DIFF_OVERLAP_SECONDS)
+        count, deleted, seconds = _diff_table(engine_source, engine_dest, model, since, run_started, snapshot)
+    rate = round(count / seconds) if seconds > 0 else count
+    kind = "completa" if full else "diferencial"
+    logger.info(
+        f"   ✅ Tabla '{table_name}' ({kind}): {count} registros, {deleted} borrados "
+        f"en {seconds:.2f}s ({rate} filas/s)."
+    )
+    return {
+        "mode": "full" if full else "diff", "rows": count, "deleted": deleted,
+        "seconds": round(seconds, 3), "rows_per_sec": rate,
+    }
+
+
 def backup_entire_database():
+    """Copia completa de NEON (Postgres) a SUPABASE."""
+    return backup_database("full")
+
+
+def backup_database(mode="auto"):
     """
-    Copia masiva de NEON (Postgres) a SUPABASE.
+    Respaldo de NEON (Postgres) a SUPABASE, tabla por tabla y en streaming.
+    mode: 'full' (copia todo), 'diff' (solo cambios desde la última marca) o
+    'auto' (diff, salvo que toque la copia completa periódica).
     """
     logger.info("==================================================")
-    logger.info("🚀 INICIANDO RESPALDO DE BASE DE DATOS (NEON -> SUPABASE)")
+    logger.info(f"🚀 INICIANDO RESPALDO DE BASE DE DATOS (NEON -> SUPABASE, modo {mode})")
     logger.info("==================================================")
 
     # --- 3. OBTENER VARIABLES ---
     # Usamos los nombres exactos que tienes en tu .env
-    NEON_URL = os.getenv('POSTGRES_URL')       
-    SUPABASE_URL = os.getenv('SUPABASE_DB_URL') 
+    NEON_URL = os.getenv('POSTGRES_URL')
+    SUPABASE_URL = os.getenv('SUPABASE_DB_URL')
 
     # Diagnóstico de error específico
     if not NEON_URL:
         return {"success": False, "error": "Falta POSTGRES_URL en .env"}
     if not SUPABASE_URL:
         return {"success": False, "error": "Falta SUPABASE_DB_URL en .env"}
+    if mode not in ("auto", "full", "diff"):
+        return {"success": False, "error": f"Modo de respaldo desconocido: {mode}"}
 
-    # --- 4. CONFIGURAR MOTORES ---
-    session_source = None
-    session_dest = None
-    
     try:
-        # Motor Origen (Neon)
-        engine_source = create_engine(NEON_URL, pool_pre_ping=True)
-        SessionSource = sessionmaker(bind=engine_source)
-        session_source = SessionSource()
-
-        # Motor Destino (Supabase)
-        engine_dest = create_engine(SUPABASE_URL, pool_pre_ping=True)
-        SessionDest = sessionmaker(bind=engine_dest)
-        session_dest = SessionDest()
-        
-        logger.info("📡 Conexión establecida con ambas bases de datos.")
-
-        # --- 5. LÓGICA DE COPIA ---
-        stats = {}
-        
-        # Crear tablas en destino si no existen
+        # --- 4. CONFIGURAR MOTORES ---
+        engine_source = _get_engine(NEON_URL)   # Origen (Neon)
+        engine_dest = _get_engine(SUPABASE_URL)  # Destino (Supabase)
+
+        # Crear tablas en destino si no existen + mismas migraciones que Neon
         Base.metadata.create_all(engine_dest)
+        _state_meta.create_all(engine_dest)
+        run_migrations(engine_dest, "Supabase")
+
+        # --- 5. LÓGICA DE COPIA (una tabla por hilo) ---
+        # La marca nueva se toma ANTES de leer: lo que cambie durante la copia
+        # entra en la próxima corrida.
+        run_started = datetime.now(timezone.utc)
+        state = _load_state(engine_dest)
+        stats = {}
+        errors = {}
+        started = time.monotonic()
+        with _exported_snapshot(engine_source) as snapshot, \
+                ThreadPoolExecutor(max_workers=BACKUP_WORKERS, thread_name_prefix="backup") as pool:
+            futures = {
+                model.__tablename__: pool.submit(
+                    _backup_table, engine_source, engine_dest, model,
+                    state.get(model.__tablename__), mode, run_started, snapshot
+                )
+                for model in MODELS_TO_SYNC
+            }
+            for table_name, fut in futures.items():
+                try:
+                    stats[table_name] = fut.result()
+                except Exception as e:
+                    # Cada tabla es atómica: las demás quedan respaldadas igual
+                    logger.error(f"   ❌ Tabla '{table_name}': {e}")
+                    errors[table_name] = str(e)
+
+        all_full = not errors and all(s["mode"] == "full" for s in stats.values())
+        if all_full:
+            pruned = _prune_tombstones(engine_source, run_started - timedelta(seconds=BACKUP_DIFF_OVERLAP_SECONDS))
+            if pruned:
+                logger.info(f"   🧹 {pruned} tombstones antiguos eliminados.")
 
-        for ModelClass in MODELS_TO_SYNC:
-            table_name = ModelClass.__tablename__
-            
-            # A. Leer de Neon
-            source_data = session_source.query(ModelClass).all()
-            count = len(source_data)
-            
-            if count == 0:
-                # logger.info(f"   ⏩ Tabla '{table_name}' vacía. Saltando.")
-                continue
-
-            # B. Limpiar Supabase (Borrado total de la tabla)
-            session_dest.query(ModelClass).delete()
-            
-            # C. Copiar Datos (Desvincular -> Vincular)
-            for obj in source_data:
-                session_source.expunge(obj) # Desconectar de sesión A
-                make_transient(obj)         # Hacerlo "nuevo"
-                session_dest.add(obj)       # Conectar a sesión B
-
-            # D. Guardar cambios
-            session_dest.commit()
-            logger.info(f"   ✅ Tabla '{table_name}': {count} registros copiados.")
-            stats[table_name] = count
-
-        final_msg = "✨ Respaldo completado exitosamente."
+        total_rows = sum(s["rows"] for s in stats.values())
+        total_deleted = sum(s["deleted"] for s in stats.values())
+        final_msg = (f"✨ Respaldo completado: {total_rows} registros, {total_deleted} borrados "
+                     f"en {time.monotonic() - started:.1f}s.")
         logger.info(final_msg)
-        
-        return {"success": True, "stats": stats, "msg": final_msg}
+
+        result_mode = "full" if all(s["mode"] == "full" for s in stats.values()) else "diff"
+        if errors:
+            error_msg = f"Falló el respaldo de: {', '.join(errors)}"
+            logger.error(f"❌ {error_msg}")
+            return {"success": False, "mode": result_mode, "stats": stats, "errors": errors, "error": error_msg}
+        return {"success": True, "mode": result_mode, "stats": stats, "msg": final_msg}
 
     except Exception as e:
-        if session_dest:
-            session_dest.rollback()
         logger.error(f"❌ Error crítico en respaldo: {e}")
         return {"success": False, "error": str(e)}
-        
-    finally:
-        if session_source: session_source.close()
-        if session_dest: session_dest.close()
\ No newline at end of file
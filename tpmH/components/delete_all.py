@@ -2,7 +2,6 @@ from nicegui import ui, app
 import logging
 # --- IMPORTS ACTUALIZADOS ---
 from db.postgres_db import PostgresSession  # Fuente de la verdad (Neon)
-from db.sqlite_db import BackupSession       # Respaldo (SQLite)
 from db.models import User, SchedulePref, AsignedClasses
 # ----------------------------
 
@@ -72,22 +71,7 @@ def delete_user_data():
     finally:
         pg_session.close()
 
-    # ================= FASE 2: BORRAR DE SQLITE (RESPALDO) =================
-    # Solo llegamos aquí si la Fase 1 fue exitosa.
-    try:
-        sqlite_session = BackupSession()
-
-        sqlite_session.query(AsignedClasses).filter(AsignedClasses.username == username).delete()
-        sqlite_session.query(SchedulePref).filter(SchedulePref.username == username).delete()
-        sqlite_session.query(User).filter(User.username == username).delete()
-
-        sqlite_session.commit()
-        logger.info(f"🗑️ Copia local de {username} eliminada.")
-        sqlite_session.close()
-
-    except Exception as e:
-        # Si falla el backup local, no es grave. El usuario ya no puede entrar porque lo borramos de Neon.
-        logger.warning(f"⚠️ Error limpiando backup local: {e}")
+    # El borrado en backup_local.sqlite lo replica el outbox (db/replication.py).
 
     # ================= LIMPIAR SESIÓN Y SALIR =================
     app.storage.user.clear()
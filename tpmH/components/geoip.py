@@ -0,0 +1,285 @@
+import asyncio
+import bisect
+import csv
+import ipaddress
+import logging
+import os
+import threading
+from array import array
+
+import httpx
+
+from components.query_cache import QueryCache
+
+logger = logging.getLogger(__name__)
+
+# =====================================================
+# ZONA HORARIA POR IP (GEOIP LOCAL + RESPALDO REMOTO)
+# =====================================================
+# Antes cada alta consultaba https://ip.guide con un AsyncClient nuevo (hasta
+# 3s de espera si el servicio estaba lento) y guardaba el resultado en un
+# dict que crecía con cada IP distinta.
+#
+# Ahora se prueban, en orden, los resolvedores configurados:
+# 1. GEOIP_MMDB_PATH: base MaxMind/DB-IP (.mmdb). Necesita el paquete
+#    opcional `maxminddb`; si no está instalado se omite.
+# 2. GEOIP_CSV_PATH: rangos de IP en CSV, cargados en memoria y buscados con
+#    búsqueda binaria. Columnas aceptadas (con encabezado):
+#      - network,time_zone               (CIDR, ej: 1.2.3.0/24)
+#      - start_ip,end_ip,time_zone       (IPs o enteros)
+#      - network,geoname_id,...          (GeoLite2-City-Blocks) + GEOIP_LOCATIONS_CSV
+#        (GeoLite2-City-Locations, columnas geoname_id,time_zone)
+# 3. ip.guide, con un único cliente HTTP compartido (keep-alive) y timeout
+#    corto. GEOIP_REMOTE_FALLBACK:
+#      - "auto" (por defecto): solo si no hay fuente local configurada, así
+#        la detección funciona sin archivos y no sale a la red si los hay.
+#      - "1": siempre, después de las fuentes locales.  "0": nunca.
+#
+# Para no depender de ip.guide, en el despliegue:
+#   - descargar "IP to City Lite" de DB-IP (CSV, licencia CC BY 4.0) o las
+#     tablas GeoLite2-City (Blocks + Locations) de MaxMind,
+#   - dejarlas en un disco persistente y apuntar GEOIP_CSV_PATH (y
+#     GEOIP_LOCATIONS_CSV con GeoLite2) o GEOIP_MMDB_PATH a esos archivos.
+#
+# Los aciertos se guardan en una caché LRU + TTL acotada.
+
+GEOIP_MMDB_PATH = os.getenv("GEOIP_MMDB_PATH")
+GEOIP_CSV_PATH = os.getenv("GEOIP_CSV_PATH")
+GEOIP_LOCATIONS_CSV = os.getenv("GEOIP_LOCATIONS_CSV")
+GEOIP_REMOTE_FALLBACK = os.getenv("GEOIP_REMOTE_FALLBACK", "auto").lower()
+GEOIP_REMOTE_TIMEOUT = float(os.getenv("GEOIP_REMOTE_TIMEOUT", "2.0"))
+GEOIP_CACHE_SIZE = int(os.getenv("GEOIP_CACHE_SIZE", "10000"))
+GEOIP_CACHE_TTL_SECONDS = int(os.getenv("GEOIP_CACHE_TTL_SECONDS", "86400"))
+
+DEFAULT_TIMEZONE = "UTC"
+
+
+# --- ÍNDICE DE RANGOS (CSV) ---
+class RangeIndex:
+    """Rangos [inicio, fin] de IPs -> zona horaria, ordenados para búsqueda binaria."""
+
+    def __init__(self):
+        # IPv4 en arrays compactos; IPv6 (128 bits) en listas de int
+        self._v4 = (array('Q'), array('Q'), array('I'))
+        self._v6 = ([], [], array('I'))
+        self._zones = []
+
+    def __len__(self):
+        return len(self._v4[0]) + len(self._v6[0])
+
+    @classmethod
+    def from_ranges(cls, ranges):
+        """`ranges`: iterable de (inicio, fin, zona) con inicio/fin como ipaddress o int."""
+        index = cls()
+        zone_ids = {}
+        rows = {4: [], 6: []}
+        for start, end, tz in ranges:
+            if not tz:
+                continue
+            start, end = ipaddress.ip_address(start), ipaddress.ip_address(end)
+            rows[start.version].append((int(start), int(end), zone_ids.setdefault(tz, len(zone_ids))))
+        index._zones = list(zone_ids)
+        for version, (starts, ends, zones) in ((4, index._v4), (6, index._v6)):
+            for start, end, zone in sorted(rows[version]):
+                starts.append(start)
+                ends.append(end)
+                zones.append(zone)
+        return index
+
+    @classmethod
+    def from_csv(cls, path, locations_path=None):
+        locations = {}
+        if locations_path:
+            with open(locations_path, newline='', encoding='utf-8') as f:
+                locations = {r['geoname_id']: r.get('time_zone') for r in csv.DictReader(f)}
+
+        def ranges():
+            with open(path, newline='', encoding='utf-8') as f:
+                for r in csv.DictReader(f):
+                    tz = r.get('time_zone') or locations.get(r.get('geoname_id'))
+                    if r.get('network'):
+                        net = ipaddress.ip_network(r['network'], strict=False)
+                        yield net.network_address, net.broadcast_address, tz
+                    else:
+                        yield _parse_ip(r['start_ip']), _parse_ip(r['end_ip']), tz
+
+        return cls.from_ranges(ranges())
+
+    def lookup(self, ip):
+        addr = ipaddress.ip_address(ip)
+        starts, ends, zones = self._v4 if addr.version == 4 else self._v6
+        value = int(addr)
+        pos = bisect.bisect_right(starts, value) - 1
+        if pos >= 0 and value <= ends[pos]:
+            return self._zones[zones[pos]]
+        return None
+
+
+def _parse_ip(value):
+    value = value.strip()
+    return int(value) if value.isdigit() else ipaddress.ip_address(value)
+
+
+# --- RESOLVEDORES ---
+class CsvResolver:
+    name = "csv"
+
+    def __init__(self, path, locations_path=None):
+        self.path = path
+        self.locations_path = locations_path
+        self._index = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._index is None:
+                self._index = RangeIndex.from_csv(self.path, self.locations_path)
+                logger.info(f"🌍 GeoIP CSV cargado: {len(self._index)} rangos ({self.path}).")
+            return self._index
+
+    async def resolve(self, ip):
+        index = self._index
+        if index is None:
+            # La primera carga puede tardar (archivo grande): fuera del loop
+            index = await asyncio.to_thread(self._load)
+        return index.lookup(ip)
+
+
+class MmdbResolver:
+    name = "mmdb"
+
+    def __init__(self, path):
+        import maxminddb  # dependencia opcional
+        self._reader = maxminddb.open_database(path)
+        logger.info(f"🌍 GeoIP MMDB abierto: {path}")
+
+    async def resolve(self, ip):
+        record = self._reader.get(ip) or {}
+        return (record.get('location') or {}).get('time_zone')
+
+    def close(self):
+        self._reader.close()
+
+
+class IpGuideResolver:
+    """ip.guide sobre un único AsyncClient compartido."""
+    name = "ip.guide"
+
+    def __init__(self, timeout=GEOIP_REMOTE_TIMEOUT):
+        self.timeout = timeout
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url="https://ip.guide",
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=10, max_keepalive_connections=5),
+            )
+        return self._client
+
+    async def resolve(self, ip):
+        response = await self._get_client().get(f"/{ip}")
+        if response.status_code != 200:
+            logger.warning(f"ip.guide retornó status {response.status_code}")
+            return None
+        data = response.json()
+        # Si no está en location, intentamos en la raíz por si acaso
+        return (data.get('location') or {}).get('timezone') or data.get('timezone')
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class TimezoneResolver:
+    """Prueba cada resolvedor en orden; guarda los aciertos en una caché LRU + TTL."""
+
+    def __init__(self, resolvers, cache=None):
+        self.resolvers = list(resolvers)
+        self.cache = cache or QueryCache(maxsize=GEOIP_CACHE_SIZE, ttl_seconds=GEOIP_CACHE_TTL_SECONDS)
+
+    async def resolve(self, ip):
+        """Zona horaria de `ip` o None si ningún resolvedor la conoce."""
+        key = ("ip", ip)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        for resolver in self.resolvers:
+            try:
+                tz = await resolver.resolve(ip)
+            except Exception as e:
+                logger.error(f"Error en GeoIP {resolver.name}: {e}")
+                continue
+            if tz:
+                self.cache.set(key, tz)
+                return tz
+        return None
+
+    async def close(self):
+        for resolver in self.resolvers:
+            close = getattr(resolver, "close", None)
+            if close is None:
+                continue
+            result = close()
+            if asyncio.iscoroutine(result):
+                await result
+
+
+def _build_resolvers():
+    resolvers = []
+    if GEOIP_MMDB_PATH:
+        try:
+            resolvers.append(MmdbResolver(GEOIP_MMDB_PATH))
+        except ImportError:
+            logger.warning("⚠️ GEOIP_MMDB_PATH definido pero falta el paquete 'maxminddb'; se omite.")
+        except Exception as e:
+            logger.error(f"❌ No se pudo abrir {GEOIP_MMDB_PATH}: {e}")
+    if GEOIP_CSV_PATH:
+        resolvers.append(CsvResolver(GEOIP_CSV_PATH, GEOIP_LOCATIONS_CSV))
+    if GEOIP_REMOTE_FALLBACK == "1" or (GEOIP_REMOTE_FALLBACK == "auto" and not resolvers):
+        if not resolvers:
+            logger.info("🌍 GeoIP sin fuente local: se usa ip.guide.")
+        resolvers.append(IpGuideResolver())
+    if not resolvers:
+        logger.warning("⚠️ GeoIP sin fuentes (GEOIP_REMOTE_FALLBACK=0): las altas usan UTC.")
+    return resolvers
+
+
+_resolver = None
+
+
+def get_resolver():
+    global _resolver
+    if _resolver is None:
+        _resolver = TimezoneResolver(_build_resolvers())
+    return _resolver
+
+
+def set_resolver(resolver):
+    """Reemplaza el resolvedor global (ej: uno armado con RangeIndex.from_ranges)."""
+    global _resolver
+    _resolver = resolver
+
+
+def _is_local(ip):
+    try:
+        addr = ipaddress.ip_address(ip)
+    except ValueError:
+        return ip == 'localhost'
+    return addr.is_loopback or addr.is_private or addr.is_link_local
+
+
+async def resolve_timezone(ip_address):
+    """Zona horaria para `ip_address`, o 'UTC' si es local o nadie la conoce."""
+    if not ip_address or _is_local(ip_address):
+        logger.warning("IP local detectada, usando UTC por defecto.")
+        return DEFAULT_TIMEZONE
+    return await get_resolver().resolve(ip_address) or DEFAULT_TIMEZONE
+
+
+async def close_geoip():
+    """Cierra el cliente HTTP / la base mmdb (app.on_shutdown)."""
+    if _resolver is not None:
+        await _resolver.close()
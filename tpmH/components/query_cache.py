@@ -0,0 +1,109 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# =====================================================
+# CACHÉ DE CONSULTAS (LRU + TTL, POR PARÁMETROS)
+# =====================================================
+# Guarda resultados de consultas pesadas bajo una clave armada con sus
+# parámetros: (espacio, filtro1, filtro2, ...). Varias combinaciones de
+# filtros conviven a la vez, así que volver a un alumno ya consultado no
+# va a la BD.
+#
+# Se invalida sola al confirmar cualquier sesión de Neon que toque clases o
+# usuarios (components/cache_invalidation.py). La caché de disponibilidad
+# (components/availability.py) usa esta misma clase.
+# El TTL es solo una red de seguridad para cambios hechos fuera de la app.
+
+
+class QueryCache:
+    """Caché en proceso, acotada a `maxsize` entradas (se descarta la menos usada)."""
+
+    def __init__(self, maxsize=64, ttl_seconds=600):
+        self.maxsize = maxsize
+        self.ttl = ttl_seconds
+        self._entries = OrderedDict()  # clave -> (guardado_en, valor)
+        self._lock = threading.Lock()
+        # Se incrementa en cada invalidación: una carga que empezó antes de
+        # una escritura no se guarda (ver set()).
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def get(self, key):
+        """Retorna el valor guardado o None si no está o expiró."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def __contains__(self, key):
+        """¿Hay una entrada vigente? (no cuenta como hit/miss)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and time.monotonic() - entry[0] < self.ttl
+
+    def set(self, key, value, generation=None):
+        """
+        Guarda `value`. Si se pasa `generation` (leída con .generation antes de
+        consultar la BD) y hubo una invalidación desde entonces, se descarta.
+        """
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return False
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            return True
+
+    def invalidate(self, namespace=None):
+        """Borra las entradas de un espacio (primer elemento de la clave) o todas."""
+        if namespace is None:
+            with self._lock:
+                self._generation += 1
+                self._entries.clear()
+            logger.info("Caché de consultas invalidada: todo")
+        else:
+            self.invalidate_namespaces([namespace])
+
+    def invalidate_namespaces(self, namespaces):
+        """Borra las entradas de varios espacios con una sola invalidación."""
+        namespaces = set(namespaces)
+        with self._lock:
+            self._generation += 1
+            for key in [k for k in self._entries if k[0] in namespaces]:
+                del self._entries[key]
+        logger.info(f"Caché de consultas invalidada: {sorted(map(str, namespaces))}")
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+            }
+
+
+# Consultas de clases del panel admin (compartida entre pestañas/sesiones)
+class_query_cache = QueryCache()
+
+
+def invalidate_class_queries():
+    """Lo llama el hook de commit; a mano solo para escrituras fuera de PostgresSession."""
+    class_query_cache.invalidate()
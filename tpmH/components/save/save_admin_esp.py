@@ -2,7 +2,6 @@ from nicegui import ui, app
 import logging
 # --- IMPORTS ARQUITECTURA HÍBRIDA ---
 from db.postgres_db import PostgresSession  # Fuente de la verdad
-from db.sqlite_db import BackupSession       # Respaldo
 from db.models import ScheduleProfEsp, User
 # ------------------------------------
 
@@ -121,34 +120,6 @@ def create_save_asgn_classes_admin(button, user, table, avai, days_of_week):
         finally:
             pg_session.close()
 
-        # =========================================================
-        # FASE 2: GUARDAR EN SQLITE (RESPALDO)
-        # =========================================================
-        try:
-            sq_session = BackupSession()
-            
-            # Replicar la inserción
-            for item in items_to_save:
-                new_entry_sq = ScheduleProfEsp(
-                    username=item['username'],
-                    name=user_name,
-                    surname=user_surname,
-                    avai=item['avai'],
-                    date=item['date'],
-                    days=item['days'],
-                    start_time=item['start_time'],
-                    end_time=item['end_time']
-                )
-                sq_session.add(new_entry_sq)
-
-            sq_session.commit()
-            logger.info("💾 Respaldo Admin Esp guardado en SQLITE")
-
-        except Exception as e:
-            logger.warning(f"⚠️ Error backup local Admin Esp: {e}")
-        finally:
-            sq_session.close()
-
         ui.notify("Información guardada correctamente", type="positive")
 
     button.on("click", save_tables_to_db)
@@ -2,7 +2,6 @@ from nicegui import ui, app
 import logging
 # --- IMPORTS DE ARQUITECTURA HÍBRIDA ---
 from db.postgres_db import PostgresSession  # Fuente de la verdad
-from db.sqlite_db import BackupSession       # Respaldo
 from db.models import User, ScheduleProf  # OJO: Usamos ScheduleProf aquí
 # ---------------------------------------
 
@@ -116,36 +115,6 @@ def create_save_schedule_admin_button(button, table, days_of_week, availability)
         finally:
             pg_session.close()
 
-        # =========================================================
-        # FASE 2: GUARDAR EN SQLITE (RESPALDO)
-        # =========================================================
-        try:
-            sq_session = BackupSession()
-            
-            # A. Limpiar
-            sq_session.query(ScheduleProf).filter(ScheduleProf.username == username).delete()
-
-            # B. Insertar
-            for item in new_schedules:
-                prof_entry_sq = ScheduleProf(
-                    username=username,
-                    name=user_name,
-                    surname=user_surname,
-                    availability=item['availability'],
-                    days=item['days'],
-                    start_time=item['start_time'],
-                    end_time=item['end_time']
-                )
-                sq_session.add(prof_entry_sq)
-
-            sq_session.commit()
-            logger.info("💾 Respaldo Admin guardado en SQLITE")
-
-        except Exception as e:
-            logger.warning(f"⚠️ Error backup local Admin: {e}")
-        finally:
-            sq_session.close()
-
         ui.notify("Horarios de Profesor actualizados con éxito", type="positive")
 
     button.on('click', save_admin_rgo_schedule)
@@ -5,7 +5,7 @@ from datetime import datetime, timedelta
 
 # --- IMPORTS BASE DE DATOS ---
 from db.postgres_db import PostgresSession
-from db.sqlite_db import BackupSession
+from sqlalchemy.exc import IntegrityError
 from db.models import AsignedClasses, User
 from components.share_data import *
 
@@ -109,7 +109,7 @@ def create_save_asgn_classes(button, user, table_clases, table_rangos, duration_
                     end_int_stu = start_int_stu + (duration_minutes // 60 * 100) # Fallback básico
 
                 # D. USAR TU FUNCIÓN IMPORTADA PARA CALCULAR HORA PROFESORA
-                # Esta función usa TEACHER_TIMEZONE="America/Caracas" internamente
+                # Esta función usa la zona del admin (get_prof_timezone) internamente
                 prof_start, prof_end, prof_date = convert_student_to_teacher(
                     fecha, 
                     start_int_stu, 
@@ -178,28 +178,14 @@ def create_save_asgn_classes(button, user, table_clases, table_rangos, duration_
             ui.notify("Clases guardadas correctamente", type="positive")
             logger.info("✅ Guardado exitoso.")
 
+        except IntegrityError:
+            pg_session.rollback()
+            ui.notify("El alumno ya tiene una clase activa en alguno de esos horarios.", type="warning")
         except Exception as e:
             pg_session.rollback()
             ui.notify(f"Error guardando: {e}", type="negative")
         finally:
             pg_session.close()
 
-        # 4. Backup SQLite (Opcional, misma lógica)
-        try:
-            sq = BackupSession()
-            for i, item in enumerate(clases_data):
-                class_num = current_count + i + 1
-                count_str = f"{class_num}/{limit_int}" if limit_int > 0 else f"{class_num}"
-                sq.add(AsignedClasses(
-                    username=item['username'], name=item['name'], surname=item['surname'],
-                    date=item['date'], start_time=item['start_time'], end_time=item['end_time'],
-                    date_prof=item['date_prof'], start_prof_time=item['start_prof_time'], end_prof_time=item['end_prof_time'],
-                    duration=item['duration'], days=item['days'], package=item['package'],
-                    status="Pendiente", total_classes=0, class_count=count_str, payment_info={}
-                ))
-            sq.commit()
-            sq.close()
-        except: pass
-
     button.on("click", save_tables_to_db)
     return save_tables_to_db
\ No newline at end of file
@@ -1,15 +1,7 @@
 from nicegui import ui, app
 import logging
-# --- IMPORTS (Asegúrate de que coincidan con tus nombres de archivo reales) ---
-# Si tus archivos se llaman postgress.py y sqlite.py, ajusta esto.
-try:
-    from db.postgres_db import PostgresSession
-    from db.sqlite_db import BackupSession
-except ImportError:
-    # Fallback por si usas los nombres del snippet anterior
-    from db.postgres_db import PostgresSession
-    from db.sqlite_db import BackupSession
-
+# --- IMPORTS ---
+from db.postgres_db import PostgresSession
 from db.models import User, SchedulePref
 # ----------------------------------------
 
@@ -143,39 +135,6 @@ def create_save_schedule_button(button, table, days_of_week, duration_selector,
         finally:
             pg_session.close()
 
-        # =========================================================
-        # FASE 2: GUARDAR EN SQLITE (RESPALDO)
-        # =========================================================
-        try:
-            sq_session = BackupSession()
-            
-            user_sq = sq_session.query(User).filter(User.username == username).first()
-            if user_sq:
-                user_sq.package = package_val
-
-            sq_session.query(SchedulePref).filter(SchedulePref.username == username).delete()
-
-            for item in new_schedules:
-                pref_sq = SchedulePref(
-                    username=username,
-                    name=user_name,
-                    surname=user_surname,
-                    duration=duration_val,
-                    days=item['days'],
-                    start_time=item['start_time'],
-                    end_time=item['end_time'],
-                    package=package_val
-                )
-                sq_session.add(pref_sq)
-
-            sq_session.commit()
-            logger.info("💾 Respaldo local actualizado")
-            
-        except Exception as e:
-            logger.warning(f"⚠️ Error en respaldo local: {e}")
-        finally:
-            sq_session.close()
-
         ui.notify("Horarios actualizados correctamente (Sin duplicados)", type="positive")
 
     button.on('click', save_schedule)
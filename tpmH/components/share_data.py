@@ -5,6 +5,8 @@ days_of_week = ['Lunes','Martes','Miércoles','Jueves','Viernes','Sábado','Domi
 duration_options = ['30 minutos', '1 hora']
 availability_options = ['Ocupado', 'Libre']
 pack_of_classes = ["Básico", "Personalizado", "Intensivo", "Flexible"]
+# Clases por dar: las únicas que ocupan el horario de la profesora
+ACTIVE_STATUSES = ('Pendiente', 'Prueba_Pendiente')
 goals_list = [
     "Mantener conversaciones básicas sobre temas cotidianos",
     "Mejorar la pronunciación y la fluidez al hablar",
@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import os
+import random
+import time
+
+from auth.sync_cal import sync_google_calendar_logic
+from auth.calendar_watch import ensure_watch_channel, push_enabled
+from components.db_migration import backup_database
+
+logger = logging.getLogger(__name__)
+
+# =====================================================
+# PLANIFICADOR DE SYNC Y RESPALDO (TAREA DE FONDO)
+# =====================================================
+# Antes el sync con Google lo disparaba abrir /admin (con IS_SYNCING /
+# LAST_SYNC_TIME como candado) y el botón de /myclassesAdmin por separado:
+# dependía de qué páginas se abrieran y las dos entradas no compartían candado.
+#
+# Ahora cada trabajo corre en su propio ciclo (iniciado en app.on_startup)
+# cada `interval` segundos + un desfase aleatorio de hasta `jitter`.
+# Los pedidos manuales ("Sincronizar ahora") se agrupan: si llegan varios
+# mientras un trabajo corre, todos esperan UNA sola corrida extra.
+#
+# Con notificaciones push (CALENDAR_WEBHOOK_URL) cada aviso de Google pide
+# una corrida del sync; el ciclo periódico queda como red de seguridad cada
+# CALENDAR_PUSH_POLL_SECONDS y el trabajo 'calendar_watch' renueva el canal.
+
+CALENDAR_SYNC_INTERVAL_SECONDS = int(os.getenv("CALENDAR_SYNC_INTERVAL_SECONDS", "3600"))
+CALENDAR_SYNC_JITTER_SECONDS = int(os.getenv("CALENDAR_SYNC_JITTER_SECONDS", "120"))
+CALENDAR_PUSH_POLL_SECONDS = int(os.getenv("CALENDAR_PUSH_POLL_SECONDS", "21600"))
+CALENDAR_WATCH_CHECK_SECONDS = int(os.getenv("CALENDAR_WATCH_CHECK_SECONDS", "21600"))
+# Diferencial cada hora; la copia completa la decide db_migration (BACKUP_FULL_INTERVAL_SECONDS)
+BACKUP_INTERVAL_SECONDS = int(os.getenv("BACKUP_INTERVAL_SECONDS", "3600"))
+BACKUP_JITTER_SECONDS = int(os.getenv("BACKUP_JITTER_SECONDS", "600"))
+
+
+class PeriodicJob:
+    """Un trabajo bloqueante que corre en un hilo cada `interval` (+ jitter) segundos o a pedido."""
+
+    def __init__(self, name, fn, interval, jitter=0, run_on_start=True):
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self.jitter = jitter
+        self.run_on_start = run_on_start
+        self._task = None
+        self._wake = None
+        self._waiters = []
+        # Estado visible (panel admin / logs)
+        self.running = False
+        self.runs = 0
+        self.last_started_at = None
+        self.last_duration = None
+        self.last_result = None
+        self.last_error = None
+        self.next_run_at = None
+
+    def _delay(self, base):
+        return base + random.uniform(0, self.jitter)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._loop(), name=f"job-{self.name}")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for fut in self._waiters:
+            if not fut.done():
+                fut.cancel()
+        self._waiters = []
+
+    def request_run(self):
+        """Pide una corrida lo antes posible. Retorna un Future con el resultado de esa corrida."""
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        self.start()
+        self._wake.set()
+        return fut
+
+    async def run_now(self):
+        """Pide una corrida y espera su resultado (lanza la excepción si falló)."""
+        return await self.request_run()
+
+    async def _loop(self):
+        delay = self._delay(0) if self.run_on_start else self._delay(self.interval)
+        while True:
+            self.next_run_at = time.time() + delay
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            # Todos los pedidos que llegaron hasta ahora comparten esta corrida
+            waiters, self._waiters = self._waiters, []
+            await self._run_once(waiters)
+            delay = self._delay(self.interval)
+
+    async def _run_once(self, waiters):
+        self.running = True
+        self.last_started_at = time.time()
+        started = time.monotonic()
+        result, error = None, None
+        failure = None
+        try:
+            result = await asyncio.to_thread(self.fn)
+            # Los trabajos reportan sus fallos como {"success": False, "error": ...}
+            # sin lanzar: también cuentan como corrida fallida
+            if isinstance(result, dict) and result.get("success") is False:
+                failure = result.get("error") or result.get("msg") or "success=False"
+                logger.error(f"❌ [{self.name}] Falló: {failure}")
+        except Exception as e:
+            error = e
+            failure = str(e)
+            logger.error(f"❌ [{self.name}] Falló: {e}")
+        finally:
+            self.running = False
+            self.runs += 1
+            self.last_duration = round(time.monotonic() - started, 3)
+            self.last_result = result
+            self.last_error = failure
+        logger.info(f"⏱️ [{self.name}] Terminó en {self.last_duration}s.")
+
+        for fut in waiters:
+            if fut.done():
+                continue
+            if error is not None:
+                fut.set_exception(error)
+            else:
+                fut.set_result(result)
+        for listener in list(_listeners):
+            try:
+                await listener(self)
+            except Exception as e:
+                logger.warning(f"⚠️ [{self.name}] Listener falló: {e}")
+
+    def status(self):
+        return {
+            "running": self.running,
+            "runs": self.runs,
+            "last_started_at": self.last_started_at,
+            "last_duration": self.last_duration,
+            "last_result": self.last_result,
+            "last_error": self.last_error,
+            "next_run_at": self.next_run_at,
+        }
+
+
+# --- TRABAJOS ---
+_jobs = {}
+_listeners = []
+
+
+def _calendar_sync():
+    return sync_google_calendar_logic(os.getenv('CALENDAR_ID'))
+
+
+def _calendar_watch():
+    return ensure_watch_channel(os.getenv('CALENDAR_ID'))
+
+
+def _build_jobs():
+    if not _jobs:
+        if os.getenv('CALENDAR_ID'):
+            interval = CALENDAR_SYNC_INTERVAL_SECONDS
+            if push_enabled():
+                interval = max(interval, CALENDAR_PUSH_POLL_SECONDS)
+                _jobs["calendar_watch"] = PeriodicJob("calendar_watch", _calendar_watch, CALENDAR_WATCH_CHECK_SECONDS)
+            _jobs["calendar"] = PeriodicJob("calendar", _calendar_sync, interval, CALENDAR_SYNC_JITTER_SECONDS)
+        else:
+            logger.warning("⚠️ Falta CALENDAR_ID: el sync con Google Calendar queda desactivado.")
+        _jobs["backup"] = PeriodicJob(
+            "backup", backup_database, BACKUP_INTERVAL_SECONDS, BACKUP_JITTER_SECONDS, run_on_start=False
+        )
+    return _jobs
+
+
+def get_job(name):
+    """Retorna el trabajo `name` ('calendar' / 'calendar_watch' / 'backup') o None si no está configurado."""
+    return _build_jobs().get(name)
+
+
+def request_calendar_sync(calendar_id):
+    """
+    Pide un sync incremental de `calendar_id` (ej: desde una notificación push).
+    Retorna el Future de la corrida, o None si ese calendario no se sincroniza aquí.
+    """
+    job = get_job("calendar")
+    if job is None or calendar_id != os.getenv('CALENDAR_ID'):
+        return None
+    return job.request_run()
+
+
+def add_listener(callback):
+    """Registra `async callback(job)` que se llama al terminar cada corrida."""
+    _listeners.append(callback)
+
+
+def scheduler_status():
+    return {name: job.status() for name, job in _build_jobs().items()}
+
+
+async def start_scheduler():
+    for job in _build_jobs().values():
+        job.start()
+    logger.info(f"🗓️ Planificador iniciado: {', '.join(_jobs)}.")
+
+
+async def stop_scheduler():
+    for job in _jobs.values():
+        await job.stop()
@@ -1,30 +1,143 @@
-from datetime import datetime, timedelta
-from db.postgres_db import PostgresSession
-# ---------------------------------------------------------------
-from db.models import User, ScheduleProf, AsignedClasses, ScheduleProfEsp
+from array import array
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from db.class_times import get_prof_timezone
 from zoneinfo import ZoneInfo
 import logging
-import httpx
+from components.geoip import resolve_timezone
 
-# Configura aquí la zona horaria base de la profesora
-session = PostgresSession()
-teacher = session.query(User).filter(User.role == 'admin').first()
-TEACHER_TIMEZONE = teacher.time_zone if teacher and teacher.time_zone else "America/Caracas"
-
-
-TEACHER_TIMEZONE = "America/Caracas" 
+# La zona horaria base de la profesora es la del admin: get_prof_timezone()
+# la lee de la BD la primera vez que se usa (no al importar) y la guarda.
+# editAdminProfile la refresca cuando el admin la cambia.
 
 # Logger local
 logger = logging.getLogger(__name__)
 
+# =====================================================
+# CONVERSIÓN POR LOTES (HHMM -> HHMM ENTRE ZONAS)
+# =====================================================
+# Antes cada slot creaba ZoneInfo, hacía strptime de un string armado y
+# strftime del resultado. Ahora se trabaja en minutos: el desfase UTC de una
+# zona es constante salvo en el cambio de horario (DST), así que por cada
+# (zona, fecha) se calculan una vez los tramos [(desde_minuto, desfase)] y se
+# guardan en una caché acotada. Convertir un slot es una suma.
+#
+# Los tramos reproducen lo que hace datetime con fold=0 (horas inexistentes
+# o repetidas en el cambio de horario se resuelven igual que antes).
+
+TZ_OFFSET_CACHE_SIZE = 4096
+
+_DAY = 1440
+
+
 def to_int_time(dt_obj):
     """Convierte datetime a entero HHMM"""
-    return int(dt_obj.strftime("%H%M"))
+    return dt_obj.hour * 100 + dt_obj.minute
 
 def from_int_time(time_int):
     """Convierte entero HHMM a (hora, minuto)"""
-    s = str(time_int).zfill(4)
-    return int(s[:2]), int(s[2:])
+    time_int = int(time_int)
+    return time_int // 100, time_int % 100
+
+
+def _to_minutes(time_int):
+    h, m = from_int_time(time_int)
+    if not (0 <= h < 24 and 0 <= m < 60):
+        raise ValueError(f"Hora inválida: {time_int}")
+    return h * 60 + m
+
+
+def _offset_minutes(dt_obj):
+    return int(dt_obj.utcoffset().total_seconds() // 60)
+
+
+def _find_step(fn, lo, hi):
+    """Primer minuto en (lo, hi] donde fn cambia respecto de fn(lo) (búsqueda binaria)."""
+    first = fn(lo)
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if fn(mid) == first:
+            lo = mid
+        else:
+            hi = mid
+    return hi
+
+
+@lru_cache(maxsize=TZ_OFFSET_CACHE_SIZE)
+def _local_segments(tz_name, date_str):
+    """Desfase (min) de las horas locales de `date_str` en `tz_name`: ((desde_minuto, desfase), ...)."""
+    tz = ZoneInfo(tz_name)
+    midnight = datetime.strptime(date_str, "%Y-%m-%d")
+    offset_at = lambda minute: _offset_minutes((midnight + timedelta(minutes=minute)).replace(tzinfo=tz))
+    first, last = offset_at(0), offset_at(_DAY - 1)
+    if first == last:
+        return ((0, first),)
+    step = _find_step(offset_at, 0, _DAY - 1)
+    return ((0, first), (step, last))
+
+
+@lru_cache(maxsize=TZ_OFFSET_CACHE_SIZE)
+def _utc_segments(tz_name, date_str):
+    """
+    Desfase (min) de `tz_name` para los instantes entre el día anterior y el
+    siguiente a `date_str`, en minutos UTC desde las 00:00 UTC de esa fecha.
+    """
+    tz = ZoneInfo(tz_name)
+    midnight = datetime.strptime(date_str, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    offset_at = lambda minute: _offset_minutes((midnight + timedelta(minutes=minute)).astimezone(tz))
+    lo, hi = -_DAY, 2 * _DAY
+    first, last = offset_at(lo), offset_at(hi)
+    if first == last:
+        return ((lo, first),)
+    step = _find_step(offset_at, lo, hi)
+    return ((lo, first), (step, last))
+
+
+def _segment_offset(segments, minute):
+    offset = segments[0][1]
+    for start, seg_offset in segments:
+        if minute >= start:
+            offset = seg_offset
+    return offset
+
+
+def convert_slots(slots, date_str, from_tz, to_tz):
+    """
+    Convierte slots HHMM de la fecha `date_str` en `from_tz` a `to_tz`.
+    Retorna (horas, dias): dos array('i') paralelos con la hora HHMM en
+    `to_tz` y el corrimiento de fecha (-1, 0, +1) de cada slot.
+    Lanza ValueError/ZoneInfoNotFoundError si los datos no son válidos.
+    """
+    if from_tz == to_tz:
+        # Misma zona: la hora de reloj no cambia (igual que datetime.astimezone)
+        times = array('i')
+        for slot in slots:
+            _to_minutes(slot)  # valida
+            times.append(int(slot))
+        return times, array('i', [0] * len(times))
+
+    local = _local_segments(from_tz, date_str)
+    target = _utc_segments(to_tz, date_str)
+    single_local = local[0][1] if len(local) == 1 else None
+    single_target = target[0][1] if len(target) == 1 else None
+
+    times = array('i')
+    days = array('i')
+    for slot in slots:
+        minute = _to_minutes(slot)
+        utc_minute = minute - (single_local if single_local is not None else _segment_offset(local, minute))
+        out = utc_minute + (single_target if single_target is not None else _segment_offset(target, utc_minute))
+        day_shift, out = divmod(out, _DAY)
+        times.append((out // 60) * 100 + out % 60)
+        days.append(day_shift)
+    return times, days
+
+
+def _shift_date(date_str, days):
+    if not days:
+        return date_str
+    return (datetime.strptime(date_str, "%Y-%m-%d") + timedelta(days=days)).strftime("%Y-%m-%d")
+
 
 def convert_student_to_teacher(date_str, start_time_int, duration_mins, student_tz_str):
     """
@@ -37,23 +150,14 @@ def convert_student_to_teacher(date_str, start_time_int, duration_mins, student_
         if not student_tz_str:
             student_tz_str = "UTC" # Fallback por seguridad
 
-        # 1. Crear fecha/hora "aware" del estudiante
-        sh, sm = from_int_time(start_time_int)
-        dt_student_naive = datetime.strptime(f"{date_str} {sh}:{sm}", "%Y-%m-%d %H:%M")
-        dt_student = dt_student_naive.replace(tzinfo=ZoneInfo(student_tz_str))
-
-        # 2. Convertir a zona de profesora
-        dt_prof = dt_student.astimezone(ZoneInfo(TEACHER_TIMEZONE))
-        
-        # 3. Calcular fin de clase (en tiempo profesora para consistencia)
-        dt_prof_end = dt_prof + timedelta(minutes=duration_mins)
+        times, days = convert_slots((start_time_int,), date_str, student_tz_str, get_prof_timezone())
+        prof_start_int = times[0]
 
-        # 4. Formatear resultados
-        prof_start_int = to_int_time(dt_prof)
-        prof_end_int = to_int_time(dt_prof_end)
-        prof_date_str = dt_prof.strftime("%Y-%m-%d")
+        # Fin de clase en tiempo profesora (hora de reloj, como antes)
+        end_minutes = (_to_minutes(prof_start_int) + duration_mins) % _DAY
+        prof_end_int = (end_minutes // 60) * 100 + end_minutes % 60
 
-        return prof_start_int, prof_end_int, prof_date_str
+        return prof_start_int, prof_end_int, _shift_date(date_str, days[0])
 
     except Exception as e:
         logger.error(f"Error conversión zona horaria (S->T): {e}")
@@ -68,77 +172,25 @@ def get_slots_in_student_tz(teacher_slots, date_str, student_tz_str):
     Convierte una lista de slots (enteros) disponibles de la profesora 
     a la hora local del estudiante para mostrarlos en la grilla.
     """
-    student_slots = []
     try:
         if not student_tz_str:
             return teacher_slots # Si no tiene zona, mostramos la de la profe (o UTC)
 
-        teacher_tz = ZoneInfo(TEACHER_TIMEZONE)
-        student_tz = ZoneInfo(student_tz_str)
-
-        for slot in teacher_slots:
-            sh, sm = from_int_time(slot)
-            # Creamos el tiempo en zona profe
-            dt_prof = datetime.strptime(f"{date_str} {sh}:{sm}", "%Y-%m-%d %H:%M").replace(tzinfo=teacher_tz)
-            
-            # Convertimos a estudiante
-            dt_student = dt_prof.astimezone(student_tz)
-            
-            # Solo agregamos si sigue siendo el mismo día (opcional, depende de tu lógica de UI)
-            # Si permites ver horas de madrugada del día siguiente, quita este if
-            if dt_student.strftime("%Y-%m-%d") == date_str:
-                student_slots.append(to_int_time(dt_student))
-            
+        times, days = convert_slots(teacher_slots, date_str, get_prof_timezone(), student_tz_str)
+
+        # Solo los que siguen siendo el mismo día (opcional, depende de tu lógica de UI)
+        # Si permites ver horas de madrugada del día siguiente, quita este filtro
+        student_slots = {t for t, d in zip(times, days) if d == 0}
+
     except Exception as e:
         logger.error(f"Error conversión slots (T->S): {e}")
         return teacher_slots
         
-    return sorted(list(set(student_slots)))
-
-# --- NUEVO: Caché para guardar IPs y no consultar la API repetidamente ---
-_tz_cache = {}
+    return sorted(student_slots)
 
 async def get_timezone_from_ip(ip_address: str) -> str:
     """
-    Consulta asíncrona a ip.guide para detectar zona horaria.
-    Incluye caché y manejo de localhost.
-    Retorna la zona horaria (str) o 'UTC' si falla.
+    Zona horaria para la IP (GeoIP local con caché, ip.guide como respaldo).
+    Retorna la zona horaria (str) o 'UTC' si falla. Ver components/geoip.py.
     """
-    # 1. Verificar Caché
-    if ip_address in _tz_cache:
-        return _tz_cache[ip_address]
-
-    # 2. Verificar Localhost (GeoIP falla en local)
-    if not ip_address or ip_address in ('127.0.0.1', 'localhost', '::1'):
-        logger.warning("IP local detectada, usando UTC por defecto.")
-        return "UTC"
-
-    # 3. Consultar API
-    url = f"https://ip.guide/{ip_address}"
-    try:
-        async with httpx.AsyncClient(timeout=3.0) as client:
-            response = await client.get(url)
-            
-            if response.status_code == 200:
-                data = response.json()
-
-                logger.info(f"RESPUESTA IP.GUIDE: {data}")
-
-                location = data.get('location', {})
-                detected_tz = location.get('timezone')
-                
-                # Si no está en location, intentamos en la raíz por si acaso
-                if not detected_tz:
-                    detected_tz = data.get('timezone')
-
-                if detected_tz:
-                    _tz_cache[ip_address] = detected_tz
-                    return detected_tz
-            
-            logger.warning(f"ip.guide retornó status {response.status_code}")
-
-    except Exception as e:
-        logger.error(f"Error conectando con ip.guide: {e}")
-
-    # Fallback si todo falla
-    return "UTC"
\ No newline at end of file
+    return await resolve_timezone(ip_address)
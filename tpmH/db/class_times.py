@@ -0,0 +1,160 @@
+import logging
+import os
+import threading
+import time as _time
+from datetime import datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import event, select
+
+from .models import AsignedClasses, User
+
+logger = logging.getLogger(__name__)
+
+# =====================================================
+# INSTANTES UTC DE LAS CLASES (start_at / end_at)
+# =====================================================
+# date_prof ('YYYY-MM-DD') + start_prof_time/end_prof_time (HHMM) siguen
+# existiendo para las pantallas, pero para comparar "¿ya pasó?" o filtrar
+# por rango se usan start_at/end_at (timestamptz, indexados).
+#
+# Se rellenan solos en cada INSERT/UPDATE de AsignedClasses (ver listener
+# abajo) y la migración 0003 los calcula para las filas existentes.
+
+# Zona de la profesora en la que se guardan date_prof / *_prof_time: la del
+# usuario admin (User.time_zone). Se lee de la BD la primera vez que se
+# necesita (no al importar) y queda en memoria; editAdminProfile llama a
+# refresh_prof_timezone() cuando el admin la cambia.
+DEFAULT_PROF_TIMEZONE = os.getenv("PROF_TIMEZONE", "America/Caracas")
+# Si la BD no respondió se usa la zona por defecto y se reintenta pasado este tiempo
+PROF_TIMEZONE_RETRY_SECONDS = 300
+
+_prof_tz_lock = threading.Lock()
+_prof_tz = None            # (zona, expira_en o None si no expira)
+
+
+def _valid_timezone(tz_name):
+    try:
+        ZoneInfo(tz_name)
+        return True
+    except Exception:
+        return False
+
+
+def read_prof_timezone(conn):
+    """
+    Zona del admin (primer usuario con rol admin) leída con `conn`
+    (Connection o Session). None si no hay admin o su zona no es válida.
+    La usan get_prof_timezone() y la migración 0003.
+    """
+    tz_name = conn.execute(
+        select(User.time_zone).where(User.role == 'admin').order_by(User.id).limit(1)
+    ).scalar()
+    if tz_name and not _valid_timezone(tz_name):
+        logger.warning(f"⚠️ Zona del admin inválida ({tz_name}), se usa {DEFAULT_PROF_TIMEZONE}.")
+        return None
+    return tz_name or None
+
+
+def _load_prof_timezone():
+    """Zona del admin desde Neon. Retorna (zona, se_pudo_leer)."""
+    try:
+        # Import diferido: postgres_db importa migrations, que importa este módulo
+        from .postgres_db import PostgresSession
+        with PostgresSession() as session:
+            tz_name = read_prof_timezone(session)
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo leer la zona del admin, se usa {DEFAULT_PROF_TIMEZONE}: {e}")
+        return DEFAULT_PROF_TIMEZONE, False
+    return tz_name or DEFAULT_PROF_TIMEZONE, True
+
+
+def get_prof_timezone():
+    """Zona horaria de la profesora (lazy + en memoria)."""
+    global _prof_tz
+    cached = _prof_tz
+    if cached is not None and (cached[1] is None or _time.monotonic() < cached[1]):
+        return cached[0]
+    with _prof_tz_lock:
+        cached = _prof_tz
+        if cached is None or (cached[1] is not None and _time.monotonic() >= cached[1]):
+            tz_name, loaded = _load_prof_timezone()
+            _prof_tz = (tz_name, None if loaded else _time.monotonic() + PROF_TIMEZONE_RETRY_SECONDS)
+            logger.info(f"Zona horaria de la profesora: {tz_name}")
+        return _prof_tz[0]
+
+
+def refresh_prof_timezone(tz_name=None):
+    """
+    Llamar cuando el admin cambia su zona horaria. Con `tz_name` se usa ese
+    valor directamente; sin él se vuelve a leer de la BD en el próximo uso.
+    """
+    global _prof_tz
+    with _prof_tz_lock:
+        if tz_name and _valid_timezone(tz_name):
+            _prof_tz = (tz_name, None)
+            logger.info(f"Zona horaria de la profesora actualizada: {tz_name}")
+        else:
+            _prof_tz = None
+
+
+def prof_bounds(date_prof, start_prof_time, end_prof_time=None, duration=None, tz_name=None):
+    """
+    Convierte fecha + horas HHMM (hora profesora) a (start_at, end_at) en UTC.
+    Si la hora de fin es menor que la de inicio, la clase termina al día siguiente.
+    Sin hora de fin se usa la duración (60 min por defecto). Retorna (None, None) si faltan datos.
+    """
+    if not date_prof or start_prof_time is None:
+        return None, None
+    try:
+        day = datetime.strptime(str(date_prof)[:10], "%Y-%m-%d").date()
+        start_int = int(start_prof_time)
+        tz = ZoneInfo(tz_name or get_prof_timezone())
+        start_local = datetime.combine(day, time(start_int // 100, start_int % 100), tzinfo=tz)
+
+        if end_prof_time is not None:
+            end_int = int(end_prof_time)
+            end_local = datetime.combine(day, time(end_int // 100, end_int % 100), tzinfo=tz)
+            if end_int < start_int:
+                end_local += timedelta(days=1)
+        else:
+            try:
+                minutes = int(float(duration)) if duration else 60
+            except (TypeError, ValueError):
+                minutes = 60
+            end_local = start_local + timedelta(minutes=minutes)
+    except (TypeError, ValueError) as e:
+        logger.warning(f"Horario de clase inválido ({date_prof} {start_prof_time}-{end_prof_time}): {e}")
+        return None, None
+
+    return start_local.astimezone(timezone.utc), end_local.astimezone(timezone.utc)
+
+
+def class_bounds(cls):
+    """(start_at, end_at) de una clase: usa las columnas si están, si no las calcula."""
+    start_at = getattr(cls, 'start_at', None)
+    end_at = getattr(cls, 'end_at', None)
+    if start_at is not None and end_at is not None:
+        # SQLite devuelve datetimes sin zona: son UTC
+        if start_at.tzinfo is None:
+            start_at = start_at.replace(tzinfo=timezone.utc)
+        if end_at.tzinfo is None:
+            end_at = end_at.replace(tzinfo=timezone.utc)
+        return start_at, end_at
+    return prof_bounds(
+        cls.date_prof or cls.date,
+        cls.start_prof_time if cls.start_prof_time is not None else cls.start_time,
+        cls.end_prof_time if cls.end_prof_time is not None else cls.end_time,
+        cls.duration,
+    )
+
+
+@event.listens_for(AsignedClasses, "before_insert")
+@event.listens_for(AsignedClasses, "before_update")
+def _fill_class_bounds(mapper, connection, target):
+    target.start_at, target.end_at = prof_bounds(
+        target.date_prof or target.date,
+        target.start_prof_time if target.start_prof_time is not None else target.start_time,
+        target.end_prof_time if target.end_prof_time is not None else target.end_time,
+        target.duration,
+    )
@@ -0,0 +1,38 @@
+import asyncio
+import functools
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# =====================================================
+# POOL DE HILOS PARA LA BASE DE DATOS
+# =====================================================
+# SQLAlchemy (psycopg2) es bloqueante. Si una consulta a Neon tarda, y se
+# ejecuta directamente en un handler async, congela el loop de NiceGUI y
+# TODOS los clientes conectados (websockets) se quedan esperando.
+#
+# Regla: los handlers de las páginas NUNCA abren PostgresSession() en el loop.
+# Ponen el trabajo de BD en una función síncrona y hacen:
+#
+#     result = await run_db(_mi_funcion_sync, arg1, arg2)
+#
+# El pool es acotado (no más hilos que conexiones del pool de SQLAlchemy),
+# así una ráfaga de peticiones hace cola aquí en vez de saturar Neon.
+
+DB_MAX_WORKERS = int(os.getenv("DB_MAX_WORKERS", "10"))
+
+_db_executor = ThreadPoolExecutor(max_workers=DB_MAX_WORKERS, thread_name_prefix="db")
+
+
+async def run_db(fn, *args, **kwargs):
+    """Ejecuta `fn(*args, **kwargs)` en el pool de BD y espera su resultado sin bloquear el loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_db_executor, functools.partial(fn, *args, **kwargs))
+
+
+def shutdown_db_executor():
+    """Cierra el pool (se llama al apagar la app)."""
+    _db_executor.shutdown(wait=False, cancel_futures=True)
+    logger.info("Pool de BD cerrado.")
@@ -0,0 +1,243 @@
+import logging
+from datetime import datetime, timezone
+
+from sqlalchemy import (
+    Column, Integer, MetaData, String, Table, DateTime, func, select, inspect, update, bindparam, table, column
+)
+from sqlalchemy.schema import CreateColumn
+
+from .models import Base, ChangeTracked, AsignedClasses, CalendarSyncState, ScheduleProf, ScheduleProfEsp, SchedulePref
+from .class_times import prof_bounds, read_prof_timezone, DEFAULT_PROF_TIMEZONE
+
+logger = logging.getLogger(__name__)
+
+# =====================================================
+# MIGRACIONES DE ESQUEMA (VERSIONADAS)
+# =====================================================
+# `Base.metadata.create_all` solo crea tablas que NO existen: no agrega
+# índices ni columnas a una tabla ya creada en Neon. Cada cambio de esquema
+# sobre tablas existentes se registra aquí como un paso numerado.
+#
+# - Cada paso corre en su propia transacción y queda anotado en
+#   `schema_migrations`, así se aplica una sola vez por base de datos.
+# - Los pasos deben ser idempotentes (checkfirst / IF NOT EXISTS): una BD
+#   nueva ya trae lo que declara models.py.
+# - Si un paso falla se registra el error y se sigue con los demás (los
+#   pasos son independientes); el fallido se reintenta en el próximo arranque.
+#
+# Para agregar un cambio: escribir `def _mXXXX(conn)` y sumarlo a MIGRATIONS.
+
+_meta = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations", _meta,
+    Column("version", Integer, primary_key=True),
+    Column("name", String),
+    Column("applied_at", DateTime(timezone=True)),
+)
+
+
+def _create_indexes(conn, indexes):
+    for index in indexes:
+        index.create(conn, checkfirst=True)
+
+
+def _add_columns(conn, model, names):
+    """ALTER TABLE ADD COLUMN para las columnas del modelo que aún no existen."""
+    table = model.__table__
+    existing = {c["name"] for c in inspect(conn).get_columns(table.name)}
+    for name in names:
+        if name in existing:
+            continue
+        column_ddl = CreateColumn(table.c[name]).compile(dialect=conn.dialect)
+        conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {column_ddl}")
+
+
+def _index(model, name):
+    return next(i for i in model.__table__.indexes if i.name == name)
+
+
+# --- 0001: índices de las columnas de búsqueda ---
+def _m0001_lookup_indexes(conn):
+    _create_indexes(conn, [
+        _index(AsignedClasses, "ix_clases_date_prof_status"),
+        _index(AsignedClasses, "ix_clases_username_status"),
+        _index(AsignedClasses, "ix_clases_date_status"),
+        _index(ScheduleProf, "ix_horario_prof_days"),
+        _index(ScheduleProfEsp, "ix_horario_prof_esp_date"),
+        _index(SchedulePref, "ix_rangos_username_days"),
+    ])
+
+
+# --- 0002: una sola clase activa por alumno y hora ---
+def _m0002_unique_class_slot(conn):
+    duplicates = conn.execute(
+        select(
+            AsignedClasses.username, AsignedClasses.date_prof, AsignedClasses.start_prof_time,
+            func.count().label("n"),
+        )
+        .where(AsignedClasses.status.notin_(("Cancelled", "Cancelada")))
+        .group_by(AsignedClasses.username, AsignedClasses.date_prof, AsignedClasses.start_prof_time)
+        .having(func.count() > 1)
+    ).all()
+    if duplicates:
+        for d in duplicates[:20]:
+            logger.error(f"   Reserva duplicada: {d.username} {d.date_prof} {d.start_prof_time} (x{d.n})")
+        raise RuntimeError(
+            f"{len(duplicates)} reservas duplicadas impiden crear uq_clases_username_slot. "
+            "Cancelar/borrar las sobrantes y reiniciar."
+        )
+    _create_indexes(conn, [_index(AsignedClasses, "uq_clases_username_slot")])
+
+
+# --- 0003: start_at / end_at (UTC) en clases + relleno de filas existentes ---
+BACKFILL_BATCH = 1000
+
+# Vista mínima de la tabla para el relleno: sin los defaults/onupdate del
+# modelo (updated_at lo agrega recién la 0006 y aquí todavía no existe).
+_classes_0003 = table(
+    "clases_asignadas",
+    column("id", Integer), column("date", String), column("date_prof", String),
+    column("start_time", Integer), column("end_time", Integer),
+    column("start_prof_time", Integer), column("end_prof_time", Integer),
+    column("duration", String),
+    column("start_at", DateTime(timezone=True)), column("end_at", DateTime(timezone=True)),
+)
+
+
+def _m0003_class_timestamps(conn):
+    _add_columns(conn, AsignedClasses, ["start_at", "end_at"])
+
+    t = _classes_0003
+    rows = conn.execute(
+        select(t.c.id, t.c.date, t.c.date_prof, t.c.start_time, t.c.end_time,
+               t.c.start_prof_time, t.c.end_prof_time, t.c.duration)
+        .where(t.c.start_at.is_(None))
+    ).all()
+
+    # La misma zona que usa la app (la del admin), leída con esta conexión
+    tz_name = read_prof_timezone(conn) or DEFAULT_PROF_TIMEZONE
+    logger.info(f"   Zona de la profesora para el relleno: {tz_name}")
+
+    stmt = update(t).where(t.c.id == bindparam("row_id")).values(start_at=bindparam("s"), end_at=bindparam("e"))
+    batch = []
+    filled = 0
+    for r in rows:
+        start_at, end_at = prof_bounds(
+            r.date_prof or r.date,
+            r.start_prof_time if r.start_prof_time is not None else r.start_time,
+            r.end_prof_time if r.end_prof_time is not None else r.end_time,
+            r.duration,
+            tz_name=tz_name,
+        )
+        if start_at is None:
+            continue
+        batch.append({"row_id": r.id, "s": start_at, "e": end_at})
+        if len(batch) >= BACKFILL_BATCH:
+            conn.execute(stmt, batch)
+            filled += len(batch)
+            batch = []
+    if batch:
+        conn.execute(stmt, batch)
+        filled += len(batch)
+    logger.info(f"   start_at/end_at calculados para {filled}/{len(rows)} clases.")
+
+    _create_indexes(conn, [
+        _index(AsignedClasses, "ix_clases_start_at"),
+        _index(AsignedClasses, "ix_clases_status_end_at"),
+    ])
+
+
+# --- 0004: vínculo clase <-> evento de Google Calendar ---
+def _m0004_class_calendar_event(conn):
+    _add_columns(conn, AsignedClasses, ["calendar_event_id", "calendar_etag", "calendar_updated"])
+    _create_indexes(conn, [_index(AsignedClasses, "ix_clases_calendar_event_id")])
+
+
+# --- 0005: canal de notificaciones push de Google Calendar ---
+def _m0005_calendar_watch_channel(conn):
+    _add_columns(conn, CalendarSyncState, [
+        "channel_id", "channel_resource_id", "channel_token", "channel_expiration"
+    ])
+
+
+# --- 0006: seguimiento de cambios para el respaldo diferencial ---
+# updated_at en cada tabla respaldada + (solo Postgres) un trigger que lo
+# mantiene y anota los borrados en backup_tombstones, aunque el cambio venga
+# de un UPDATE/DELETE masivo o de fuera de la app. El respaldo pone
+# `SET LOCAL backup.applying = 'on'` al escribir en Supabase para que el
+# trigger de allá no reescriba updated_at ni genere tombstones.
+_TRACK_FUNCTION = """
+CREATE OR REPLACE FUNCTION backup_track_changes() RETURNS trigger AS $$
+BEGIN
+    IF current_setting('backup.applying', true) = 'on' THEN
+        IF TG_OP = 'DELETE' THEN RETURN OLD; END IF;
+        RETURN NEW;
+    END IF;
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO backup_tombstones (table_name, row_id, deleted_at) VALUES (TG_TABLE_NAME, OLD.id, now());
+        RETURN OLD;
+    END IF;
+    NEW.updated_at := now();
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql
+"""
+
+
+def _tracked_models():
+    return [m.class_ for m in Base.registry.mappers if issubclass(m.class_, ChangeTracked)]
+
+
+def _m0006_backup_change_tracking(conn):
+    now = datetime.now(timezone.utc)
+    for model in _tracked_models():
+        t = model.__table__
+        _add_columns(conn, model, ["updated_at"])
+        conn.execute(update(t).where(t.c.updated_at.is_(None)).values(updated_at=now))
+        _create_indexes(conn, [_index(model, f"ix_{t.name}_updated_at")])
+
+    if conn.dialect.name != "postgresql":
+        return
+    conn.exec_driver_sql(_TRACK_FUNCTION)
+    for model in _tracked_models():
+        name = model.__tablename__
+        conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS trg_{name}_backup ON {name}")
+        conn.exec_driver_sql(
+            f"CREATE TRIGGER trg_{name}_backup BEFORE INSERT OR UPDATE OR DELETE ON {name} "
+            f"FOR EACH ROW EXECUTE FUNCTION backup_track_changes()"
+        )
+
+
+MIGRATIONS = [
+    (1, "lookup_indexes", _m0001_lookup_indexes),
+    (2, "unique_class_slot", _m0002_unique_class_slot),
+    (3, "class_timestamps", _m0003_class_timestamps),
+    (4, "class_calendar_event", _m0004_class_calendar_event),
+    (5, "calendar_watch_channel", _m0005_calendar_watch_channel),
+    (6, "backup_change_tracking", _m0006_backup_change_tracking),
+]
+
+
+def run_migrations(engine, label="BD"):
+    """Aplica los pasos pendientes de MIGRATIONS sobre `engine`. Retorna la versión más alta aplicada."""
+    _meta.create_all(engine)
+
+    with engine.connect() as conn:
+        applied = set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+    current = max(applied, default=0)
+    for version, name, step in MIGRATIONS:
+        if version in applied:
+            continue
+        try:
+            with engine.begin() as conn:
+                step(conn)
+                conn.execute(schema_migrations.insert().values(
+                    version=version, name=name, applied_at=datetime.now(timezone.utc)
+                ))
+            current = max(current, version)
+            logger.info(f"🧱 [{label}] Migración {version:04d} '{name}' aplicada.")
+        except Exception as e:
+            logger.error(f"❌ [{label}] Migración {version:04d} '{name}' falló: {e}")
+    return current
@@ -1,10 +1,26 @@
-from sqlalchemy import Column, Integer, String
+from datetime import datetime, timezone
+
+from sqlalchemy import Column, Integer, String, DateTime, Index, text
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.types import JSON
 
 Base = declarative_base()
 
-class User(Base):
+
+def _utcnow():
+    return datetime.now(timezone.utc)
+
+
+class ChangeTracked:
+    """
+    Marca de última modificación para el respaldo diferencial (components/db_migration.py).
+    En Postgres la mantiene además un trigger (ver db/migrations.py, 0006), que también
+    anota los borrados en backup_tombstones.
+    """
+    updated_at = Column(DateTime(timezone=True), default=_utcnow, onupdate=_utcnow, index=True)
+
+
+class User(ChangeTracked, Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True)
     username = Column(String, unique=True)
@@ -24,7 +40,7 @@ class User(Base):
     price = Column(Integer, unique=False, default=10) # Precio del plan
 
 
-class SchedulePref(Base):
+class SchedulePref(ChangeTracked, Base):
     __tablename__ = "rangos_horarios"
     id = Column(Integer, primary_key=True)
     username = Column(String, unique=False)
@@ -40,8 +56,12 @@ class SchedulePref(Base):
     end_prof_time = Column(Integer, unique=False)   # NUEVO
     package = Column(String, unique=False)
 
+    __table_args__ = (
+        Index("ix_rangos_username_days", "username", "days"),
+    )
+
 
-class AsignedClasses(Base):
+class AsignedClasses(ChangeTracked, Base):
     __tablename__ = "clases_asignadas"
     id = Column(Integer, primary_key=True)
     username = Column(String, unique=False)
@@ -63,8 +83,63 @@ class AsignedClasses(Base):
     class_count = Column(String, unique=False) # Ej: "1/12", "5/8"
     total_classes = Column(Integer, unique=False, default=0)
     payment_info = Column(JSON, unique=False) # Información de pago (puede ser JSON)
+    # Inicio/fin reales en UTC (se calculan solos desde date_prof + *_prof_time, ver db/class_times.py)
+    start_at = Column(DateTime(timezone=True), nullable=True)
+    end_at = Column(DateTime(timezone=True), nullable=True)
+    # Evento de Google Calendar de esta clase (lo llena auth/sync_cal.py)
+    calendar_event_id = Column(String, nullable=True)
+    calendar_etag = Column(String, nullable=True)
+    calendar_updated = Column(String, nullable=True)
+
+    # Índices de las consultas calientes (ver db/migrations.py para BDs existentes)
+    __table_args__ = (
+        Index("ix_clases_date_prof_status", "date_prof", "status"),
+        Index("ix_clases_username_status", "username", "status"),
+        Index("ix_clases_date_status", "date", "status"),
+        Index("ix_clases_start_at", "start_at"),
+        Index("ix_clases_status_end_at", "status", "end_at"),
+        Index("ix_clases_calendar_event_id", "calendar_event_id"),
+        # Evita la doble reserva en la BD: un alumno no puede tener dos clases
+        # activas a la misma hora (las canceladas no cuentan).
+        Index(
+            "uq_clases_username_slot", "username", "date_prof", "start_prof_time",
+            unique=True,
+            postgresql_where=text("status NOT IN ('Cancelled', 'Cancelada')"),
+            sqlite_where=text("status NOT IN ('Cancelled', 'Cancelada')"),
+        ),
+    )
+
+class CalendarSyncState(Base):
+    """Estado de la sincronización incremental con Google Calendar (un registro por calendario)."""
+    __tablename__ = "calendar_sync_state"
+    calendar_id = Column(String, primary_key=True)
+    sync_token = Column(String, nullable=True)  # nextSyncToken de Google
+    last_full_sync = Column(DateTime(timezone=True), nullable=True)
+    last_sync = Column(DateTime(timezone=True), nullable=True)
+    # Canal de notificaciones push (events.watch) vigente
+    channel_id = Column(String, nullable=True)
+    channel_resource_id = Column(String, nullable=True)
+    channel_token = Column(String, nullable=True)
+    channel_expiration = Column(DateTime(timezone=True), nullable=True)
 
-class ScheduleProf(Base):
+
+class CalendarEvent(Base):
+    """Copia local de los eventos de Google Calendar (desde hoy) para no volver a descargarlos."""
+    __tablename__ = "calendar_events"
+    calendar_id = Column(String, primary_key=True)
+    event_id = Column(String, primary_key=True)
+    etag = Column(String)
+    summary = Column(String)
+    # Hora profesora, formato 'YYYY-MM-DDTHH:MM:SS'
+    start_local = Column(String)
+    end_local = Column(String)
+    updated = Column(String)
+
+    __table_args__ = (
+        Index("ix_calendar_events_cal_start", "calendar_id", "start_local"),
+    )
+
+class ScheduleProf(ChangeTracked, Base):
     __tablename__ = "horario_prof"
     id = Column(Integer, primary_key=True)
     username = Column(String, unique=False)
@@ -76,7 +151,11 @@ class ScheduleProf(Base):
     end_time = Column(Integer, unique=False)
     availability = Column(String, unique=False, default='Available')
 
-class ScheduleProfEsp(Base):
+    __table_args__ = (
+        Index("ix_horario_prof_days", "days"),
+    )
+
+class ScheduleProfEsp(ChangeTracked, Base):
     __tablename__ = "horario_prof_esp"
     id = Column(Integer, primary_key=True)
     username = Column(String, unique=False)
@@ -89,7 +168,11 @@ class ScheduleProfEsp(Base):
     end_time = Column(Integer, unique=False)
     avai = Column(String, unique=False, default='Available')
 
-class TeacherProfile(Base):
+    __table_args__ = (
+        Index("ix_horario_prof_esp_date", "date"),
+    )
+
+class TeacherProfile(ChangeTracked, Base):
     __tablename__ = "teacher_profile"
     id = Column(Integer, primary_key=True)
     username = Column(String, unique=False)
@@ -105,7 +188,7 @@ class TeacherProfile(Base):
     social_links = Column(JSON, unique=False)
     reviews = Column(JSON, unique=False)
 
-class Material(Base):
+class Material(ChangeTracked, Base):
     __tablename__ = "materials"
     id = Column(Integer, primary_key=True)
     title = Column(String, unique=False)
@@ -115,7 +198,7 @@ class Material(Base):
     level = Column(String, unique=False)
     tags = Column(JSON, unique=False)
 
-class HWork(Base):
+class HWork(ChangeTracked, Base):
     __tablename__ = "homework"
     id = Column(Integer, primary_key=True)
     username = Column(String, unique=False)
@@ -128,7 +211,7 @@ class HWork(Base):
     status = Column(String, unique=False, default="Pending")
     tagsW = Column(JSON, unique=False)
 
-class StudentMaterial(Base):
+class StudentMaterial(ChangeTracked, Base):
     __tablename__ = "student_materials"
     id = Column(Integer, primary_key=True)
     username = Column(String, unique=False)
@@ -137,7 +220,7 @@ class StudentMaterial(Base):
     material_id = Column(Integer, unique=False)
     progress = Column(String, unique=False, default="Not Started")
 
-class StudentHWork(Base):
+class StudentHWork(ChangeTracked, Base):
     __tablename__ = "student_homework"
     id = Column(Integer, primary_key=True)
     username = Column(String, unique=False)
@@ -146,4 +229,17 @@ class StudentHWork(Base):
     homework_id = Column(Integer, unique=False)
     submission = Column(String, unique=False)
     status = Column(String, unique=False, default="Pending")
-    grade = Column(JSON, unique=False, default="")
\ No newline at end of file
+    grade = Column(JSON, unique=False, default="")
+
+
+class BackupTombstone(Base):
+    """Filas borradas de las tablas respaldadas (las llena el trigger de Postgres)."""
+    __tablename__ = "backup_tombstones"
+    id = Column(Integer, primary_key=True)
+    table_name = Column(String, nullable=False)
+    row_id = Column(Integer, nullable=False)
+    deleted_at = Column(DateTime(timezone=True), default=_utcnow)
+
+    __table_args__ = (
+        Index("ix_backup_tombstones_table_deleted", "table_name", "deleted_at"),
+    )
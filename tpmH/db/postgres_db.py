@@ -1,7 +1,17 @@
+import importlib.util
+import logging
+import os
+
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker
 from .models import Base
+from .replication import install_outbox
+from .migrations import run_migrations
 from config import POSTGRES_URL
+from components.cache_invalidation import install_cache_invalidation
+
+logger = logging.getLogger(__name__)
 
 # CONFIGURACIÓN OPTIMIZADA PARA NEON / CLOUD DB
 # 1. pool_pre_ping: Verifica si la conexión sigue viva
@@ -28,5 +38,91 @@ PostgresEngine = create_engine(
 # Esta será tu sesión PRINCIPAL para leer y escribir
 PostgresSession = sessionmaker(bind=PostgresEngine)
 
-# Crear tablas en PostgreSQL si no existen
-Base.metadata.create_all(PostgresEngine)
\ No newline at end of file
+# Cachés de clases y disponibilidad: se invalidan solas al confirmar. Va antes
+# que el outbox: su do_orm_execute ejecuta la sentencia y corta la cadena.
+install_cache_invalidation(PostgresSession)
+
+# Todo lo que se confirma en Neon se replica solo a backup_local.sqlite (db/replication.py)
+install_outbox(PostgresSession, PostgresEngine)
+
+# Crear tablas en PostgreSQL si no existen + aplicar migraciones pendientes (índices, etc.)
+Base.metadata.create_all(PostgresEngine)
+run_migrations(PostgresEngine, "Neon")
+
+
+# =====================================================
+# MOTOR ASÍNCRONO (asyncpg) PARA LAS PÁGINAS NICEGUI
+# =====================================================
+# Las corrutinas de las páginas pueden hacer:
+#
+#     async with AsyncPostgresSession() as session:
+#         result = await session.execute(select(User).where(...))
+#
+# sin ocupar un hilo del pool de db/executor.py. El motor síncrono de arriba
+# se queda para scripts y trabajos en hilo (db_migration, sync, etc.).
+#
+# Variables de entorno (todas opcionales):
+# - PG_ASYNC_POOL_SIZE / PG_ASYNC_MAX_OVERFLOW: tamaño del pool.
+# - PG_ASYNC_STATEMENT_CACHE: sentencias preparadas cacheadas por conexión.
+#   Poner 0 si se usa el pooler de Neon (PgBouncer en modo transacción).
+# - PG_ASYNC_PRE_PING: "0" para desactivar la verificación de conexión.
+
+PG_ASYNC_POOL_SIZE = int(os.getenv("PG_ASYNC_POOL_SIZE", "5"))
+PG_ASYNC_MAX_OVERFLOW = int(os.getenv("PG_ASYNC_MAX_OVERFLOW", "10"))
+PG_ASYNC_STATEMENT_CACHE = int(os.getenv("PG_ASYNC_STATEMENT_CACHE", "100"))
+PG_ASYNC_PRE_PING = os.getenv("PG_ASYNC_PRE_PING", "1") != "0"
+
+# Parámetros de libpq que asyncpg no entiende (vienen en la URL de Neon)
+_LIBPQ_ONLY_PARAMS = ("sslmode", "channel_binding", "connect_timeout", "options")
+
+
+def _async_url_and_args(url):
+    """Adapta la URL de psycopg2 a asyncpg. Retorna (url, connect_args)."""
+    sa_url = make_url(url)
+    if sa_url.drivername in ("postgres", "postgresql", "postgresql+psycopg2"):
+        sa_url = sa_url.set(drivername="postgresql+asyncpg")
+
+    query = dict(sa_url.query)
+    sslmode = query.get("sslmode")
+    for key in _LIBPQ_ONLY_PARAMS:
+        query.pop(key, None)
+    query["prepared_statement_cache_size"] = str(PG_ASYNC_STATEMENT_CACHE)
+    sa_url = sa_url.set(query=query)
+
+    connect_args = {"timeout": 3, "statement_cache_size": PG_ASYNC_STATEMENT_CACHE}
+    if sslmode and sslmode != "disable":
+        connect_args["ssl"] = sslmode if sslmode in ("prefer", "require", "verify-ca", "verify-full") else True
+    return sa_url, connect_args
+
+
+if importlib.util.find_spec("asyncpg") is None:
+    logger.warning("asyncpg no está instalado: AsyncPostgresSession no disponible (se usa solo el motor síncrono).")
+    AsyncPostgresEngine = None
+    AsyncPostgresSession = None
+else:
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+    _async_url, _async_connect_args = _async_url_and_args(POSTGRES_URL)
+
+    AsyncPostgresEngine = create_async_engine(
+        _async_url,
+        echo=False,
+        pool_pre_ping=PG_ASYNC_PRE_PING,
+        pool_size=PG_ASYNC_POOL_SIZE,
+        max_overflow=PG_ASYNC_MAX_OVERFLOW,
+        pool_recycle=1800,
+        connect_args=_async_connect_args,
+    )
+
+    # expire_on_commit=False: tras el commit los objetos se pueden seguir leyendo
+    # sin disparar una carga perezosa (que en async no está permitida).
+    # sync_session_class: las sesiones async también pasan por el outbox de replicación.
+    AsyncPostgresSession = async_sessionmaker(
+        AsyncPostgresEngine, expire_on_commit=False, sync_session_class=PostgresSession.class_
+    )
+
+
+async def dispose_async_engine():
+    """Cierra las conexiones del pool asíncrono (se llama al apagar la app)."""
+    if AsyncPostgresEngine is not None:
+        await AsyncPostgresEngine.dispose()
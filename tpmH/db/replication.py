@@ -0,0 +1,421 @@
+import copy
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import Column, MetaData, String, Table, delete, event, insert, inspect, select, tuple_
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.exc import InvalidRequestError
+
+from .models import Base
+from .sqlite_db import BackupSession, sqlite_engine
+
+logger = logging.getLogger(__name__)
+
+# =====================================================
+# OUTBOX DE REPLICACIÓN (NEON -> backup_local.sqlite)
+# =====================================================
+# Antes cada pantalla hacía el commit en Neon y luego repetía la MISMA
+# escritura a mano con BackupSession (doble latencia en el clic del usuario
+# y errores tragados con `except: pass`).
+#
+# Ahora las sesiones de PostgresSession registran sus cambios solas:
+# - after_flush: foto de las filas nuevas/modificadas/borradas.
+# - do_orm_execute: INSERT/UPDATE/DELETE masivos (query(...).delete(),
+#   session.execute(update(...))). NO se repite la sentencia en SQLite (su
+#   WHERE vería el estado del respaldo, no el de Neon): se toman las claves
+#   de las filas afectadas en Neon (SELECT previo con el mismo WHERE en
+#   UPDATE/DELETE; en los INSERT, las claves de los parámetros o
+#   inserted_primary_key_rows) y se replican esas filas. La sentencia del
+#   llamador se ejecuta tal cual. Si un INSERT no deja saber sus claves, se
+#   copia la tabla entera desde Neon (evento "resync").
+# - after_commit: los eventos pasan a la cola. Si hay rollback se descartan.
+#
+# Un hilo de fondo aplica la cola a SQLite por lotes (upsert por clave
+# primaria), reintenta con espera creciente y expone el retraso con
+# replication_stats(). El request del usuario termina con el commit de Neon.
+#
+# Upsert por id solo es correcto si los ids del respaldo son los de Neon.
+# El respaldo viejo (escrito a mano, con ids propios) no lo cumple: al
+# arrancar, el hilo lo reconstruye UNA vez desde Neon (rebuild_backup) y lo
+# anota en replication_state. Subir BACKUP_REBUILD_VERSION fuerza otra.
+
+REPLICATION_BATCH_SIZE = int(os.getenv("REPLICATION_BATCH_SIZE", "200"))
+REPLICATION_MAX_RETRIES = int(os.getenv("REPLICATION_MAX_RETRIES", "5"))
+REPLICATION_ENABLED = os.getenv("REPLICATION_ENABLED", "1") != "0"
+REPLICATION_REBUILD_CHUNK = int(os.getenv("REPLICATION_REBUILD_CHUNK", "5000"))
+BACKUP_REBUILD_VERSION = 1
+
+_SESSION_KEY = "replication_outbox"
+
+
+class ReplicationOutbox:
+    """Cola en memoria de eventos de cambio + hilo que los aplica al backup."""
+
+    def __init__(self, session_factory, batch_size=REPLICATION_BATCH_SIZE, max_retries=REPLICATION_MAX_RETRIES):
+        self.session_factory = session_factory
+        self.source_engine = None  # Neon, para la reconstrucción inicial (install_outbox)
+        self._rebuild_checked = False
+        self._rebuilding = False
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self._queue = deque()  # (encolado_en, evento)
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopping = False
+        self._inflight = 0  # eventos del lote que se está aplicando
+        # Métricas
+        self.applied = 0
+        self.failed = 0
+        self.last_error = None
+        self.last_applied_at = None
+
+    # --- PRODUCTOR ---
+    def enqueue(self, events):
+        if not events:
+            return
+        now = time.monotonic()
+        with self._cond:
+            self._queue.extend((now, ev) for ev in events)
+            self._ensure_worker()
+            self._cond.notify()
+
+    def _ensure_worker(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping = False
+            self._rebuilding = self.source_engine is not None and not self._rebuild_checked
+            self._thread = threading.Thread(target=self._run, name="sqlite-replication", daemon=True)
+            self._thread.start()
+
+    def start(self):
+        """Arranca el hilo (y con él la reconstrucción pendiente) sin esperar al primer cambio."""
+        with self._cond:
+            self._ensure_worker()
+
+    # --- CONSUMIDOR ---
+    def _run(self):
+        self._ensure_rebuilt()
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopping:
+                    self._cond.wait()
+                if not self._queue and self._stopping:
+                    return
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+                self._inflight = len(batch)
+            try:
+                self._apply_with_retry(batch)
+            finally:
+                with self._cond:
+                    self._inflight = 0
+                    self._cond.notify_all()
+
+    def _ensure_rebuilt(self):
+        """Reconstrucción única del respaldo (antes de aplicar la cola). Si falla se reintenta al reiniciar."""
+        if self._rebuild_checked or self.source_engine is None:
+            return
+        self._rebuild_checked = True
+        try:
+            if _rebuilt_version() < BACKUP_REBUILD_VERSION:
+                rebuild_backup(self.source_engine)
+        except Exception as e:
+            self.last_error = str(e)
+            logger.error(f"❌ [BACKUP] No se pudo reconstruir backup_local.sqlite desde Neon: {e}")
+        finally:
+            with self._cond:
+                self._rebuilding = False
+                self._cond.notify_all()
+
+    def _apply_with_retry(self, batch):
+        events = [ev for _, ev in batch]
+        for attempt in range(self.max_retries):
+            try:
+                self._apply(events)
+                self.applied += len(events)
+                self.last_applied_at = time.time()
+                return
+            except Exception as e:
+                self.last_error = str(e)
+                logger.warning(f"⚠️ [BACKUP] Lote de {len(events)} eventos falló (intento {attempt + 1}/{self.max_retries}): {e}")
+                time.sleep(min(2 ** attempt, 30))
+
+        # El lote sigue fallando: aplicamos uno a uno para aislar el evento dañado
+        for ev in events:
+            try:
+                self._apply([ev])
+                self.applied += 1
+            except Exception as e:
+                self.failed += 1
+                self.last_error = str(e)
+                logger.error(f"❌ [BACKUP] Evento descartado ({ev[0]} {_event_table(ev)}): {e}")
+        self.last_applied_at = time.time()
+
+    def _apply(self, events):
+        # Core sobre la conexión de la sesión: sin eventos ORM en el respaldo
+        session = self.session_factory()
+        try:
+            conn = session.connection()
+            # En orden: cada evento ve el resultado del anterior (orden de Neon)
+            for kind, table, data in events:
+                if kind == "upsert":
+                    conn.execute(_upsert_statement(table, data))
+                elif kind == "delete":
+                    conn.execute(delete(table).where(*[c == v for c, v in zip(table.primary_key.columns, data)]))
+                elif kind == "resync":
+                    self._resync_table(conn, table)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def _resync_table(self, conn, table):
+        """Copia la tabla entera desde Neon (INSERT masivo sin claves conocidas)."""
+        if self.source_engine is None:
+            logger.warning(f"⚠️ [BACKUP] Sin conexión a Neon para resincronizar {table.name}; se omite.")
+            return
+        with self.source_engine.connect() as src:
+            conn.execute(delete(table))
+            total = _copy_table(src, conn, table)
+        logger.info(f"💾 [BACKUP] Tabla {table.name} resincronizada desde Neon ({total} filas).")
+
+    # --- ESTADO ---
+    def stats(self):
+        """Retraso y contadores de la replicación (para el panel admin / logs)."""
+        with self._cond:
+            pending = len(self._queue) + self._inflight
+            oldest = self._queue[0][0] if self._queue else None
+        return {
+            "rebuilding": self._rebuilding,
+            "pending": pending,
+            "lag_seconds": round(time.monotonic() - oldest, 3) if oldest is not None else 0.0,
+            "applied": self.applied,
+            "failed": self.failed,
+            "last_error": self.last_error,
+            "last_applied_at": self.last_applied_at,
+        }
+
+    def flush(self, timeout=10):
+        """Espera a que la cola se vacíe (o a que pase `timeout`). Retorna True si quedó vacía."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._queue or self._inflight or self._rebuilding:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stop(self, timeout=10):
+        """Drena lo pendiente y detiene el hilo (se llama al apagar la app)."""
+        drained = self.flush(timeout)
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if not drained:
+            logger.warning(f"⚠️ [BACKUP] Apagado con {len(self._queue)} eventos sin replicar.")
+
+
+def _event_table(ev):
+    return ev[1].name
+
+
+def _upsert_statement(table, row):
+    pk = [c.name for c in table.primary_key.columns]
+    stmt = sqlite.insert(table).values(row)
+    return stmt.on_conflict_do_update(
+        index_elements=pk, set_={k: v for k, v in row.items() if k not in pk}
+    ) if len(row) > len(pk) else stmt.on_conflict_do_nothing()
+
+
+outbox = ReplicationOutbox(BackupSession)
+
+
+# =====================================================
+# RECONSTRUCCIÓN ÚNICA DEL RESPALDO
+# =====================================================
+_state_meta = MetaData()
+
+replication_state = Table(
+    "replication_state", _state_meta,
+    Column("key", String, primary_key=True),
+    Column("value", String),
+)
+
+
+def _rebuilt_version():
+    _state_meta.create_all(sqlite_engine)
+    with sqlite_engine.connect() as conn:
+        value = conn.execute(
+            select(replication_state.c.value).where(replication_state.c.key == "rebuilt_version")
+        ).scalar()
+    return int(value or 0)
+
+
+def _copy_table(src, dest, table):
+    """Inserta en `dest` todas las filas de `table` leídas de `src`, por bloques. Retorna cuántas."""
+    total = 0
+    result = src.execution_options(yield_per=REPLICATION_REBUILD_CHUNK).execute(select(table))
+    for rows in result.partitions():
+        dest.execute(insert(table), [row._asdict() for row in rows])
+        total += len(rows)
+    return total
+
+
+def rebuild_backup(source_engine):
+    """
+    Copia todas las tablas de Neon a backup_local.sqlite (mismos ids), en una
+    sola transacción de SQLite: si algo falla, el respaldo queda como estaba.
+    """
+    started = time.monotonic()
+    total = 0
+    _state_meta.create_all(sqlite_engine)
+    with source_engine.connect() as src:
+        if src.dialect.name == "postgresql":
+            # Todas las tablas desde el mismo instante de Neon
+            src.execution_options(isolation_level="REPEATABLE READ")
+        with src.begin(), sqlite_engine.begin() as dest:
+            for table in Base.metadata.sorted_tables:
+                dest.execute(delete(table))
+                total += _copy_table(src, dest, table)
+            dest.execute(_upsert_statement(replication_state, {"key": "rebuilt_version", "value": str(BACKUP_REBUILD_VERSION)}))
+    logger.info(f"💾 [BACKUP] backup_local.sqlite reconstruido desde Neon: {total} filas en {time.monotonic() - started:.1f}s.")
+    return total
+
+
+# =====================================================
+# CAPTURA DE CAMBIOS EN LAS SESIONES DE NEON
+# =====================================================
+
+def _snapshot(obj):
+    """Fila como dict por nombre de columna."""
+    mapper = inspect(obj).mapper
+    return {attr.columns[0].name: copy.deepcopy(getattr(obj, attr.key)) for attr in mapper.column_attrs}
+
+
+def _pending(session):
+    return session.info.setdefault(_SESSION_KEY, [])
+
+
+def _after_flush(session, flush_context):
+    events = _pending(session)
+    for obj in session.new:
+        events.append(("upsert", inspect(obj).mapper.local_table, _snapshot(obj)))
+    for obj in session.dirty:
+        if session.is_modified(obj, include_collections=False):
+            events.append(("upsert", inspect(obj).mapper.local_table, _snapshot(obj)))
+    for obj in session.deleted:
+        events.append(("delete", inspect(obj).mapper.local_table, inspect(obj).identity))
+
+
+def _pk_filter(pk_cols, keys):
+    if len(pk_cols) == 1:
+        return pk_cols[0].in_([k[0] for k in keys])
+    return tuple_(*pk_cols).in_(keys)
+
+
+def _load_rows(conn, table, keys):
+    """Filas actuales (en la transacción de Neon) de las claves `keys`."""
+    pk_cols = list(table.primary_key.columns)
+    rows = []
+    for i in range(0, len(keys), 500):
+        rows.extend(dict(r._mapping) for r in conn.execute(select(table).where(_pk_filter(pk_cols, keys[i:i + 500]))))
+    return rows
+
+
+def _inserted_keys(result, params, pk_cols):
+    """Claves de las filas de un INSERT, o None si no se pueden saber sin tocar la sentencia."""
+    rows = params if isinstance(params, list) else [params] if isinstance(params, dict) else []
+    if rows and all(c.key in p for p in rows for c in pk_cols):
+        # Clave explícita en los parámetros (ej: insert(Model), [{"id": ...}, ...])
+        return [tuple(p[c.key] for c in pk_cols) for p in rows]
+    try:
+        # Solo los CursorResult de Core la tienen (no con RETURNING ni en los INSERT masivos del ORM)
+        keys = [tuple(k) for k in result.inserted_primary_key_rows]
+    except (AttributeError, InvalidRequestError):
+        return None
+    if not keys or any(v is None for k in keys for v in k):
+        return None
+    return keys
+
+
+def _do_orm_execute(orm_execute_state):
+    state = orm_execute_state
+    if not (state.is_insert or state.is_update or state.is_delete):
+        return None
+    table = state.statement.table
+    pk_cols = list(table.primary_key.columns)
+    # Lo pendiente en la sesión se escribe antes (como haría el autoflush de la sentencia)
+    if state.session.autoflush:
+        state.session.flush()
+    conn = state.session.connection(bind_arguments=state.bind_arguments)
+    params = state.parameters
+
+    if state.is_insert:
+        # La sentencia se ejecuta tal cual (mismo resultado y rowcount para el llamador)
+        result = state.invoke_statement()
+        keys = _inserted_keys(result, params, pk_cols)
+    else:
+        if isinstance(params, list) and params and all(c.key in params[0] for c in pk_cols) \
+                and state.statement.whereclause is None:
+            # UPDATE masivo por clave primaria (lista de dicts con el id)
+            keys = [tuple(p[c.key] for c in pk_cols) for p in params]
+        else:
+            # Filas que va a tocar la sentencia, con su mismo WHERE y en la misma transacción
+            query = select(*pk_cols)
+            if state.statement.whereclause is not None:
+                query = query.where(state.statement.whereclause)
+            keys = [tuple(r) for r in conn.execute(query, params if isinstance(params, dict) else {})]
+        result = state.invoke_statement()
+
+    events = _pending(state.session)
+    if keys is None:
+        # INSERT sin claves conocidas: se copia la tabla completa al aplicar
+        events.append(("resync", table, None))
+    elif state.is_delete:
+        events.extend(("delete", table, k) for k in keys)
+    elif keys:
+        events.extend(("upsert", table, row) for row in _load_rows(conn, table, keys))
+    return result
+
+
+def _after_commit(session):
+    events = session.info.pop(_SESSION_KEY, None)
+    if events:
+        outbox.enqueue(events)
+
+
+def _after_rollback(session):
+    session.info.pop(_SESSION_KEY, None)
+
+
+def install_outbox(session_factory, source_engine=None):
+    """
+    Engancha la captura de cambios a una sessionmaker (o clase Session) de Neon.
+    `source_engine` (Neon) se usa para la reconstrucción única del respaldo.
+    """
+    if not REPLICATION_ENABLED:
+        logger.info("Replicación a SQLite desactivada (REPLICATION_ENABLED=0).")
+        return
+    outbox.source_engine = source_engine
+    event.listen(session_factory, "after_flush", _after_flush)
+    event.listen(session_factory, "do_orm_execute", _do_orm_execute)
+    event.listen(session_factory, "after_commit", _after_commit)
+    event.listen(session_factory, "after_rollback", _after_rollback)
+
+
+def replication_stats():
+    return outbox.stats()
+
+
+def start_replication():
+    """Arranca el hilo del outbox (app.on_startup): hace la reconstrucción pendiente."""
+    if REPLICATION_ENABLED:
+        outbox.start()
+
+
+def stop_replication():
+    outbox.stop()
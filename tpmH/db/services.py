@@ -2,7 +2,6 @@ import logging
 from sqlalchemy.exc import SQLAlchemyError
 from .models import User  
 from .postgres_db import PostgresSession
-from .sqlite_db import BackupSession
 
 # Configurar logger para ver qué pasa en la consola
 logger = logging.getLogger(__name__)
@@ -11,7 +10,7 @@ def create_user_service(user_data: dict):
     """
     1. Intenta guardar en Neon (Postgres).
     2. Si falla Neon, cancela todo (porque es la base principal).
-    3. Si funciona Neon, intenta guardar una copia en SQLite local.
+    3. La copia en SQLite local la hace el outbox de replicación (db/replication.py).
     """
     
     # --- FASE 1: GUARDAR EN LA NUBE (NEON) ---
@@ -34,23 +33,4 @@ def create_user_service(user_data: dict):
     finally:
         session_pg.close()
 
-    # --- FASE 2: RESPALDO LOCAL (SQLITE) ---
-    # Solo llegamos aquí si la Fase 1 fue un éxito.
-    try:
-        session_sqlite = BackupSession()
-        # Creamos una instancia nueva porque no podemos mezclar sesiones
-        new_user_sqlite = User(**user_data)
-        
-        session_sqlite.add(new_user_sqlite)
-        session_sqlite.commit()
-        logger.info(f"💾 [BACKUP] Copia guardada en SQLite local.")
-        
-    except Exception as e:
-        # Si falla el backup, NO detenemos el programa. 
-        # Lo importante es que está en la nube. Solo avisamos en consola.
-        logger.warning(f"⚠️ [ADVERTENCIA] El usuario está en la nube pero falló el backup local: {e}")
-    
-    finally:
-        session_sqlite.close()
-
     return True
\ No newline at end of file
@@ -2,6 +2,7 @@ import os
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from .models import Base # Asegúrate que la importación apunte a tus modelos
+from .migrations import run_migrations
 
 # =====================================================
 # CONFIGURACIÓN DE LA BASE DE DATOS (RESPALDO)
@@ -20,8 +21,9 @@ sqlite_engine = create_engine(
     connect_args={"check_same_thread": False}
 )
 
-# Crear tablas en el archivo local
+# Crear tablas en el archivo local + mismas migraciones que Neon
 Base.metadata.create_all(sqlite_engine)
+run_migrations(sqlite_engine, "SQLite")
 
 # RENOMBRADO: Ahora se llama BackupSession para distinguirla
 BackupSession = sessionmaker(bind=sqlite_engine)
\ No newline at end of file
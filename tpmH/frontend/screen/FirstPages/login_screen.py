@@ -3,12 +3,10 @@ from fastapi import Request
 from fastapi.responses import RedirectResponse
 from starlette.middleware.base import BaseHTTPMiddleware
 from nicegui import app, ui
-from passlib.hash import pbkdf2_sha256
 from prompts.chatbot import render_floating_chatbot
 
 # --- CAMBIO IMPORTANTE: Usamos Postgres para validar credenciales ---
-from db.postgres_db import PostgresSession
-from db.models import User
+from auth.passwords import authenticate, client_ip
 # ------------------------------------------------------------------
 
 # =====================================================
@@ -68,7 +66,7 @@ def setup_auth_system():
         def render_login_content():
             
             # Lógica de Login
-            def try_login():
+            async def try_login():
                 u_val = username.value.strip()
                 p_val = password.value.strip()
 
@@ -77,42 +75,39 @@ def setup_auth_system():
                     return
 
                 # --- CONEXIÓN A NEON (POSTGRES) ---
-                session = PostgresSession()
-                try:
-                    # Buscamos al usuario en la Nube
-                    user = session.query(User).filter_by(username=u_val).first()
-                    
-                    if user and pbkdf2_sha256.verify(p_val, user.password_hash):
-                        
-                        # Verificar si la cuenta está activa (Opcional, pero recomendado)
-                        if getattr(user, 'status', 'Active') != 'Active':
-                             ui.notify("Esta cuenta ha sido desactivada.", type='negative', icon='block')
-                             return
-
-                        # Guardar sesión en el navegador
-                        app.storage.user.update({
-                            'username': u_val,
-                            'authenticated': True,
-                            'role': user.role,
-                            'name': user.name,
-                            'surname': user.surname,
-                            'email': getattr(user, 'email', ''),
-                            'time_zone': getattr(user, 'time_zone', '')
-                        })
-
-                        ui.notify(f"Bienvenido de nuevo, {user.name}!", type='positive')
-
-                        # Redirección según rol
-                        target = '/admin' if user.role == "admin" else '/mainscreen'
-                        ui.navigate.to(target)
-                    else:
-                        ui.notify("Usuario o contraseña incorrectos", type='negative', icon='error')
-                        
-                except Exception as e:
+                # Consulta y verificación del hash fuera del loop (auth/passwords.py)
+                result = await authenticate(u_val, p_val, client_ip(ui.context.client))
+
+                if result['success']:
+                    user = result['user']
+
+                    # Guardar sesión en el navegador
+                    app.storage.user.update({
+                        'username': u_val,
+                        'authenticated': True,
+                        'role': user['role'],
+                        'name': user['name'],
+                        'surname': user['surname'],
+                        'email': user['email'],
+                        'time_zone': user['time_zone']
+                    })
+
+                    ui.notify(f"Bienvenido de nuevo, {user['name']}!", type='positive')
+
+                    # Redirección según rol
+                    target = '/admin' if user['role'] == "admin" else '/mainscreen'
+                    ui.navigate.to(target)
+                elif result['error'] == 'throttled':
+                    ui.notify(f"Demasiados intentos. Espera {int(result['retry_after']) + 1} segundos.",
+                              type='warning', icon='hourglass_top')
+                elif result['error'] == 'inactive':
+                    # Verificar si la cuenta está activa
+                    ui.notify("Esta cuenta ha sido desactivada.", type='negative', icon='block')
+                elif result['error'] == 'server':
                     # Error de conexión a Neon
-                    ui.notify(f"Error de conexión con el servidor: {str(e)}", type='negative')
-                finally:
-                    session.close()
+                    ui.notify(f"Error de conexión con el servidor: {result['detail']}", type='negative')
+                else:
+                    ui.notify("Usuario o contraseña incorrectos", type='negative', icon='error')
 
             # --- DISEÑO DE LA TARJETA DE LOGIN ---
             with ui.card().classes('w-full max-w-sm p-8 shadow-xl rounded-2xl bg-white border border-gray-100'):
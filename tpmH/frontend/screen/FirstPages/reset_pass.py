@@ -1,10 +1,7 @@
 from nicegui import ui, app
-from passlib.hash import pbkdf2_sha256
 from prompts.chatbot import render_floating_chatbot
 # --- NUEVOS IMPORTS ---
-from db.models import User
-from db.postgres_db import PostgresSession  # Fuente de la verdad
-from db.sqlite_db import BackupSession       # Respaldo
+from auth.passwords import reset_password, client_ip  # Neon es la fuente de la verdad
 # ----------------------
 
 # =====================================================
@@ -49,7 +46,7 @@ def reset_screen():
 
     def render_reset_content():
         
-        def try_reset():
+        async def try_reset():
             u = username_input.value.strip()
             email = email_input.value.strip()
             new_p = new_password_input.value.strip()
@@ -58,102 +55,37 @@ def reset_screen():
                 ui.notify('Por favor, completa todos los campos.', type='warning', icon='warning')
                 return
 
-            # Calcular el hash antes de abrir sesiones para no bloquear la DB con CPU
-            try:
-                new_hash = pbkdf2_sha256.hash(new_p)
-            except Exception as e:
-                ui.notify(f'Error procesando contraseña: {e}', type='negative')
+            # FASE 1: ACTUALIZAR EN LA NUBE (NEON - PRINCIPAL)
+            # Validación, hash y escritura fuera del loop (auth/passwords.py)
+            result = await reset_password(u, email, new_p, client_ip(ui.context.client))
+
+            # 1. Validaciones
+            if result.get('error') == 'throttled':
+                ui.notify(f"Demasiados intentos. Espera {int(result['retry_after']) + 1} segundos.",
+                          type='warning', icon='hourglass_top')
+                return
+            if result.get('error') == 'not_found':
+                ui.notify('El usuario no existe.', type='negative', icon='person_off')
+                username_input.props('error error-message="Usuario no encontrado"')
+                return
+            if result.get('error') == 'email':
+                ui.notify('El email actual es incorrecto.', type='negative', icon='gpp_bad')
+                email_input.props('error') 
+                return
+            if not result['success']:
+                ui.notify(f"Error de conexión con el servidor: {result.get('detail', '')}", type='negative')
                 return
 
-            # Variables de control
-            success = False
+            # El respaldo SQLite lo replica el outbox (db/replication.py).
+            # --- NOTIFICACIÓN FINAL ---
+            ui.notify('¡Contraseña actualizada correctamente!', type='positive', icon='check_circle')
             
-            # FASE 1: ACTUALIZAR EN LA NUBE (NEON - PRINCIPAL)
-            session_pg = PostgresSession()
-            try:
-                user_pg = session_pg.query(User).filter_by(username=u).first()
-                
-                # 1. Validaciones
-                if not user_pg:
-                    ui.notify('El usuario no existe.', type='negative', icon='person_off')
-                    username_input.props('error error-message="Usuario no encontrado"')
-                    return # Salimos y cerramos en finally
-
-                if not (email, user_pg.email) or email.lower() != user_pg.email.lower():
-                    ui.notify('El email actual es incorrecto.', type='negative', icon='gpp_bad')
-                    email_input.props('error') 
-                    return # Salimos y cerramos en finally
-
-                # 2. Actualizar
-                user_pg.password_hash = new_hash
-                session_pg.commit()
-                
-                success = True # Marcamos éxito
-
-            except Exception as e:
-                session_pg.rollback()
-                ui.notify(f"Error de conexión con el servidor: {str(e)}", type='negative')
-                return
-            finally:
-                session_pg.close()
-
-            # FASE 2: ACTUALIZAR RESPALDO (SQLITE)
-            # Solo si FASE 1 fue exitosa. Hacemos esto ANTES de notificar al usuario.
-            if success:
-                try:
-                    session_sqlite = BackupSession()
-                    user_sqlite = session_sqlite.query(User).filter_by(username=u).first()
-                    
-                    if user_sqlite:
-                        user_sqlite.password_hash = new_hash
-                        session_sqlite.commit()
-                        print(f"💾 Backup actualizado para usuario {u}")
-                    else:
-                        print(f"⚠️ El usuario {u} no existía en el backup local.")
-                        
-                except Exception as e:
-                    # El backup falló, pero la contraseña real YA SE CAMBIÓ.
-                    # Solo lo logueamos, no detenemos el flujo de la UI.
-                    print(f"⚠️ Error actualizando backup local: {e}")
-                finally:
-                    # Aseguramos cerrar la sesión de backup si se creó
-                    try:
-                        session_sqlite.close()
-                    except:
-                        pass
-
-                # --- NOTIFICACIÓN FINAL ---
-                # Ahora que todo el trabajo pesado terminó, actualizamos la UI.
-                ui.notify('¡Contraseña actualizada correctamente!', type='positive', icon='check_circle')
-                
-                # Deshabilitar botón para evitar doble clic mientras redirige
-                username_input.disable()
-                email_input.disable()
-                new_password_input.disable()
-                
-                ui.timer(2.0, lambda: ui.navigate.to('/login'))
-
-            # FASE 2: ACTUALIZAR RESPALDO (SQLITE - SECUNDARIO)
-            # Solo si la fase 1 fue exitosa
-            if success:
-                try:
-                    session_sqlite = BackupSession()
-                    user_sqlite = session_sqlite.query(User).filter_by(username=u).first()
-                    
-                    if user_sqlite:
-                        # Si el usuario existe en el backup, actualizamos su contraseña también
-                        user_sqlite.password_hash = new_hash
-                        session_sqlite.commit()
-                        print(f"💾 Backup actualizado para usuario {u}")
-                    else:
-                        print(f"⚠️ El usuario {u} no existía en el backup local (se omitió actualización local).")
-                        
-                except Exception as e:
-                    # Si falla el backup, NO avisamos al usuario (ya que su contraseña real sí cambió)
-                    # Solo lo registramos en consola
-                    print(f"⚠️ Error actualizando backup local: {e}")
-                finally:
-                    session_sqlite.close()
+            # Deshabilitar botón para evitar doble clic mientras redirige
+            username_input.disable()
+            email_input.disable()
+            new_password_input.disable()
+            
+            ui.timer(2.0, lambda: ui.navigate.to('/login'))
 
         # --- DISEÑO ---
         with ui.card().classes('w-full max-w-sm p-8 shadow-xl rounded-2xl bg-white border border-gray-100'):
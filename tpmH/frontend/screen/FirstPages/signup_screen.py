@@ -1,6 +1,5 @@
 from fastapi.responses import RedirectResponse
 from nicegui import app, ui, Client
-from passlib.hash import pbkdf2_sha256
 import zoneinfo
 import inspect # Necesario para verificar si la función de contenido es asíncrona
 
@@ -9,6 +8,7 @@ from prompts.chatbot import render_floating_chatbot
 from db.models import User
 from db.postgres_db import PostgresSession   
 from db.services import create_user_service 
+from auth.passwords import hash_password, client_ip
 from components.share_data import PACKAGE_LIMITS, goals_list
 from components.timezone_converter import get_timezone_from_ip 
 
@@ -67,7 +67,7 @@ async def create_signup_screen(client: Client):
     async def render_signup_content(): # <--- AÑADIDO: async
         
         # --- LÓGICA DE REGISTRO ---
-        def try_signup():
+        async def try_signup():
             # Obtener valores limpios
             data = {
                 'u': username.value.strip(),
@@ -114,7 +114,8 @@ async def create_signup_screen(client: Client):
                     "preferred_methods": selected_methods
                 }
 
-                password_hash = pbkdf2_sha256.hash(data['p'])
+                # pbkdf2 en el pool de procesos: no congela el loop
+                password_hash = await hash_password(data['p'])
                 user_dict = {
                     'username': data['u'],
                     'name': data['n'],
@@ -174,7 +175,7 @@ async def create_signup_screen(client: Client):
 
                 # --- AQUI ESTA LA LOGICA SOLICITADA ---
                 # 1. Obtenemos la IP y la Zona
-                user_tz = await get_timezone_from_ip(client.ip)
+                user_tz = await get_timezone_from_ip(client_ip(client))
 
                 # 2. Definimos valor por defecto
                 default_tz_value = 'UTC'
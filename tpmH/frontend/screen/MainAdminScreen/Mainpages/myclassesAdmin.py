@@ -1,71 +1,30 @@
-from nicegui import ui, app
-from datetime import datetime, timedelta
+from nicegui import ui
+from datetime import datetime, time, timedelta, timezone
 import logging
 import asyncio  # Importamos asyncio para corregir el error del loop
 from zoneinfo import ZoneInfo # Para manejo preciso de zonas al reagendar
 from dateutil import parser # Necesario para parsear fechas de Google
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from auth.sync_cal import sync_google_calendar_logic
-import os
+from components.sync_scheduler import get_job
+from sqlalchemy import select, or_, and_, func
 from db.postgres_db import PostgresSession
-from db.sqlite_db import BackupSession
-from db.models import AsignedClasses, User, ScheduleProf, ScheduleProfEsp, SchedulePref
+from sqlalchemy.exc import IntegrityError
+from db.executor import run_db
+from db.class_times import class_bounds, get_prof_timezone
+from db.models import AsignedClasses, User, SchedulePref
 from components.headerAdmin import create_admin_screen
-from components.db_migration import backup_entire_database
 
 
-from components.share_data import days_of_week, PACKAGE_LIMITS 
+from components.share_data import days_of_week 
 
 from components.timezone_converter import convert_student_to_teacher
+from components.availability import get_teacher_slots
+from components.query_cache import class_query_cache, invalidate_class_queries
+from components.class_finalizer import ACTIVE_STATUSES, FINALIZED_STATUSES, refresh_user_counters
 
 # Configuración de logger
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# --- SISTEMA DE CACHÉ GLOBAL ---
-class DataCache:
-    def __init__(self):
-        self.classes = None
-        self.users = None
-        self.all_student_names = [] # Almacenará todos los nombres para el selector
-        self.current_student_filter = None # Guardará el filtro activo
-        self.last_fetch = None
-        self.ttl = timedelta(hours=2) # 2 Horas de vida
-
-    def get(self, student_filter):
-        """Retorna (classes, users, student_names) si son válidos, sino None"""
-        if self.classes is None or self.last_fetch is None:
-            return None
-        
-        # Si el filtro de estudiante cambió, invalidamos la caché
-        if self.current_student_filter != student_filter:
-            return None
-            
-        if datetime.now() - self.last_fetch > self.ttl:
-            logger.info("Caché expirada. Se requiere recarga DB.")
-            return None
-            
-        return self.classes, self.users, self.all_student_names
-
-    def set(self, classes, users, student_names, student_filter):
-        self.classes = classes
-        self.users = users
-        self.all_student_names = student_names
-        self.current_student_filter = student_filter
-        self.last_fetch = datetime.now()
-        logger.info(f"Datos guardados en Caché RAM ({len(classes)} registros). Filtro: {student_filter}")
-
-    def invalidate(self):
-        self.classes = None
-        self.users = None
-        self.all_student_names = []
-        self.current_student_filter = None
-        logger.info("Caché invalidada manualmente.")
-
-# Instancia global (vive mientras corre la app)
-global_cache = DataCache()
-
 # Opciones de Estado para el Profesor
 STATUS_OPTIONS = {
     'Pendiente': {'color': 'orange', 'icon': 'schedule'},
@@ -76,13 +35,47 @@ STATUS_OPTIONS = {
     'No Asistió': {'color': 'grey', 'icon': 'person_off'}
 }
 
-# Estados que se consideran "Finalizados" para el historial general
-FINALIZED_STATUSES = {'Completada', 'Cancelada', 'No Asistió', 'Finalizada'}
+# Tamaño de página del Historial (paginación en el servidor)
+HISTORY_PAGE_SIZE = 20
+
 
-# Estados que CONSUMEN una clase del paquete (para class_count)
-CONSUMED_STATUSES = {'Completada', 'No Asistió'}
+def _history_conditions(current_filters):
+    """Traduce los filtros de la pantalla a condiciones SQL (WHERE) para el Historial."""
+    conds = [AsignedClasses.status.in_(FINALIZED_STATUSES)]
 
-POSITIVE_STATUS = ["Libre", "Available", "Disponible"]
+    f_student = current_filters.get('student')
+    if f_student and f_student != 'Todos':
+        # El selector guarda el username (columna indexada)
+        conds.append(AsignedClasses.username == f_student)
+
+    f_region = current_filters.get('region')
+    if f_region and f_region != 'Todas':
+        in_region = select(User.username).where(func.coalesce(User.time_zone, 'UTC') == f_region)
+        if f_region == 'UTC':
+            # Clases sin usuario (ej: Preply) se muestran como UTC
+            conds.append(or_(AsignedClasses.username.in_(in_region), AsignedClasses.username.notin_(select(User.username))))
+        else:
+            conds.append(AsignedClasses.username.in_(in_region))
+
+    f_time = current_filters.get('time_of_day')
+    if f_time and f_time != 'Todos':
+        t = func.coalesce(AsignedClasses.start_prof_time, AsignedClasses.start_time, 0)
+        if f_time == 'Mañana': conds.append(t < 1200)
+        elif f_time == 'Tarde': conds.append(and_(t >= 1200, t < 1900))
+        elif f_time == 'Noche': conds.append(t >= 1900)
+
+    f_date = current_filters.get('date')
+    if f_date:
+        conds.append(or_(
+            AsignedClasses.date_prof == f_date,
+            and_(AsignedClasses.date_prof.is_(None), AsignedClasses.date == f_date)
+        ))
+
+    f_status = current_filters.get('status')
+    if f_status and f_status != 'Todos':
+        conds.append(AsignedClasses.status == f_status)
+
+    return conds
 
 @ui.page('/myclassesAdmin')
 def my_classesAdmin():
@@ -93,10 +86,11 @@ def my_classesAdmin():
 
     # Almacenamos los valores de los filtros aquí
     filters = {
-        'student': None,       # Texto libre (Nombre/Apellido)
+        'student': None,       # Username del alumno (el selector muestra el nombre)
         'region': None,     # Zona horaria seleccionada
         'time_of_day': None, # 'Mañana', 'Tarde', 'Noche'
-        'date': None  # Fecha específica
+        'date': None,  # Fecha específica
+        'status': None  # Estado (solo Historial)
     }
 
     # ==============================================================================
@@ -107,14 +101,16 @@ def my_classesAdmin():
         Ejecuta secuencialmente:
         1. Sincronización Bidireccional Google Calendar <-> Neon
         2. Respaldo total Neon -> Supabase
+        Las corridas las hace el planificador (components/sync_scheduler.py):
+        si ya hay una en curso, este pedido se suma a la siguiente.
         """
         # --- CONFIGURACIÓN DE UI ---
         notification = ui.notification(timeout=None)
         notification.spinner = True
         
         try:
-            teacher_email = os.getenv('CALENDAR_ID')
-            if not teacher_email:
+            calendar_job = get_job('calendar')
+            if calendar_job is None:
                 notification.dismiss()
                 ui.notify('Error: Falta CALENDAR_ID en .env', type='negative')
                 return
@@ -124,12 +120,12 @@ def my_classesAdmin():
             # ==========================================
             notification.message = 'Fase 1/2: Sincronizando Google Calendar...'
             
-            # Ejecutamos en hilo aparte para no congelar la UI
-            google_result = await asyncio.to_thread(sync_google_calendar_logic, teacher_email)
+            # Corre en un hilo del planificador para no congelar la UI
+            google_result = await calendar_job.run_now()
             
             # Extraemos resultados de Google
             g_msg = google_result.get('msg', 'Google Sync OK')
-            g_new = google_result.get('new_count', 0)
+            g_new = google_result.get('preply_added', 0)
             g_upd = google_result.get('updated_count', 0)
 
             # ==========================================
@@ -137,8 +133,8 @@ def my_classesAdmin():
             # ==========================================
             notification.message = 'Fase 2/2: Clonando Base de Datos a Supabase...'
             
-            # Ejecutamos el respaldo también en hilo aparte (es pesado)
-            backup_result = await asyncio.to_thread(backup_entire_database)
+            # El respaldo también corre en el planificador (es pesado)
+            backup_result = await get_job('backup').run_now()
 
             notification.dismiss()
 
@@ -167,7 +163,7 @@ def my_classesAdmin():
             ui.notify(final_message, type=notif_type, icon='cloud_done', multi_line=True, close_button=True)
 
             # Refrescar la UI para mostrar los nuevos datos traídos de Google
-            global_cache.invalidate()
+            # (los commits del sync ya invalidaron las cachés)
             refresh_ui()
 
         except Exception as e:
@@ -177,138 +173,79 @@ def my_classesAdmin():
             ui.notify(f'Error crítico: {str(e)}', type='negative')
     
     # 1. LOGICA DE DATOS
-    def _get_all_classes_sync(admin_username, current_filters):
+    def _get_all_classes_sync(current_filters):
         """
+        Clases activas (hoy / próximas) + KPIs + opciones de filtros.
+        El Historial se pagina aparte (_get_history_page_sync).
         Versión OPTIMIZADA con Caché (Se ejecuta en un hilo separado).
         """
-        from sqlalchemy import or_, func # Importaciones necesarias para filtrar
-        
         session = PostgresSession()
         try:
-            # 1. Obtener Usuario Admin y Zonas Horarias
-            admin_user = session.query(User).filter(User.username == admin_username).first()
-            admin_tz_str = admin_user.time_zone if admin_user and admin_user.time_zone else 'America/Caracas'
-            try:
-                admin_tz = ZoneInfo(admin_tz_str)
-            except:
-                admin_tz = ZoneInfo('America/Caracas') 
-            
+            # 1. Zona de la profesora (la misma que usan start_at/end_at)
+            admin_tz = ZoneInfo(get_prof_timezone())
+
             now_admin_local = datetime.now(admin_tz).replace(tzinfo=None)
+            now_utc = datetime.now(timezone.utc)
             now_date_str = now_admin_local.strftime('%Y-%m-%d')
-            # Calculamos la fecha de hace un mes
-            one_month_ago_str = (now_admin_local - timedelta(days=30)).strftime('%Y-%m-%d')
-
-            student_filter = current_filters.get('student')
 
             # ======================================================
             # 2. LOGICA DE CACHÉ
             # ======================================================
-            cached_data = global_cache.get(student_filter)
+            # Las clases activas son pocas: se cargan todas una vez y los
+            # filtros (alumno, región, hora, fecha) se aplican en memoria.
+            generation = class_query_cache.generation
+            cached_data = class_query_cache.get(('admin_classes',))
             
             if cached_data:
                 # HIT: Usamos datos de memoria
-                all_classes, users, all_student_names = cached_data
+                all_classes, user_tz_map = cached_data
             else:
                 # MISS: Consultamos BD (Lento)
                 logger.info("⏳ Consultando Base de Datos OPTIMIZADA...")
-                query = session.query(AsignedClasses)
-                
-                if student_filter and student_filter != 'Todos':
-                    # Si hay filtro de estudiante, traemos TODO su historial. 
-                    # Concatenamos name y surname asegurándonos de que no haya NULLs
-                    query = query.filter(
-                        func.trim(func.concat(func.coalesce(AsignedClasses.name, ''), ' ', func.coalesce(AsignedClasses.surname, ''))) == student_filter
-                    )
-                else:
-                    # Sin filtro: Traemos marcadas como Pendiente o TODO lo del último mes
-                    query = query.filter(
-                        or_(
-                            AsignedClasses.status.in_(['Pendiente', 'Prueba_Pendiente']),
-                            AsignedClasses.date >= one_month_ago_str,
-                            AsignedClasses.date_prof >= one_month_ago_str
-                        )
-                    )
-                
-                all_classes = query.all()
-                users = session.query(User).all()
-                
-                # Para que el selector de filtro nunca pierda alumnos antiguos, consultamos todos los nombres únicos rápidamente
-                all_names_query = session.query(AsignedClasses.name, AsignedClasses.surname).distinct().all()
-                all_student_names = []
-                for row in all_names_query:
-                    full_name = f"{row.name or ''} {row.surname or ''}".strip()
-                    if full_name:
-                        all_student_names.append(full_name)
+                # Solo clases por dar: el historial ya no se carga entero
+                all_classes = session.query(AsignedClasses).filter(AsignedClasses.status.in_(ACTIVE_STATUSES)).all()
+                usernames = {c.username for c in all_classes}
+                # Zonas horarias de los alumnos: se cachean junto a las clases (los objetos
+                # en caché son compartidos entre páginas y no se modifican)
+                user_tz_map = dict(
+                    session.query(User.username, func.coalesce(User.time_zone, 'UTC'))
+                    .filter(User.username.in_(usernames)).all()
+                ) if usernames else {}
                 
                 # CRÍTICO: Desconectar objetos de la sesión para que vivan en caché
                 session.expunge_all() 
                 
-                # Guardamos en caché indicando a qué filtro pertenece
-                global_cache.set(all_classes, users, all_student_names, student_filter)
+                class_query_cache.set(('admin_classes',), (all_classes, user_tz_map), generation)
+                logger.info(f"Datos guardados en Caché RAM ({len(all_classes)} registros).")
+
+            # Opciones de los filtros: salen de la tabla de usuarios (no de las clases)
+            filter_options = class_query_cache.get(('filter_options',))
+            if filter_options is None:
+                filter_options = _load_filter_options(session)
+                class_query_cache.set(('filter_options',), filter_options, generation)
+            student_options, unique_regions = filter_options
 
-            # Mapeo de zonas horarias
-            user_tz_map = {u.username: (u.time_zone or 'UTC') for u in users}
-            
             today_classes = []
             upcoming_platform = [] 
             upcoming_preply = []   
-            history_classes = []
-            
-            unique_regions = set()
-            unique_students = set(all_student_names) # <- Usamos la lista global
             
-            ids_to_finalize = []
-
             for c in all_classes:
-                c.student_tz = user_tz_map.get(c.username, 'UTC')
-                unique_regions.add(c.student_tz)
-                # (Ya no agregamos a unique_students aquí porque lo hicimos globalmente arriba)
-
                 p_date = getattr(c, 'date_prof', None) or c.date
                 
-                # --- AUTO-FINALIZACIÓN ---
-                if c.status in ['Pendiente', 'Prueba_Pendiente']:
-                    try:
-                         if c.date_prof and c.start_prof_time:
-                            t_str = str(c.start_prof_time).zfill(4)
-                            c_start_prof = datetime.strptime(f"{c.date_prof} {t_str}", "%Y-%m-%d %H%M")
-                            dur = int(c.duration) if c.duration else 60
-                            c_end_prof = c_start_prof + timedelta(minutes=dur)
-
-                            if now_admin_local > c_end_prof:
-                                c.status = 'Finalizada'
-                                ids_to_finalize.append(c.id)
-                    except Exception: pass
-                
-                # --- CLASIFICACIÓN ---
-                is_future = False
-                try:
-                    if c.date_prof and c.start_prof_time:
-                        t_str = str(c.start_prof_time).zfill(4)
-                        c_start = datetime.strptime(f"{c.date_prof} {t_str}", "%Y-%m-%d %H%M")
-                        if c_start > now_admin_local: is_future = True
-                except: pass
+                _, c_end = class_bounds(c)
 
+                # --- CLASIFICACIÓN ---
+                # (La auto-finalización la hace la tarea de fondo: components/class_finalizer.py)
                 full_name = f"{c.name} {c.surname}".strip()
 
-                if c.status in FINALIZED_STATUSES or c.status == 'Finalizada':
-                    history_classes.append(c)
-                elif p_date == now_date_str:
+                if p_date == now_date_str:
                     today_classes.append(c)
-                elif is_future or (p_date > now_date_str and c.status not in FINALIZED_STATUSES):
-                    if "- Preply lesson" in full_name: upcoming_preply.append(c)
-                    else: upcoming_platform.append(c)
+                elif c_end is not None and c_end <= now_utc:
+                    continue  # Ya pasó: la tarea de fondo la pasará al Historial
+                elif "- Preply lesson" in full_name:
+                    upcoming_preply.append(c)
                 else:
-                    history_classes.append(c)
-
-            # --- ESCRITURA EN DB ---
-            if ids_to_finalize:
-                try:
-                    session.query(AsignedClasses).filter(AsignedClasses.id.in_(ids_to_finalize)).update({AsignedClasses.status: 'Finalizada'}, synchronize_session=False)
-                    session.commit()
-                except Exception as e:
-                    logger.error(f"Error auto-finalizando: {e}")
-                    session.rollback()
+                    upcoming_platform.append(c)
 
             def sort_key_prof(x):
                 d = getattr(x, 'date_prof', None) or x.date or "9999-99-99"
@@ -318,25 +255,133 @@ def my_classesAdmin():
             today_classes.sort(key=sort_key_prof)
             upcoming_platform.sort(key=sort_key_prof)
             upcoming_preply.sort(key=sort_key_prof)
-            history_classes.sort(key=sort_key_prof, reverse=True)
+
+            # --- KPIs (agregados en SQL sobre los índices de estado y fecha) ---
+            kpis = class_query_cache.get(('kpis', now_date_str))
+            if kpis is None:
+                kpis = _count_kpis(session, now_date_str)
+                class_query_cache.set(('kpis', now_date_str), kpis, generation)
             
-            return today_classes, upcoming_platform, upcoming_preply, history_classes, sorted(list(unique_regions)), sorted(list(unique_students)), all_classes
+            return today_classes, upcoming_platform, upcoming_preply, kpis, unique_regions, student_options, user_tz_map
             
         except Exception as e:
             logger.error(f"Error fetching admin classes: {e}")
-            return [], [], [], [], [], [], []
+            return None
+        finally:
+            session.close()
+
+    def _load_filter_options(session):
+        """
+        Alumnos ({username: "Nombre Apellido"}, ordenado por nombre) y regiones.
+        Sale de la tabla de usuarios (pocas filas), no de un DISTINCT sobre las clases.
+        Las clases de Preply no tienen cuenta: no aparecen como alumno.
+        """
+        rows = session.query(User.username, User.name, User.surname).filter(
+            func.coalesce(User.role, 'client') != 'admin'
+        ).all()
+        students = {}
+        for r in sorted(rows, key=lambda r: f"{r.name or ''} {r.surname or ''}".strip().lower()):
+            students[r.username] = f"{r.name or ''} {r.surname or ''}".strip() or r.username
+        # Regiones: todas las zonas de los alumnos (no solo las de las clases cargadas)
+        regions = sorted(tz for (tz,) in session.query(func.coalesce(User.time_zone, 'UTC')).distinct())
+        return students, regions
+
+    def _count_kpis(session, now_date_str):
+        """
+        KPIs generales y de hoy. Los generales son un conteo por estado (se
+        resuelve con el índice (status, end_at)); los de hoy solo leen las
+        clases del día (índices por fecha).
+        """
+        by_status = dict(session.query(AsignedClasses.status, func.count()).group_by(AsignedClasses.status).all())
+
+        is_today = or_(
+            AsignedClasses.date_prof == now_date_str,
+            and_(AsignedClasses.date_prof.is_(None), AsignedClasses.date == now_date_str)
+        )
+        day_statuses = [status for (status,) in session.query(AsignedClasses.status).filter(is_today)]
+
+        return {
+            'gen_total': sum(by_status.values()),
+            'gen_pending': sum(n for st, n in by_status.items() if st in ACTIVE_STATUSES),
+            'gen_completed': by_status.get('Completada', 0),
+            'day_total': len(day_statuses),
+            'day_pending': sum(1 for st in day_statuses if st in ACTIVE_STATUSES),
+            'day_completed': day_statuses.count('Completada'),
+        }
+
+    def _get_history_page_sync(current_filters, cursor=None, page_size=HISTORY_PAGE_SIZE):
+        """
+        Una página del Historial con los filtros en el WHERE.
+        Paginación por cursor (keyset) sobre (start_at, id) descendente: cada página
+        cuesta lo mismo sin importar cuántos años de clases haya. Las clases sin
+        start_at (fecha ilegible) van al final, por id; su cursor lleva start_at None.
+        Retorna (clases, siguiente_cursor, {username: zona}); siguiente_cursor es None si no hay más.
+        """
+        cache_key = ('history', tuple(sorted(current_filters.items())), cursor, page_size)
+        generation = class_query_cache.generation
+        cached_page = class_query_cache.get(cache_key)
+        if cached_page is not None:
+            return cached_page
+
+        session = PostgresSession()
+        try:
+            query = session.query(AsignedClasses).filter(*_history_conditions(current_filters))
+            c_start, c_id = cursor if cursor else (None, None)
+            rows = []
+
+            # 1. Clases con start_at (índice ix_clases_start_at)
+            if cursor is None or c_start is not None:
+                dated = query.filter(AsignedClasses.start_at.isnot(None))
+                if cursor:
+                    dated = dated.filter(or_(
+                        AsignedClasses.start_at < c_start,
+                        and_(AsignedClasses.start_at == c_start, AsignedClasses.id < c_id)
+                    ))
+                rows = dated.order_by(AsignedClasses.start_at.desc(), AsignedClasses.id.desc()).limit(page_size + 1).all()
+
+            # 2. Agotadas ésas, las que no tienen start_at
+            if len(rows) <= page_size:
+                undated = query.filter(AsignedClasses.start_at.is_(None))
+                if c_id is not None and c_start is None:
+                    undated = undated.filter(AsignedClasses.id < c_id)
+                rows += undated.order_by(AsignedClasses.id.desc()).limit(page_size + 1 - len(rows)).all()
+
+            has_more = len(rows) > page_size
+            rows = rows[:page_size]
+
+            usernames = {c.username for c in rows}
+            tz_map = dict(
+                session.query(User.username, func.coalesce(User.time_zone, 'UTC'))
+                .filter(User.username.in_(usernames)).all()
+            ) if usernames else {}
+
+            session.expunge_all()
+            next_cursor = (rows[-1].start_at, rows[-1].id) if has_more else None
+            class_query_cache.set(cache_key, (rows, next_cursor, tz_map), generation)
+            return rows, next_cursor, tz_map
+        except Exception as e:
+            logger.error(f"Error fetching history page: {e}")
+            return [], None, {}
         finally:
             session.close()
 
     async def get_all_classes():
         """ Envoltorio asíncrono que envía la tarea a un hilo secundario """
-        admin_username = app.storage.user.get("username")
         # Capturamos los filtros actuales para pasarlos de forma segura al Hilo
         current_filters = {k: v for k, v in filters.items()}
-        return await asyncio.to_thread(_get_all_classes_sync, admin_username, current_filters)
+        return await run_db(_get_all_classes_sync, current_filters)
+
+    async def get_history_page(cursor=None):
+        """ Trae la siguiente página del Historial en el pool de BD """
+        current_filters = {k: v for k, v in filters.items()}
+        return await run_db(_get_history_page_sync, current_filters, cursor)
     
+    def student_tz(c):
+        """Zona horaria del alumno de la clase (mapa cargado junto a las clases)."""
+        return state.student_tzs.get(c.username) or 'UTC'
+
     def filter_list(class_list):
-        """Aplica los filtros activos a una lista."""
+        """Aplica los filtros activos a una lista (solo clases activas; el Historial filtra en SQL)."""
         filtered = []
         # Obtenemos valores limpios de los filtros
         f_student = filters['student']
@@ -345,15 +390,14 @@ def my_classesAdmin():
         f_date = filters['date']
 
         for c in class_list:
-            # 1. Filtro Estudiante (Selector)
+            # 1. Filtro Estudiante (Selector: username)
             if f_student and f_student != 'Todos':
-                full_name = f"{c.name} {c.surname}".strip()
-                if full_name != f_student:
+                if c.username != f_student:
                     continue
             
             # 2. Filtro Región
             if f_region and f_region != 'Todas':
-                if c.student_tz != f_region:
+                if student_tz(c) != f_region:
                     continue
             
             # 3. Filtro Hora
@@ -374,7 +418,8 @@ def my_classesAdmin():
             filtered.append(c)
         return filtered
 
-    async def update_status(c_id, new_status):
+    def _update_status_sync(c_id, new_status):
+        """Cambia el estado y recalcula contadores del alumno. Corre en el pool de BD."""
         session = PostgresSession()
         try:
             cls = session.query(AsignedClasses).filter(AsignedClasses.id == c_id).first()
@@ -383,93 +428,39 @@ def my_classesAdmin():
                 
                 # --- ACTUALIZACIÓN DE USER (Contadores DB) ---
                 session.flush() 
+                refresh_user_counters(session, [cls.username])
 
-                user = session.query(User).filter(User.username == cls.username).first()
-                if user:
-                    # 1. TOTAL CLASSES (Histórico) - NO contamos pruebas
-                    finalized_count = session.query(AsignedClasses).filter(
-                        AsignedClasses.username == cls.username,
-                        AsignedClasses.status.in_(['Completada', 'Cancelada', 'No Asistió', 'Finalizada']),
-                        AsignedClasses.status.notlike('%Prueba_Pendiente%')
-                    ).count()
-                    user.total_classes = finalized_count
-
-                    # 2. CLASS COUNT (Paquete Mensual) - NO contamos pruebas
-                    #try:
-                    #    c_date_obj = datetime.strptime(cls.date, '%Y-%m-%d')
-                    #    month_prefix = c_date_obj.strftime('%Y-%m')
-                    #except:
-                    #    month_prefix = datetime.now().strftime('%Y-%m')
-
-                    month_consumed = session.query(AsignedClasses).filter(
-                        AsignedClasses.username == cls.username,
-                        #AsignedClasses.date.startswith(month_prefix),
-                        AsignedClasses.status.in_(CONSUMED_STATUSES),
-                        AsignedClasses.status.notlike('%Prueba_Pendiente%')
-                    ).count()
-
-                    pkg_limit = PACKAGE_LIMITS.get(user.package, 0)
-                    user.class_count = f"{month_consumed}/{pkg_limit}" if pkg_limit > 0 else f"{month_consumed}"
-
-                    session.add(user)
-
+                # Cancelar (o reactivar) libera/ocupa el hueco: lo invalida el hook de commit
                 session.commit()
-                global_cache.invalidate()
-                
-                # Backup SQLite (Misma lógica)
-                try:
-                    bk_sess = BackupSession()
-                    bk_cls = bk_sess.query(AsignedClasses).filter(
-                        AsignedClasses.username == cls.username,
-                        AsignedClasses.date == cls.date,
-                        AsignedClasses.start_time == cls.start_time
-                    ).first()
-                    
-                    if bk_cls:
-                        bk_cls.status = new_status
-                    else:
-                        # Si no existe, lo creamos (manteniendo lógica de nulos si es prueba)
-                        bk_sess.add(AsignedClasses(
-                            username=cls.username, name=cls.name, surname=cls.surname,
-                            date=cls.date, days=cls.days, start_time=cls.start_time,
-                            end_time=cls.end_time, duration=cls.duration, 
-                            package=cls.package, status=new_status,
-                            start_prof_time=getattr(cls, 'start_prof_time', None),
-                            end_prof_time=getattr(cls, 'end_prof_time', None),
-                            date_prof=getattr(cls, 'date_prof', None),
-                            class_count=getattr(cls, 'class_count', None),
-                            total_classes=getattr(cls, 'total_classes', None)
-                        ))
-                    
-                    if user:
-                        bk_user = bk_sess.query(User).filter(User.username == cls.username).first()
-                        if bk_user:
-                            bk_user.total_classes = user.total_classes
-                            bk_user.class_count = user.class_count
-
-                    bk_sess.commit()
-                    bk_sess.close()
-                except Exception as e:
-                    logger.error(f"Error backup sqlite: {e}")
-
-                ui.notify(f'Clase actualizada a: {new_status}', type='positive', icon='check')
-                refresh_ui()
-        except Exception as e:
-            ui.notify(f"Error al actualizar: {e}", type='negative')
+                return True
+            return False
+        except Exception:
+            session.rollback()
+            raise
         finally:
             session.close()
 
+    async def update_status(c_id, new_status):
+        try:
+            updated = await run_db(_update_status_sync, c_id, new_status)
+        except IntegrityError:
+            ui.notify("Ya hay una clase activa de este alumno a esa hora.", type='warning')
+            return
+        except Exception as e:
+            ui.notify(f"Error al actualizar: {e}", type='negative')
+            return
+
+        if updated:
+            ui.notify(f'Clase actualizada a: {new_status}', type='positive', icon='check')
+            refresh_ui()
+
     # --- LÓGICA DE REAGENDAMIENTO ---
-    async def reschedule_class(c_id, new_prof_date, new_prof_time_int, new_student_date, new_student_time_int, dialog):
+    def _reschedule_class_sync(c_id, new_prof_date, new_prof_time_int, new_student_date, new_student_time_int):
+        """Mueve la clase (Neon; el outbox replica al backup). Retorna False si no existe. Corre en el pool de BD."""
         session = PostgresSession()
         try:
             cls = session.query(AsignedClasses).filter(AsignedClasses.id == c_id).first()
             if cls:
-                # Guardar valores viejos para buscar en Backup
-                old_date = cls.date
-                old_start = cls.start_time
-                username = cls.username
-
                 # Calcular Duración y End Times
                 duration = int(cls.duration) if cls.duration else 60
                 
@@ -500,45 +491,33 @@ def my_classesAdmin():
                 cls.start_prof_time = new_prof_time_int
                 cls.end_prof_time = new_prof_end_int
                 session.commit()
-                global_cache.invalidate()
-
-                # 5. Actualizar Backup SQLite
-                try:
-                    bk_sess = BackupSession()
-                    bk_cls = bk_sess.query(AsignedClasses).filter(
-                        AsignedClasses.username == username,
-                        AsignedClasses.date == old_date,
-                        AsignedClasses.start_time == old_start
-                    ).first()
-                    
-                    if bk_cls:
-                        bk_cls.date = new_student_date
-                        bk_cls.start_time = new_student_time_int
-                        bk_cls.end_time = new_student_end_int
-                        bk_cls.days = new_day_name
-                        bk_cls.date_prof = new_prof_date
-                        bk_cls.start_prof_time = new_prof_time_int
-                        bk_cls.end_prof_time = new_prof_end_int
-                        bk_sess.commit()
-                    bk_sess.close()
-                except Exception as e:
-                    logger.error(f"Error backup reschedule: {e}")
-
-                ui.notify(f"Clase reagendada correctamente.", type='positive')
-                dialog.close()
-                refresh_ui()
-            else:
-                ui.notify("Clase no encontrada", type='negative')
-        except Exception as e:
-            ui.notify(f"Error al reagendar: {e}", type='negative')
+                return True
+            return False
+        except Exception:
+            session.rollback()
+            raise
         finally:
             session.close()
 
+    async def reschedule_class(c_id, new_prof_date, new_prof_time_int, new_student_date, new_student_time_int, dialog):
+        try:
+            moved = await run_db(_reschedule_class_sync, c_id, new_prof_date, new_prof_time_int, new_student_date, new_student_time_int)
+        except IntegrityError:
+            ui.notify("Ya hay una clase activa de este alumno a esa hora.", type='warning')
+            return
+        except Exception as e:
+            ui.notify(f"Error al reagendar: {e}", type='negative')
+            return
+
+        if moved:
+            ui.notify(f"Clase reagendada correctamente.", type='positive')
+            dialog.close()
+            refresh_ui()
+        else:
+            ui.notify("Clase no encontrada", type='negative')
+
 
     def open_reschedule_dialog(c, on_success=None):
-   
-        # Obtener el usuario admin actual (o forzar el que se esté usando)
-        admin_username = app.storage.user.get("username")
 
         # === 1. LÓGICA DE BÚSQUEDA (Misma lógica Admin, estructura limpia) ===
         def get_slots_data(date_str):
@@ -553,70 +532,36 @@ def my_classesAdmin():
                 except ValueError: return []
                 
                 query_date = dt.strftime('%Y-%m-%d')
-                day_name = days_of_week[dt.weekday()]
-                
-                # A) Disponibilidad (Tus reglas)
-                rules = session.query(ScheduleProfEsp).filter_by(date=query_date).all()
-                if not rules:
-                    rules = session.query(ScheduleProf).filter_by(days=day_name).all()
                 
-                avail_ranges = []
-                POSITIVE_STATUS = ["Libre", "Available", "Disponible"]
-                for r in rules:
-                    status = str(r.avai if hasattr(r, 'avai') else r.availability)
-                    if status in POSITIVE_STATUS:
-                        avail_ranges.append((r.start_time, r.end_time))
-                
-                # B) Ocupado (Tus clases, EXCLUYENDO la actual c.id)
-                busy = session.query(AsignedClasses).filter(
-                    AsignedClasses.date_prof == query_date,
-                    AsignedClasses.status.notin_(['Cancelled', 'Cancelada']),
-                    AsignedClasses.id != c.id 
-                ).all()
-                busy_ranges = [(b.start_prof_time, b.end_prof_time) for b in busy if b.start_prof_time]
-
-                # C) Zonas Horarias
+                # A) Zonas Horarias
                 # 1. Alumno
                 student_user = session.query(User).filter(User.username == c.username).first()
                 student_tz_str = student_user.time_zone if student_user and student_user.time_zone else 'UTC'
                 
                 # 2. Profesora (Tú)
-                admin_user = session.query(User).filter(User.username == admin_username).first()
-                teacher_tz_str = admin_user.time_zone if admin_user and admin_user.time_zone else 'America/Caracas'
+                teacher_tz_str = get_prof_timezone()
 
-                # D) Cálculo Slots
+                # B) Cálculo Slots (motor único, EXCLUYENDO la clase actual c.id)
                 try: duration = int(float(c.duration)) if c.duration else 60
                 except: duration = 60
-                step = 30
-                
-                def to_minutes(hhmm): return (hhmm // 100) * 60 + (hhmm % 100)
-                def to_hhmm_int(minutes): return ((minutes // 60) * 100) + (minutes % 60)
-                busy_ranges_min = [(to_minutes(bs), to_minutes(be)) for bs, be in busy_ranges]
-
-                valid_slots = []
-                for start, end in avail_ranges:
-                    curr_m = to_minutes(start)
-                    end_m = to_minutes(end)
-                    while curr_m + duration <= end_m:
-                        s_end_m = curr_m + duration
-                        is_busy = False
-                        for b_s_m, b_e_m in busy_ranges_min:
-                            if (curr_m < b_e_m) and (s_end_m > b_s_m): is_busy = True; break
-                        if not is_busy: valid_slots.append(to_hhmm_int(curr_m))
-                        curr_m += step 
                 
-                unique_slots = sorted(list(set(valid_slots)))
+                unique_slots, _ = get_teacher_slots(session, query_date, duration, exclude_class_id=c.id)
+
+                # Preferencias del alumno: una sola consulta, agrupadas por día
+                prefs_by_day = {}
+                for p in session.query(SchedulePref).filter(SchedulePref.username == c.username).all():
+                    prefs_by_day.setdefault(p.days, []).append(p)
+
+                prof_tz = ZoneInfo(teacher_tz_str)
+                stud_tz = ZoneInfo(student_tz_str)
                 
-                # E) Conversión y Formato
+                # C) Conversión y Formato
                 for slot in unique_slots:
                     t_h, t_m = slot // 100, slot % 100
                     t_str = f"{str(t_h).zfill(2)}:{str(t_m).zfill(2)}"
                     try:
-                        prof_tz = ZoneInfo(teacher_tz_str)
-                        stud_tz = ZoneInfo(student_tz_str)
-                        
                         # Creado en Zona Profe
-                        dt_prof = datetime.strptime(f"{query_date} {t_str}", "%Y-%m-%d %H:%M").replace(tzinfo=prof_tz)
+                        dt_prof = datetime.combine(dt.date(), time(t_h, t_m), tzinfo=prof_tz)
                         dt_stud = dt_prof.astimezone(stud_tz)
                         
                         dt_prof_end = dt_prof + timedelta(minutes=duration)
@@ -624,21 +569,20 @@ def my_classesAdmin():
                         
                         s_time_str = dt_stud.strftime("%H:%M")
                         s_date_str = dt_stud.strftime("%Y-%m-%d")
-                        s_time_int = int(dt_stud.strftime("%H%M"))
-                        s_end_int = int(dt_stud_end.strftime("%H%M"))
+                        s_time_int = dt_stud.hour * 100 + dt_stud.minute
+                        s_end_int = dt_stud_end.hour * 100 + dt_stud_end.minute
                         s_weekday = days_of_week[dt_stud.weekday()]
                         
                         # Preferencias del Alumno
                         is_preferred = False
-                        prefs = session.query(SchedulePref).filter(SchedulePref.username == c.username, SchedulePref.days == s_weekday).all()
-                        for p in prefs:
+                        for p in prefs_by_day.get(s_weekday, []):
                             if p.start_time <= s_time_int < p.end_time: is_preferred = True; break
                         
                         day_diff = f"({s_weekday})" if s_date_str != query_date else ""
 
                         slots_data.append({
                             't_time_int': slot, 
-                            't_end_int': int(dt_prof_end.strftime("%H%M")), 
+                            't_end_int': dt_prof_end.hour * 100 + dt_prof_end.minute, 
                             't_date': query_date, 
                             't_time_str': t_str,
                             
@@ -696,7 +640,7 @@ def my_classesAdmin():
                     
                     date_val = date_input.value
                     # Ejecutar lógica DB en hilo separado
-                    slots = await asyncio.to_thread(get_slots_data, date_val)
+                    slots = await run_db(get_slots_data, date_val)
                     
                     spinner.classes(add='hidden')
                     
@@ -756,11 +700,12 @@ def my_classesAdmin():
                         with ui.row().classes('w-full justify-end gap-2'):
                             ui.button('Cancelar', on_click=confirm_d.close).props('flat color=slate')
                             
-                            async def execute_save():
+                            def _save_slot_sync():
+                                """Aplica el hueco elegido a la clase. Retorna False si no existe. Corre en el pool de BD."""
                                 session = PostgresSession()
                                 try:
                                     class_db = session.query(AsignedClasses).filter(AsignedClasses.id == c.id).first()
-                                    if not class_db: ui.notify("Error: Clase no encontrada", type='negative'); return
+                                    if not class_db: return False
 
                                     # Actualizar DB (Ambos lados)
                                     class_db.date = slot_data['s_date']; class_db.days = slot_data['s_weekday']
@@ -772,18 +717,28 @@ def my_classesAdmin():
                                     class_db.status = 'Pendiente'
 
                                     session.commit()
-                                    ui.notify(f"Clase reagendada correctamente.", type='positive')
-                                    
-                                    confirm_d.close()
-                                    d.close()
-                                    
-                                    # Callback de refresco
-                                    if on_success: on_success()
-                                    else: ui.navigate.reload() # Fallback si no hay callback
-                                    
-                                except Exception as e:
-                                    session.rollback(); ui.notify(f"Error: {e}", type='negative')
+                                    return True
+                                except Exception:
+                                    session.rollback(); raise
                                 finally: session.close()
+
+                            async def execute_save():
+                                try:
+                                    saved = await run_db(_save_slot_sync)
+                                except IntegrityError:
+                                    ui.notify("Ya hay una clase activa de este alumno a esa hora.", type='warning'); return
+                                except Exception as e:
+                                    ui.notify(f"Error: {e}", type='negative'); return
+                                if not saved: ui.notify("Error: Clase no encontrada", type='negative'); return
+
+                                ui.notify(f"Clase reagendada correctamente.", type='positive')
+                                
+                                confirm_d.close()
+                                d.close()
+                                
+                                # Callback de refresco
+                                if on_success: on_success()
+                                else: ui.navigate.reload() # Fallback si no hay callback
                                     
                             ui.button('Confirmar', on_click=execute_save).props('unelevated color=indigo')
                     confirm_d.open()
@@ -878,7 +833,7 @@ def my_classesAdmin():
                         ui.label(f"{c.package}").classes('text-[10px] font-bold bg-gray-100 text-gray-600 px-2 py-0.5 rounded')
 
                     # ETIQUETA: ZONA HORARIA ESTUDIANTE
-                    st_tz = getattr(c, 'student_tz', 'UTC')
+                    st_tz = student_tz(c)
                     ui.label(f"{st_tz}").classes('text-[10px] font-bold bg-blue-50 text-blue-700 px-2 py-0.5 rounded border border-blue-100').tooltip('Zona horaria del estudiante')
 
                     # ETIQUETA: TIPO DE CLASE
@@ -919,6 +874,12 @@ def my_classesAdmin():
     class PageState:
         loading = True
         data = None
+        student_tzs = {}  # {username: zona} de las clases mostradas
+        # Historial paginado
+        history = []
+        history_cursor = None
+        history_loading = False
+        history_gen = 0  # cambia al recargar: descarta páginas de filtros viejos
 
     state = PageState()
 
@@ -966,29 +927,16 @@ def my_classesAdmin():
             return
         
         # 1. Obtener Datos 
-        today_raw, up_platform, up_preply, history_raw, available_regions, available_students, all_classes_raw = state.data
+        today_raw, up_platform, up_preply, kpis, available_regions, available_students, _ = state.data
         
         # 2. Filtrar Datos (Aplicar filtros a cada lista)
         filtered_today = filter_list(today_raw)
         filtered_platform = filter_list(up_platform)
         filtered_preply = filter_list(up_preply)
-        filtered_history = filter_list(history_raw)
 
-        # 3. CÁLCULO DE KPIs
-        
-        # --- A. Métricas Generales (Todo el historial de la BD) ---
-        gen_total = len(all_classes_raw)
-        gen_pending = sum(1 for c in all_classes_raw if c.status in ['Pendiente', 'Prueba_Pendiente'])
-        gen_completed = sum(1 for c in all_classes_raw if c.status == 'Completada') 
-        
-        # --- B. Métricas de Hoy ---
-        now_str = datetime.now().strftime('%Y-%m-%d')
-        # Buscamos clases que sean de HOY en cualquiera de las listas (incluso historial si ya pasaron hoy)
-        all_today_candidates = today_raw + [c for c in history_raw if (getattr(c, 'date_prof', None) or c.date) == now_str]
-        
-        day_total = len(all_today_candidates)
-        day_pending = sum(1 for c in all_today_candidates if c.status in ['Pendiente', 'Prueba_Pendiente'])
-        day_completed = sum(1 for c in all_today_candidates if c.status == 'Completada')
+        # 3. KPIs (ya vienen agregados desde la BD)
+        gen_total, gen_pending, gen_completed = kpis['gen_total'], kpis['gen_pending'], kpis['gen_completed']
+        day_total, day_pending, day_completed = kpis['day_total'], kpis['day_pending'], kpis['day_completed']
 
         with ui.column().classes('w-full max-w-6xl mx-auto p-4 md:p-8 gap-6'):
             
@@ -1004,7 +952,7 @@ def my_classesAdmin():
                 with ui.row().classes('items-center gap-3'):
                     ui.button('Sincronizar', on_click=run_sync, icon='sync_alt') \
                         .props('flat no-caps').classes('text-slate-700 bg-white border border-slate-200 rounded-full px-5 py-2 text-sm font-semibold shadow-sm')
-                    ui.button(icon='refresh', on_click=lambda: (global_cache.invalidate(), refresh_ui())).props('flat round dense').tooltip('Recargar desde la Nube')
+                    ui.button(icon='refresh', on_click=lambda: (invalidate_class_queries(), refresh_ui())).props('flat round dense').tooltip('Recargar desde la Nube')
 
             # --- SECCIÓN DE KPIs (TABS) ---
             with ui.card().classes('w-full p-0 rounded-xl bg-white border border-slate-100 shadow-sm overflow-hidden'):
@@ -1061,7 +1009,7 @@ def my_classesAdmin():
 
                     # 2. OTROS FILTROS (Asegurando estilo consistente)
                     
-                    stud_opts = ['Todos'] + available_students
+                    stud_opts = {'Todos': 'Todos', **available_students}
                     ui.select(options=stud_opts, value=filters['student'] or 'Todos', label='Estudiante', with_input=True) \
                         .props('outlined dense') \
                         .bind_value(filters, 'student').on('update:model-value', refresh_ui).classes('flex-1 min-w-[200px]')
@@ -1075,6 +1023,11 @@ def my_classesAdmin():
                     ui.select(options=time_opts, value=filters['time_of_day'] or 'Todos', label='Horario') \
                         .props('outlined dense') \
                         .bind_value(filters, 'time_of_day').on('update:model-value', refresh_ui).classes('w-40')
+
+                    status_opts = ['Todos'] + [s for s in STATUS_OPTIONS if s in FINALIZED_STATUSES]
+                    ui.select(options=status_opts, value=filters['status'] or 'Todos', label='Estado (Historial)') \
+                        .props('outlined dense') \
+                        .bind_value(filters, 'status').on('update:model-value', refresh_ui).classes('w-48')
                 
 
             # --- LISTAS DE CLASES ---
@@ -1118,18 +1071,38 @@ def my_classesAdmin():
 
             # 3. HISTORIAL
             with ui.expansion('Historial', icon='history').classes('w-full bg-slate-50 border border-slate-100 rounded-xl'):
-                with ui.column().classes('w-full p-4 gap-3'):
-                    if not filtered_history:
-                        ui.label('Historial vacío.').classes('text-slate-400 italic')
-                    for c in filtered_history:
-                        render_admin_class_card(c, is_history=True)
+                render_history()
+
+    @ui.refreshable
+    def render_history():
+        with ui.column().classes('w-full p-4 gap-3'):
+            if not state.history:
+                ui.label('Cargando historial...' if state.history_loading else 'Historial vacío.').classes('text-slate-400 italic')
+            for c in state.history:
+                render_admin_class_card(c, is_history=True)
+            if state.history_cursor:
+                ui.button('Cargar más', icon='expand_more', on_click=load_more_history) \
+                    .props('flat no-caps' + (' loading' if state.history_loading else '')) \
+                    .classes('self-center text-slate-600')
+
+    async def load_more_history():
+        if state.history_loading:
+            return
+        gen = state.history_gen
+        state.history_loading = True
+        render_history.refresh()
+        rows, next_cursor, tz_map = await get_history_page(state.history_cursor)
+        if gen != state.history_gen:
+            return
+        state.student_tzs.update(tz_map)
+        state.history.extend(rows)
+        state.history_cursor = next_cursor
+        state.history_loading = False
+        render_history.refresh()
 
     async def load_and_render():
-        # Capturamos si hay filtro para verificar la caché correctamente
-        student_filter = filters.get('student')
-        
-        # Si NO hay caché disponible para este estado, forzamos mostrar el esqueleto
-        if global_cache.get(student_filter) is None:
+        # Si NO hay caché disponible, forzamos mostrar el esqueleto
+        if ('admin_classes',) not in class_query_cache:
             state.loading = True
             render_content.refresh()
             # CRÍTICO: Esta micropausa obliga a NiceGUI a mandar el esqueleto a la pantalla YA
@@ -1137,11 +1110,21 @@ def my_classesAdmin():
             
         # Esperamos a la Base de Datos (en segundo plano)
         state.data = await get_all_classes()
+        state.student_tzs = dict(state.data[-1]) if state.data else {}
         
+        # Los filtros pudieron cambiar: el Historial vuelve a la primera página
+        state.history = []
+        state.history_cursor = None
+        state.history_gen += 1
+        state.history_loading = False
+
         # Apagamos el esqueleto y mostramos los datos
         state.loading = False
         render_content.refresh()
 
+        if state.data:
+            await load_more_history()
+
     def refresh_ui():
         # Delegamos la recarga al bucle de eventos para no bloquear la UI al hacer clics
         ui.timer(0, load_and_render, once=True)
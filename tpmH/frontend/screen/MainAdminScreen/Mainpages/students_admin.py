@@ -1,6 +1,6 @@
 from nicegui import ui, app
 from db.postgres_db import PostgresSession
-from db.sqlite_db import BackupSession
+from db.executor import run_db
 from db.models import User, AsignedClasses
 from components.headerAdmin import create_admin_screen
 from components.share_data import PACKAGE_LIMITS
@@ -94,80 +94,100 @@ def students():
             session.close()
 
     # --- 2. LÓGICA DE ACTUALIZACIÓN (BACKEND + FRONTEND) ---
-    async def update_payment_counter(user_id, delta):
+    def _update_payment_counter_sync(user_id, delta):
+        """Actualiza los contadores de pago en Neon. Corre en el pool de BD.
+        Retorna (new_paid, real_limit, money) o None si no existe el usuario."""
         session = PostgresSession()
         try:
             user = session.query(User).filter(User.id == user_id).first()
-            if user:
-                payment_data = dict(user.payment_info) if user.payment_info else {}
-                real_limit = PACKAGE_LIMITS.get(user.package, 0)
-                current_str = payment_data.get('Clases_paquete', f"0/{real_limit}")
-                
-                try:
-                    curr_paid, _ = map(int, current_str.split('/'))
-                except:
-                    curr_paid = 0
-                
-                new_paid = max(0, curr_paid + delta)
-                payment_data['Clases_paquete'] = f"{new_paid}/{real_limit}"
+            if not user:
+                return None
 
-                current_total = payment_data.get('Clases_totales', 0)
-                new_total_historico = max(0, current_total + delta)
-                payment_data['Clases_totales'] = new_total_historico
-
-                user.payment_info = payment_data
-                session.commit()
+            payment_data = dict(user.payment_info) if user.payment_info else {}
+            real_limit = PACKAGE_LIMITS.get(user.package, 0)
+            current_str = payment_data.get('Clases_paquete', f"0/{real_limit}")
+            
+            try:
+                curr_paid, _ = map(int, current_str.split('/'))
+            except:
+                curr_paid = 0
+            
+            new_paid = max(0, curr_paid + delta)
+            payment_data['Clases_paquete'] = f"{new_paid}/{real_limit}"
+
+            current_total = payment_data.get('Clases_totales', 0)
+            new_total_historico = max(0, current_total + delta)
+            payment_data['Clases_totales'] = new_total_historico
+
+            user.payment_info = payment_data
+            session.commit()
+
+            # Calculamos el dinero total para la notificación usando el precio del usuario
+            user_price = user.price if hasattr(user, 'price') and user.price is not None else 10
+            money = new_total_historico * user_price
+            return new_paid, real_limit, money
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
 
-                # Backup SQLite
-                try:
-                    bk_sess = BackupSession()
-                    bk_user = bk_sess.query(User).filter(User.username == user.username).first()
-                    if bk_user:
-                        bk_user.payment_info = payment_data
-                        bk_sess.commit()
-                    bk_sess.close()
-                except: pass
-
-                # Calculamos el dinero total para la notificación usando el precio del usuario
-                user_price = user.price if hasattr(user, 'price') and user.price is not None else 10
-                money = new_total_historico * user_price
-                
-                ui.notify(f'Actualizado: {new_paid}/{real_limit} (Total: ${money})', type='positive')
-                
-                # --- SOLUCIÓN: ACTUALIZAR FRONTEND ---
-                nonlocal rows
-                rows = get_data_rows() # 1. Traer datos frescos de DB
-                
-                # 2. Respetar el filtro de búsqueda si existe
-                query = search_input.value.lower() if search_input else ""
-                if query:
-                    table.rows = [r for r in rows if query in r['fullname'].lower() or query in r['username'].lower()]
-                else:
-                    table.rows = rows
-                
-                # 3. Forzar actualización visual de la tabla
-                table.update()
+    async def update_payment_counter(user_id, delta):
+        nonlocal rows
+        try:
+            result = await run_db(_update_payment_counter_sync, user_id, delta)
+            if not result:
+                return
+            new_paid, real_limit, money = result
+            
+            ui.notify(f'Actualizado: {new_paid}/{real_limit} (Total: ${money})', type='positive')
+            
+            # --- SOLUCIÓN: ACTUALIZAR FRONTEND ---
+            rows = await run_db(get_data_rows) # 1. Traer datos frescos de DB
+            
+            # 2. Respetar el filtro de búsqueda si existe
+            query = search_input.value.lower() if search_input else ""
+            if query:
+                table.rows = [r for r in rows if query in r['fullname'].lower() or query in r['username'].lower()]
+            else:
+                table.rows = rows
+            
+            # 3. Forzar actualización visual de la tabla
+            table.update()
 
         except Exception as e:
             logger.error(f"Error actualizando pagos: {e}")
             ui.notify("Error actualizando pagos", type='negative')
+
+    # --- 3. CARGA DE MÉTRICAS (Simplificada) ---
+    metrics = {'total_users': 0, 'total_students': 0, 'active_users': 0}
+
+    def _load_metrics_sync():
+        """Conteos de la cabecera. Corre en el pool de BD."""
+        session = PostgresSession()
+        try:
+            all_users = session.query(User).all()
+            return {
+                'total_users': len(all_users),
+                'total_students': sum(1 for u in all_users if u.role == 'client'),
+                'active_users': sum(1 for u in all_users if u.status == 'Active'),
+            }
+        except Exception as e:
+            logger.error(f"Error cargando métricas: {e}")
+            return dict(metrics)
         finally:
             session.close()
 
-    # --- 3. CARGA DE MÉTRICAS (Simplificada) ---
-    session = PostgresSession()
-    try:
-        all_users = session.query(User).all()
-        total_users = len(all_users)
-        total_students = sum(1 for u in all_users if u.role == 'client')
-        active_users = sum(1 for u in all_users if u.status == 'Active')
-    except:
-        total_users = 0; total_students = 0; active_users = 0
-    finally:
-        session.close()
-
-    # Cargar filas iniciales usando el helper
-    rows = get_data_rows()
+    async def load_page():
+        """Primera carga: métricas y filas se traen del pool de BD y luego se pintan."""
+        nonlocal rows
+        metrics.update(await run_db(_load_metrics_sync))
+        rows = await run_db(get_data_rows)
+        render_metrics.refresh()
+        count_label.text = f'{len(rows)} Usuarios encontrados'
+        table.rows = rows
+        table.props(remove='loading')
+        table.update()
 
     # --- 4. COMPONENTES VISUALES ---
     
@@ -191,15 +211,19 @@ def students():
                     ui.label('Administra el acceso y datos de tus estudiantes').classes('text-sm text-slate-500')
 
         # Metrics
-        with ui.grid().classes('w-full grid-cols-1 md:grid-cols-3 gap-4'):
-            render_stat_card('Total Registrados', total_users, 'group', 'slate')
-            render_stat_card('Estudiantes', total_students, 'school', 'pink')
-            render_stat_card('Usuarios Activos', active_users, 'verified_user', 'green')
+        @ui.refreshable
+        def render_metrics():
+            with ui.grid().classes('w-full grid-cols-1 md:grid-cols-3 gap-4'):
+                render_stat_card('Total Registrados', metrics['total_users'], 'group', 'slate')
+                render_stat_card('Estudiantes', metrics['total_students'], 'school', 'pink')
+                render_stat_card('Usuarios Activos', metrics['active_users'], 'verified_user', 'green')
+
+        render_metrics()
 
         # Tabla
         with ui.card().classes('w-full p-0 rounded-2xl shadow-lg border border-slate-100 overflow-hidden'):
             with ui.row().classes('w-full bg-slate-50 p-4 border-b border-slate-200 justify-between items-center'):
-                ui.label(f'{len(rows)} Usuarios encontrados').classes('font-bold text-slate-600 text-sm')
+                count_label = ui.label(f'{len(rows)} Usuarios encontrados').classes('font-bold text-slate-600 text-sm')
                 search_input = ui.input(placeholder='Buscar estudiante...').props('outlined dense rounded bg-white') \
                     .classes('w-full md:w-64').on('keydown.enter', lambda: None)
                 search_input.add_slot('prepend', '<q-icon name="search" />')
@@ -220,7 +244,7 @@ def students():
                 {'name': 'status', 'label': 'ESTADO', 'field': 'status', 'align': 'center', 'sortable': True, 'headerClasses': 'text-slate-500 font-bold text-xs uppercase'},
             ]
 
-            table = ui.table(columns=columns, rows=rows, pagination={'rowsPerPage': 8}).classes('w-full').props('flat')
+            table = ui.table(columns=columns, rows=rows, pagination={'rowsPerPage': 8}).classes('w-full').props('flat loading')
 
             # --- SLOTS ---
             table.add_slot('body-cell-avatar', '<q-td key="avatar" :props="props"><q-avatar size="32px"><img :src="props.row.avatar"></q-avatar></q-td>')
@@ -315,5 +339,8 @@ def students():
         with ui.fab(icon='edit', color='pink-600', direction="left").props('glossy push'):
             ui.fab_action(label='Edición Masiva', icon='table_view', color='slate', on_click=lambda: ui.navigate.to('/students_edit'))
 
+    # Primera carga (la página se pinta con la tabla en modo "cargando")
+    ui.timer(0.1, load_page, once=True)
+
 if __name__ in {"__main__", "__mp_main__"}:
     ui.run()
\ No newline at end of file
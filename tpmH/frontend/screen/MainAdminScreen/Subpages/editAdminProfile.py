@@ -3,8 +3,8 @@ import logging
 from components.headerAdmin import create_admin_screen
 # --- IMPORTS ---
 from db.postgres_db import PostgresSession   # Fuente de la verdad
-from db.sqlite_db import BackupSession       # Respaldo
 from db.models import User, ScheduleProf, ScheduleProfEsp
+from db.class_times import refresh_prof_timezone
 # ----------------------------
 from zoneinfo import available_timezones
 from components.h_selection import make_selection_handler
@@ -201,7 +201,7 @@ def profileA_edit():
                             table_esp.on('selection', sel_hand_esp)
 
             # ==========================
-            # LÓGICA DE GUARDADO (NEON -> SQLITE)
+            # LÓGICA DE GUARDADO (NEON; el respaldo SQLite lo replica el outbox)
             # ==========================
             
             # --- FUNCIÓN WORKER (Corre en hilo separado) ---
@@ -227,6 +227,9 @@ def profileA_edit():
                         pg_session.add(ScheduleProfEsp(**item))
 
                     pg_session.commit()
+                    if u_pg and u_pg.role == 'admin':
+                        # Las conversiones hora alumno <-> profesora usan esta zona
+                        refresh_prof_timezone(user_data['time_zone'])
                     log_messages.append("✅ Datos guardados en NUBE (Neon)")
                 except Exception as e:
                     pg_session.rollback()
@@ -234,31 +237,6 @@ def profileA_edit():
                 finally:
                     pg_session.close()
 
-                # FASE 2: SQLITE
-                try:
-                    sq_session = BackupSession()
-                    u_sq = sq_session.query(User).filter(User.username == username).first()
-                    if u_sq:
-                        u_sq.name = user_data['name']
-                        u_sq.surname = user_data['surname']
-                        u_sq.time_zone = user_data['time_zone']
-                        u_sq.email = user_data['email']
-
-                    sq_session.query(ScheduleProf).filter(ScheduleProf.username == username).delete()
-                    for item in gen_scheds:
-                        sq_session.add(ScheduleProf(**item))
-
-                    sq_session.query(ScheduleProfEsp).filter(ScheduleProfEsp.username == username).delete()
-                    for item in spec_scheds:
-                        sq_session.add(ScheduleProfEsp(**item))
-
-                    sq_session.commit()
-                    log_messages.append("💾 Respaldo guardado en LOCAL (SQLite)")
-                except Exception as e:
-                    log_messages.append(f"⚠️ Error respaldo local: {e}")
-                finally:
-                    sq_session.close()
-
                 return log_messages
 
             # --- FUNCIÓN PRINCIPAL UI ---
@@ -3,7 +3,6 @@ import logging
 from components.headerAdmin import create_admin_screen
 # --- IMPORTS ACTUALIZADOS ---
 from db.postgres_db import PostgresSession  # Fuente de la verdad
-from db.sqlite_db import BackupSession       # Respaldo
 from db.models import User, SchedulePref, AsignedClasses
 # ----------------------------
 from components.h_selection import make_selection_handler
@@ -280,41 +279,7 @@ def students_edit():
                     finally:
                         pg_session.close()
 
-                    # --- FASE 2: SQLITE (RESPALDO SIMPLE) ---
-                    # Nota: Aquí solo actualizamos la tabla User para mantener consistencia básica.
-                    # La lógica compleja de clases se mantiene en Postgres que es la fuente de verdad.
-                    try:
-                        sqlite_session = BackupSession()
-                        
-                        sqlite_session.query(User).filter(
-                            User.username.notin_(current_usernames),
-                            User.role != 'admin'
-                        ).delete(synchronize_session=False)
-
-                        for row in current_rows:
-                            u_name = row.get('Usuario')
-                            if not u_name: continue
-
-                            user_sq = sqlite_session.query(User).filter(User.username == u_name).first()
-                            if user_sq:
-                                user_sq.role = row.get('Role', 'client')
-                                user_sq.package = row.get('Package', 'None')
-                                user_sq.status = row.get('Status', 'Active')
-                                try:
-                                    user_sq.price = int(row.get('Price', 10))
-                                except:
-                                    user_sq.price = 10
-                                # Nota: No replicamos la lógica compleja de payment_info/clases aquí
-                                # para evitar errores de esquema si SQLite es más simple.
-                        
-                        sqlite_session.commit()
-                        logger.info("💾 Cambios replicados en SQLITE (User table)")
-
-                    except Exception as e:
-                        logger.warning(f"⚠️ Error en backup local: {e}")
-                    finally:
-                        sqlite_session.close()
-
+                    # El respaldo SQLite (usuarios y clases) lo replica el outbox (db/replication.py).
                     ui.notify("Base de datos actualizada correctamente.", type='positive', icon='cloud_done')
                     ui.navigate.to('/Students')
 
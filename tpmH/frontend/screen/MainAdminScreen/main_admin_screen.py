@@ -1,16 +1,9 @@
 from nicegui import ui, app, Client 
-import asyncio
-import os
-import time
+from datetime import datetime
 
 # Asegúrate de que estas rutas sean correctas en tu proyecto
 from components.headerAdmin import create_admin_screen
-from auth.sync_cal import sync_google_calendar_logic
-
-# --- VARIABLES GLOBALES DE CONTROL ---
-IS_SYNCING = False
-LAST_SYNC_TIME = 0  
-SYNC_COOLDOWN = 3600  # 1 hora de espera entre auto-syncs
+from components.sync_scheduler import add_listener, get_job
 
 # --- FUNCIÓN HELPER NOTIFICACIONES ---
 async def notify_all_admins(message, type='positive', spinner=False):
@@ -27,6 +20,21 @@ async def notify_all_admins(message, type='positive', spinner=False):
             # Cliente desconectado o error de contexto
             pass
 
+
+# --- AVISO A LOS ADMINS CUANDO TERMINA EL SYNC DE CALENDAR ---
+# (El sync ya no depende de abrir esta página: lo corre components/sync_scheduler.py)
+async def _notify_calendar_sync(job):
+    if job.name != 'calendar':
+        return
+    if job.last_error:
+        await notify_all_admins(f'❌ Error al sincronizar: {job.last_error}', type='negative')
+        return
+    result = job.last_result or {}
+    if result.get('preply_added', 0) > 0 or result.get('updated_count', 0) > 0:
+        await notify_all_admins(f"✅ {result.get('msg', 'Sincronización completada')}", type='positive')
+
+add_listener(_notify_calendar_sync)
+
 @ui.page('/admin')
 def main_admin_screen():
     create_admin_screen()
@@ -43,66 +51,7 @@ def main_admin_screen():
         return
 
     # =================================================================
-    # 2. SINCRONIZACIÓN CONTROLADA
-    # =================================================================
-    async def run_auto_sync():
-        global IS_SYNCING, LAST_SYNC_TIME
-        
-        # A. Evitar concurrencia
-        if IS_SYNCING:
-            # Silencioso: no molestamos si ya está corriendo
-            return
-
-        # B. COOLDOWN
-        current_time = time.time()
-        time_since_last = current_time - LAST_SYNC_TIME
-        
-        if time_since_last < SYNC_COOLDOWN:
-            print(f"Sync omitido: Faltan {int(SYNC_COOLDOWN - time_since_last)}s para el próximo ciclo.")
-            return
-
-        teacher_email = os.getenv('CALENDAR_ID')
-        if not teacher_email:
-            return
-
-        # C. INICIO DEL PROCESO
-        IS_SYNCING = True
-        
-        # Notificamos inicio
-        await notify_all_admins('🔄 Iniciando sincronización con Google Calendar...', type='info', spinner=True)
-
-        try:
-            # --- PROCESO ---
-            # result_data es ahora un DICCIONARIO
-            result_data = await asyncio.to_thread(sync_google_calendar_logic, teacher_email)
-            
-            LAST_SYNC_TIME = time.time()
-
-            # --- EXTRACCIÓN DE DATOS DEL DICCIONARIO ---
-            new_count = result_data.get('new_count', 0)
-            updated_count = result_data.get('updated_count', 0)
-            msg_text = result_data.get('msg', 'Sincronización completada')
-
-            # --- NOTIFICACIÓN FINAL ---
-            if new_count > 0 or updated_count > 0:
-                # Mostramos el mensaje detallado que viene del servidor
-                await notify_all_admins(f'✅ {msg_text}', type='positive')
-            else:
-                await notify_all_admins('✅ Calendario verificado (Sin cambios nuevos).', type='positive')
-
-        except Exception as e:
-            print(f"Error crítico en Auto-Sync: {e}")
-            await notify_all_admins(f'❌ Error al sincronizar: {str(e)}', type='negative')
-            
-        finally:
-            IS_SYNCING = False
-
-    # Iniciamos el timer (se ejecutará una vez al cargar la página)
-    # Si quieres que sea repetitivo, quita 'once=True' y ajusta el tiempo
-    ui.timer(1.0, run_auto_sync, once=True)
-
-    # =================================================================
-    # 3. INTERFAZ GRÁFICA
+    # 2. INTERFAZ GRÁFICA
     # =================================================================
     
     with ui.column().classes('w-full min-h-[calc(100vh-64px)] items-center justify-center p-4'):
@@ -110,6 +59,15 @@ def main_admin_screen():
         with ui.column().classes('items-center mb-10 text-center'):
             ui.label(f'Bienvenido {username}!').classes('text-4xl md:text-5xl font-black text-gray-800 tracking-tight')
             ui.label('Panel de Administración').classes('text-lg text-gray-500 mt-2 font-medium')
+
+            # Estado del último sync con Google Calendar
+            calendar_job = get_job('calendar')
+            if calendar_job is not None and calendar_job.last_started_at:
+                last_run = datetime.fromtimestamp(calendar_job.last_started_at).strftime('%d/%m %H:%M')
+                if calendar_job.last_error:
+                    ui.label(f'⚠️ Último sync Calendar {last_run} falló: {calendar_job.last_error}').classes('text-xs text-red-500 mt-1')
+                else:
+                    ui.label(f'Último sync Calendar: {last_run} ({calendar_job.last_duration}s)').classes('text-xs text-gray-400 mt-1')
         
         with ui.row().classes('w-full max-w-4xl justify-center gap-6 md:gap-10'):
 
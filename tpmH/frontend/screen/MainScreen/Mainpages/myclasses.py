@@ -1,16 +1,18 @@
 from nicegui import ui, app
 from datetime import datetime
 import logging
-from db.sqlite_db import BackupSession
+from db.executor import run_db
 
 # --- IMPORTS DE BASE DE DATOS ---
 from db.postgres_db import PostgresSession
-from db.models import AsignedClasses, User, ScheduleProf, ScheduleProfEsp, SchedulePref
+from db.class_times import class_bounds, get_prof_timezone
+from sqlalchemy.exc import IntegrityError
+from db.models import AsignedClasses, User, SchedulePref
 from components.header import create_main_screen
 from components.share_data import days_of_week, PACKAGE_LIMITS, pack_of_classes
+from components.availability import get_teacher_slots
 from zoneinfo import ZoneInfo # Para manejo preciso de zonas al reagendar
-from datetime import datetime, timedelta
-import asyncio  # Importamos asyncio para corregir el error del loop
+from datetime import datetime, time, timedelta, timezone
 from prompts.chatbot import render_floating_chatbot
 
 # Configuración de logger
@@ -42,8 +44,12 @@ def my_classes():
         'total_classes': 0
     }
 
+    # Listas ya cargadas (refresh_ui las trae del pool de BD; render_content solo pinta)
+    classes_state = {'loading': True, 'upcoming': [], 'history': []}
+
     # 2. LOGICA DE DATOS
     def get_user_classes():
+        """Llena user_state y retorna (próximas, historial). Corre en el pool de BD."""
         session = PostgresSession()
         try:
             # A. Obtener Datos del Usuario
@@ -53,7 +59,7 @@ def my_classes():
                 user_state['class_count_str'] = user.class_count or "0/0"
                 user_state['total_classes'] = user.total_classes or '0'
                 # Guardamos la zona horaria para usarla en las comparaciones
-                user_state['timezone'] = user.time_zone if user.time_zone else 'America/Caracas'
+                user_state['timezone'] = user.time_zone if user.time_zone else get_prof_timezone()
                 
                 # Parsear "X/Y"
                 try:
@@ -64,47 +70,10 @@ def my_classes():
                     user_state['current'] = 0
                     user_state['limit'] = PACKAGE_LIMITS.get(user.package, 0)
 
-            # --- CORRECCIÓN CRÍTICA DE TIEMPO ---
-            # 1. Definir "Ahora" según la zona del usuario, no la del servidor (UTC)
-            try:
-                user_tz = ZoneInfo(user_state['timezone'])
-            except:
-                user_tz = ZoneInfo('America/Caracas')
-
-            # Obtenemos la hora actual en la zona del usuario y quitamos la info de zona
-            # para poder comparar con las fechas 'naive' de la base de datos.
-            now_user_local = datetime.now(user_tz).replace(tzinfo=None)
-
-            # B. Actualizar estados (Auto-Finalizar clases pasadas)
-            active_classes = session.query(AsignedClasses).filter(
-                AsignedClasses.username == username,
-                AsignedClasses.status.in_(['Pendiente', 'Prueba_Pendiente'])
-            ).all()
-            
-            updates = False
-            for c in active_classes:
-                try:
-                    # Convertir fecha y hora de la clase a objeto datetime
-                    # start_time viene como entero (ej: 1200) -> string "1200"
-                    t_str = str(c.start_time).zfill(4) 
-                    c_start = datetime.strptime(f"{c.date} {t_str}", "%Y-%m-%d %H%M")
-                    
-                    # Calcular hora de FIN (Inicio + Duración)
-                    # Si no tiene duración, asumimos 60 min
-                    dur = int(c.duration) if c.duration else 60
-                    c_end = c_start + timedelta(minutes=dur)
-
-                    # Si la hora actual (usuario) es mayor que la hora de FIN de la clase
-                    if now_user_local > c_end:
-                        c.status = 'Finalizada'
-                        updates = True
-                except Exception as e:
-                    logger.error(f"Error procesando fecha clase {c.id}: {e}")
-            
-            if updates:
-                session.commit()
+            # "Ahora" en UTC: se compara directo con start_at/end_at de cada clase
+            now_utc = datetime.now(timezone.utc)
 
-            # C. Obtener listas para mostrar
+            # B. Obtener listas para mostrar (solo lectura: la auto-finalización es una tarea de fondo)
             all_classes = session.query(AsignedClasses).filter(
                 AsignedClasses.username == username
             ).all()
@@ -117,17 +86,8 @@ def my_classes():
                 is_history_status = c.status in HISTORY_STATUSES
                 
                 # Calcular si ya pasó en el tiempo (lógica visual)
-                is_past_time = False
-                try:
-                    t_str = str(c.start_time).zfill(4)
-                    c_start = datetime.strptime(f"{c.date} {t_str}", "%Y-%m-%d %H%M")
-                    dur = c.duration if c.duration else 60
-                    c_end = c_start + timedelta(minutes=dur)
-                    
-                    if now_user_local > c_end:
-                        is_past_time = True
-                except:
-                    is_past_time = False
+                _, c_end = class_bounds(c)
+                is_past_time = c_end is not None and now_utc > c_end
 
                 if is_history_status or is_past_time:
                     history.append(c)
@@ -145,59 +105,51 @@ def my_classes():
         finally:
             session.close()
 
-    async def cancel_class(c_id, dialog):
+    def _cancel_class_sync(c_id):
+        """Borra la clase en Neon. Retorna False si no existe. Corre en el pool de BD."""
         session = PostgresSession()
         try:
             class_to_delete = session.query(AsignedClasses).filter(AsignedClasses.id == c_id).first()
             
-            if class_to_delete:
-                c_username = class_to_delete.username
-                c_date = class_to_delete.date
-                c_start_time = class_to_delete.start_time
-                
-                session.delete(class_to_delete)
-                session.commit()
+            if not class_to_delete:
+                return False
+
+            # El hook de commit libera sus fechas en la caché de disponibilidad
+            session.delete(class_to_delete)
+            session.commit()
+            return True
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
 
-                # Backup SQLite
-                try:
-                    bk_sess = BackupSession()
-                    bk_cls = bk_sess.query(AsignedClasses).filter(
-                        AsignedClasses.username == c_username,
-                        AsignedClasses.date == c_date,
-                        AsignedClasses.start_time == c_start_time
-                    ).first()
-                    if bk_cls:
-                        bk_sess.delete(bk_cls)
-                        bk_sess.commit()
-                    bk_sess.close()
-                except Exception as e:
-                    logger.error(f"Error backup sqlite delete: {e}")
-
-                ui.notify('Clase cancelada exitosamente', type='positive', icon='check')
-                dialog.close()
-                refresh_ui() 
-            else:
-                ui.notify("No se encontró la clase a cancelar.", type='warning')
-                
+    async def cancel_class(c_id, dialog):
+        try:
+            deleted = await run_db(_cancel_class_sync, c_id)
         except Exception as e:
             ui.notify(f"Error al cancelar: {e}", type='negative')
-        finally:
-            session.close()
-    
-    POSITIVE_STATUS = ["Libre", "Available", "Disponible"]
+            return
 
+        if deleted:
+            ui.notify('Clase cancelada exitosamente', type='positive', icon='check')
+            dialog.close()
+            await refresh_ui()
+        else:
+            ui.notify("No se encontró la clase a cancelar.", type='warning')
+    
    # --- LÓGICA DE REAGENDAMIENTO (VERSIÓN ESTUDIANTE) ---
-    async def reschedule_class(c_id, new_student_date, new_student_time_int, dialog):
+    def _reschedule_class_sync(c_id, new_student_date, new_student_time_int):
+        """Mueve la clase (Neon + backup). Retorna False si no existe. Corre en el pool de BD."""
         session = PostgresSession()
         try:
             cls = session.query(AsignedClasses).filter(AsignedClasses.id == c_id).first()
             if cls:
-                # 1. Guardar valores viejos para Backup y Cálculos
+                # 1. Guardar valores viejos para Cálculos
                 old_date = cls.date
                 old_start = cls.start_time
                 old_date_prof = cls.date_prof
                 old_start_prof = cls.start_prof_time
-                username = cls.username
                 duration = int(cls.duration) if cls.duration else 60
 
                 # 2. CALCULAR LA DIFERENCIA HORARIA (Time Delta)
@@ -246,40 +198,32 @@ def my_classes():
                 cls.end_prof_time = new_prof_end_int
                 
                 session.commit()
-
-                # 5. Actualizar Backup SQLite
-                try:
-                    bk_sess = BackupSession()
-                    bk_cls = bk_sess.query(AsignedClasses).filter(
-                        AsignedClasses.username == username,
-                        AsignedClasses.date == old_date,
-                        AsignedClasses.start_time == old_start
-                    ).first()
-                    
-                    if bk_cls:
-                        bk_cls.date = new_student_date
-                        bk_cls.start_time = new_student_time_int
-                        bk_cls.end_time = new_student_end_int
-                        bk_cls.days = new_day_name
-                        bk_cls.date_prof = new_prof_date
-                        bk_cls.start_prof_time = new_prof_time_int
-                        bk_cls.end_prof_time = new_prof_end_int
-                        bk_sess.commit()
-                    bk_sess.close()
-                except Exception as e:
-                    logger.error(f"Error backup reschedule student: {e}")
-
-                ui.notify(f"Clase reagendada correctamente.", type='positive')
-                if dialog: dialog.close()
-                refresh_ui() # Asegúrate de tener acceso a esta función o pásala como callback
-            else:
-                ui.notify("Clase no encontrada", type='negative')
+                return True
+            return False
         except Exception as e:
-            ui.notify(f"Error al reagendar: {e}", type='negative')
+            session.rollback()
             logger.error(f"Error student reschedule: {e}")
+            raise
         finally:
             session.close()
 
+    async def reschedule_class(c_id, new_student_date, new_student_time_int, dialog):
+        try:
+            moved = await run_db(_reschedule_class_sync, c_id, new_student_date, new_student_time_int)
+        except IntegrityError:
+            ui.notify("Ya tienes una clase reservada a esa hora.", type='warning')
+            return
+        except Exception as e:
+            ui.notify(f"Error al reagendar: {e}", type='negative')
+            return
+
+        if moved:
+            ui.notify(f"Clase reagendada correctamente.", type='positive')
+            if dialog: dialog.close()
+            await refresh_ui()
+        else:
+            ui.notify("Clase no encontrada", type='negative')
+
 
     def open_reschedule_dialog(c):
         
@@ -299,82 +243,39 @@ def my_classes():
                     return []
                 
                 query_date = dt.strftime('%Y-%m-%d')
-                day_name = days_of_week[dt.weekday()] # Asegúrate de importar days_of_week
-                
-                # A) Disponibilidad de la Profesora
-                rules = session.query(ScheduleProfEsp).filter_by(date=query_date).all()
-                if not rules:
-                    rules = session.query(ScheduleProf).filter_by(days=day_name).all()
-                
-                avail_ranges = []
-                POSITIVE_STATUS = ["Libre", "Available", "Disponible"] # O impórtalo de share_data
                 
-                for r in rules:
-                    status = str(r.avai if hasattr(r, 'avai') else r.availability)
-                    if status in POSITIVE_STATUS:
-                        avail_ranges.append((r.start_time, r.end_time))
-                
-                # B) Ocupado Profesora (Excluyendo la clase actual 'c.id')
-                busy = session.query(AsignedClasses).filter(
-                    AsignedClasses.date_prof == query_date,
-                    AsignedClasses.status.notin_(['Cancelled', 'Cancelada']),
-                    AsignedClasses.id != c.id  # CLAVE: Ignoramos la clase actual para poder moverla al mismo día
-                ).all()
-                busy_ranges = [(b.start_prof_time, b.end_prof_time) for b in busy if b.start_prof_time]
-
-                # C) Zonas Horarias (Automáticas)
+                # A) Zonas Horarias (Automáticas)
                 # 1. Alumno
                 user = session.query(User).filter(User.username == c.username).first()
                 student_tz_str = user.time_zone if user and user.time_zone else 'UTC'
                 
-                # 2. Profesora (Buscamos al primer admin)
-                admin_user = session.query(User).filter(User.role == 'admin').first()
-                teacher_tz_str = admin_user.time_zone if admin_user and admin_user.time_zone else 'America/Caracas'
+                # 2. Profesora (zona del admin, en memoria)
+                teacher_tz_str = get_prof_timezone()
 
-                # D) Generar Slots
+                # B) Generar Slots (motor único, ignorando la clase actual 'c.id'
+                #    para poder moverla dentro del mismo día)
                 try:
                     duration = int(float(c.duration)) if c.duration else 60
                 except: duration = 60
                 
-                step = 30
-                
-                def to_minutes(hhmm): return (hhmm // 100) * 60 + (hhmm % 100)
-                def to_hhmm_int(minutes): return ((minutes // 60) * 100) + (minutes % 60)
+                unique_slots, _ = get_teacher_slots(session, query_date, duration, exclude_class_id=c.id)
 
-                busy_ranges_min = [(to_minutes(bs), to_minutes(be)) for bs, be in busy_ranges]
+                # Preferencias del alumno: una sola consulta, agrupadas por día
+                prefs_by_day = {}
+                for p in session.query(SchedulePref).filter(SchedulePref.username == c.username).all():
+                    prefs_by_day.setdefault(p.days, []).append(p)
 
-                valid_slots = []
-                for start, end in avail_ranges:
-                    curr_m = to_minutes(start)
-                    end_m = to_minutes(end)
-                    
-                    while curr_m + duration <= end_m:
-                        s_end_m = curr_m + duration
-                        is_busy = False
-                        
-                        for b_s_m, b_e_m in busy_ranges_min:
-                            if (curr_m < b_e_m) and (s_end_m > b_s_m):
-                                is_busy = True
-                                break
-                        
-                        if not is_busy:
-                            valid_slots.append(to_hhmm_int(curr_m))
-                        
-                        curr_m += step 
-                
-                unique_slots = sorted(list(set(valid_slots)))
+                prof_tz = ZoneInfo(teacher_tz_str)
+                stud_tz = ZoneInfo(student_tz_str)
                 
-                # E) Conversión Final
+                # C) Conversión Final
                 for slot in unique_slots:
                     t_h, t_m = slot // 100, slot % 100
                     t_str = f"{str(t_h).zfill(2)}:{str(t_m).zfill(2)}"
                     
                     try:
-                        prof_tz = ZoneInfo(teacher_tz_str)
-                        stud_tz = ZoneInfo(student_tz_str)
-                        
                         # Hora "maestra" (Profesor)
-                        dt_prof = datetime.strptime(f"{query_date} {t_str}", "%Y-%m-%d %H:%M").replace(tzinfo=prof_tz)
+                        dt_prof = datetime.combine(dt.date(), time(t_h, t_m), tzinfo=prof_tz)
                         
                         # Convertir a Alumno
                         dt_stud = dt_prof.astimezone(stud_tz)
@@ -385,17 +286,13 @@ def my_classes():
                         
                         s_time_str = dt_stud.strftime("%H:%M")
                         s_date_str = dt_stud.strftime("%Y-%m-%d")
-                        s_time_int = int(dt_stud.strftime("%H%M"))
-                        s_end_int = int(dt_stud_end.strftime("%H%M"))
+                        s_time_int = dt_stud.hour * 100 + dt_stud.minute
+                        s_end_int = dt_stud_end.hour * 100 + dt_stud_end.minute
                         s_weekday = days_of_week[dt_stud.weekday()]
                         
                         # Preferencias
                         is_preferred = False
-                        prefs = session.query(SchedulePref).filter(
-                            SchedulePref.username == c.username,
-                            SchedulePref.days == s_weekday
-                        ).all()
-                        for p in prefs:
+                        for p in prefs_by_day.get(s_weekday, []):
                             if p.start_time <= s_time_int < p.end_time:
                                 is_preferred = True; break
                         
@@ -405,7 +302,7 @@ def my_classes():
 
                         slots_data.append({
                             't_time_int': slot,             # Inicio Prof (INT)
-                            't_end_int': int(dt_prof_end.strftime("%H%M")), # Fin Prof (INT)
+                            't_end_int': dt_prof_end.hour * 100 + dt_prof_end.minute, # Fin Prof (INT)
                             't_date': query_date,           # Fecha Prof (STR)
                             't_time_str': t_str,            # Inicio Prof (Visual)
                             
@@ -467,7 +364,7 @@ def my_classes():
                     
                     date_val = date_input.value
                     # Ejecutar en hilo aparte
-                    slots = await asyncio.to_thread(get_slots_data, date_val)
+                    slots = await run_db(get_slots_data, date_val)
                     
                     spinner.classes(add='hidden')
                     
@@ -521,14 +418,14 @@ def my_classes():
                         with ui.row().classes('w-full justify-end gap-2'):
                             ui.button('Cancelar', on_click=confirm_d.close).props('flat color=slate')
                             
-                            async def execute_save():
+                            def _save_slot_sync():
+                                """Aplica el hueco elegido a la clase. Retorna False si no existe. Corre en el pool de BD."""
                                 session = PostgresSession()
                                 try:
                                     # 1. Obtener la clase de la BD
                                     class_db = session.query(AsignedClasses).filter(AsignedClasses.id == c.id).first()
                                     if not class_db:
-                                        ui.notify("Error: Clase no encontrada", type='negative')
-                                        return
+                                        return False
 
                                     # 2. Actualizar datos del ESTUDIANTE
                                     class_db.date = slot_data['s_date']
@@ -546,21 +443,36 @@ def my_classes():
                                     class_db.status = 'Pendiente'
 
                                     session.commit()
-                                    ui.notify(f"¡Clase movida exitosamente!", type='positive')
-                                    
-                                    # Cerrar todo
-                                    confirm_d.close()
-                                    d.close()
-
-
-                                    ui.navigate.to('/myclasses') # Forzar recarga si es necesario
-                                    
+                                    return True
                                 except Exception as e:
                                     session.rollback()
-                                    ui.notify(f"Error guardando: {e}", type='negative')
                                     logger.error(f"Save error: {e}")
+                                    raise
                                 finally:
                                     session.close()
+
+                            async def execute_save():
+                                try:
+                                    saved = await run_db(_save_slot_sync)
+                                except IntegrityError:
+                                    ui.notify("Ya tienes una clase reservada a esa hora.", type='warning')
+                                    return
+                                except Exception as e:
+                                    ui.notify(f"Error guardando: {e}", type='negative')
+                                    return
+
+                                if not saved:
+                                    ui.notify("Error: Clase no encontrada", type='negative')
+                                    return
+
+                                ui.notify(f"¡Clase movida exitosamente!", type='positive')
+                                
+                                # Cerrar todo
+                                confirm_d.close()
+                                d.close()
+
+
+                                ui.navigate.to('/myclasses') # Forzar recarga si es necesario
                                     
                             ui.button('Confirmar Cambio', on_click=execute_save).props('unelevated color=indigo')
                     confirm_d.open()
@@ -574,7 +486,8 @@ def my_classes():
         d.open()
 
     # --- LÓGICA DE RENOVACIÓN DE SUSCRIPCIÓN (ACTUALIZADA) ---
-    async def renew_subscription(new_plan_name):
+    def _renew_subscription_sync(new_plan_name):
+        """Renueva el plan y reinicia el historial. Retorna False si no existe el usuario. Corre en el pool de BD."""
         session = PostgresSession()
         try:
             u = session.query(User).filter(User.username == username).first()
@@ -611,48 +524,26 @@ def my_classes():
 
                 session.commit()
 
-                # Backup SQLite
-                try:
-                    bk_sess = BackupSession()
-                    
-                    # Update User in Backup
-                    bk_u = bk_sess.query(User).filter(User.username == username).first()
-                    if bk_u:
-                        bk_u.package = new_plan_name
-                        bk_u.class_count = new_count_str
-                        bk_u.total_classes = 0
-
-                        # --- ACTUALIZAR payment_info EN BACKUP ---
-                    if bk_u.payment_info:
-                        try:
-                            bk_pi = bk_u.payment_info.copy()
-                            bk_pi["Clases_paquete"] = f"0/{new_limit}"
-                            bk_u.payment_info = bk_pi
-                        except Exception as json_err_bk:
-                            logger.error(f"Error actualizando payment_info en backup: {json_err_bk}")
-                        
-                        # --- ACTUALIZAR BACKUP (Renovations) ---
-                        bk_renovations = bk_u.renovations if bk_u.renovations is not None else 0
-                        bk_u.renovations = bk_renovations + 1
-                    
-                    # Delete Classes in Backup
-                    bk_sess.query(AsignedClasses).filter(
-                        AsignedClasses.username == username
-                    ).delete(synchronize_session=False)
-                    
-                    bk_sess.commit()
-                    bk_sess.close()
-                except Exception as ex_bk:
-                    logger.error(f"Error backup update: {ex_bk}")
+                return True
+            return False
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
 
-                ui.notify(f"Suscripción actualizada a {new_plan_name}. Historial reiniciado.", type='positive', icon='verified')
-                refresh_ui()
-            else:
-                ui.notify("Usuario no encontrado", type='negative')
+    async def renew_subscription(new_plan_name):
+        try:
+            renewed = await run_db(_renew_subscription_sync, new_plan_name)
         except Exception as e:
             ui.notify(f"Error renovando: {e}", type='negative')
-        finally:
-            session.close()
+            return
+
+        if renewed:
+            ui.notify(f"Suscripción actualizada a {new_plan_name}. Historial reiniciado.", type='positive', icon='verified')
+            await refresh_ui()
+        else:
+            ui.notify("Usuario no encontrado", type='negative')
 
     def open_renewal_dialog():
         current_plan = user_state['package']
@@ -797,7 +688,13 @@ def my_classes():
 
     @ui.refreshable
     def render_content():
-        upcoming, history = get_user_classes()
+        if classes_state['loading']:
+            with ui.column().classes('w-full items-center justify-center py-24'):
+                ui.spinner('dots', size='lg', color='rose')
+                ui.label('Cargando tus clases...').classes('text-slate-400 text-sm animate-pulse')
+            return
+
+        upcoming, history = classes_state['upcoming'], classes_state['history']
         
         curr = user_state['current']
         limit = user_state['limit']
@@ -883,8 +780,12 @@ def my_classes():
     
     
 
-    def refresh_ui():
+    async def refresh_ui():
+        classes_state['upcoming'], classes_state['history'] = await run_db(get_user_classes)
+        classes_state['loading'] = False
         render_content.refresh()
 
     render_content()
+    # Primera carga (la página se pinta con el spinner)
+    ui.timer(0.1, refresh_ui, once=True)
     render_floating_chatbot('my_classes')
\ No newline at end of file
@@ -2,23 +2,23 @@ from nicegui import ui, app
 from datetime import datetime, timedelta
 import logging
 import asyncio
+from sqlalchemy.exc import IntegrityError
 
 # --- IMPORTS DE BASE DE DATOS ---
 from db.postgres_db import PostgresSession
-from db.sqlite_db import BackupSession
-from db.models import User, ScheduleProf, ScheduleProfEsp, AsignedClasses, SchedulePref
+from db.executor import run_db
+from db.models import User, AsignedClasses, SchedulePref
 from components.header import create_main_screen
 from components.share_data import days_of_week, PACKAGE_LIMITS
 from prompts.chatbot import render_floating_chatbot
 # IMPORTAMOS EL CONVERSOR
 from components.timezone_converter import convert_student_to_teacher, get_slots_in_student_tz, from_int_time
+from components.availability import get_teacher_slots
 
 # Configuración de logger
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-POSITIVE_STATUS = ["Libre", "Available", "Disponible"]
-
 @ui.page('/ScheduleMaker')
 def scheduleMaker():
     ui.query('body').style('background-color: #F8FAFC; font-family: "Inter", sans-serif;')
@@ -31,61 +31,29 @@ def scheduleMaker():
         ui.navigate.to('/login')
         return
 
-    # 2. HELPER: CONTADOR HISTÓRICO
-    def get_all_time_classes():
-        session = PostgresSession()
-        try:
-            count = session.query(AsignedClasses).filter(
-                AsignedClasses.username == username,
-                AsignedClasses.status != 'Cancelled'
-            ).count()
-            return count
-        except Exception as e:
-            logger.error(f"Error contando historial: {e}")
-            return 0
-        finally:
-            session.close()
-    
-    def get_renovations():
-        session = PostgresSession()
-        try:
-            user = (
-                session.query(User)
-                .filter(User.username == username)
-                .first()
-            )
-            return user.renovations if user else 0
-        except Exception as e:
-            logger.error(f"Error obteniendo renovaciones: {e}")
-            return 0
-        finally:
-            session.close()
-
-
-    # Inicializamos estado
-    lifetime_count = get_all_time_classes()
-    reno = get_renovations()
-
-    is_trial = (lifetime_count == 0 and reno == 0)
-
-    # 3. ESTADO REACTIVO
+    # 2. ESTADO REACTIVO
+    # Todo lo que sale de la BD se carga en el pool (update_dashboard) y se guarda aquí;
+    # los render_* solo pintan desde el estado.
     state = {
         'date': datetime.now().strftime('%Y-%m-%d'),
-        'loading': False,
-        'is_trial': is_trial,
-        'duration': 30 if is_trial else 60
+        'loading': True,
+        'first_load': True,
+        'is_trial': False,
+        'duration': 60,
+        'slots': [],
+        'pref_ranges': [],
+        'student_tz': 'UTC',
+        'my_classes': [],
+        'stats': {'pkg': 'Sin Plan', 'limit': 0, 'used': 0, 'total': 0},
     }
     
     # === NUEVO: DIÁLOGO INFORMATIVO SI ES MODO PRUEBA ===
-    if is_trial:
-        with ui.dialog() as trial_dialog, ui.card().classes('w-[400px] items-center p-6 text-center'):
-            ui.icon('school', size='xl', color='purple-500').classes('mb-2')
-            ui.label('¡Bienvenido/a!').classes('text-xl font-bold text-slate-700')
-            ui.label('Agenda tu clase de prueba, luego de agendar dicha clase las siguientes contaran como parte de tu paquete.').classes('text-sm text-slate-500 my-4')
-            ui.button('Entendido', on_click=trial_dialog.close).props('unelevated color=purple')
-        
-        # Abrimos el dialog después de una pequeña pausa para asegurar que la UI cargó
-        ui.timer(0.5, trial_dialog.open, once=True)
+    # Se abre tras la primera carga si el alumno aún no tiene clases ni renovaciones
+    with ui.dialog() as trial_dialog, ui.card().classes('w-[400px] items-center p-6 text-center'):
+        ui.icon('school', size='xl', color='purple-500').classes('mb-2')
+        ui.label('¡Bienvenido/a!').classes('text-xl font-bold text-slate-700')
+        ui.label('Agenda tu clase de prueba, luego de agendar dicha clase las siguientes contaran como parte de tu paquete.').classes('text-sm text-slate-500 my-4')
+        ui.button('Entendido', on_click=trial_dialog.close).props('unelevated color=purple')
     # =================================================================
     # LÓGICA DE NEGOCIO (MODEL)
     # =================================================================
@@ -148,84 +116,18 @@ def scheduleMaker():
         ).count()
         return pkg_name, limit, current_usage
 
-    def get_available_slots(date_str, duration_mins):
+    def get_available_slots(date_str, duration_mins, student_tz):
         session = PostgresSession()
         try:
-            dt = datetime.strptime(date_str, '%Y-%m-%d')
-            day_name = days_of_week[dt.weekday()]
-            
-            # 1. Reglas Generales y Específicas
-            general_rules = session.query(ScheduleProf).filter_by(days=day_name).all()
-            specific_rules = session.query(ScheduleProfEsp).filter_by(date=date_str).all()
+            # 1. Huecos en hora profesora (motor único de disponibilidad)
+            prof_slots_free, prof_slots_busy = get_teacher_slots(session, date_str, duration_mins)
+            if not prof_slots_free and not prof_slots_busy: return []
 
-            available_ranges_prof = []
-
-            # Disponibilidad General
-            for r in general_rules:
-                if str(getattr(r, 'availability', '')) in POSITIVE_STATUS:
-                    available_ranges_prof.append((r.start_time, r.end_time))
-            
-            # Disponibilidad Específica (Extra)
-            for r in specific_rules:
-                if str(getattr(r, 'avai', '')) in POSITIVE_STATUS:
-                    available_ranges_prof.append((r.start_time, r.end_time))
-
-            if not available_ranges_prof: return [] 
-
-            # 2. Bloqueos (Clases ya agendadas + Bloqueos específicos)
-            busy_classes = session.query(AsignedClasses).filter(
-                AsignedClasses.date == date_str, 
-                AsignedClasses.status.in_(['Pendiente', 'Prueba_Pendiente'])
-            ).all()
-            
-            blocked_intervals_prof = []
-            
-            for c in busy_classes:
-                # Usar hora profesor si existe, si no hora local
-                sp = c.start_prof_time if c.start_prof_time is not None else c.start_time
-                ep = c.end_prof_time if c.end_prof_time is not None else c.end_time
-                blocked_intervals_prof.append((sp, ep))
-
-            for r in specific_rules:
-                if str(getattr(r, 'avai', '')) not in POSITIVE_STATUS:
-                    blocked_intervals_prof.append((r.start_time, r.end_time))
-
-            # Helpers de conversión
-            def to_min(t): return int(str(t).zfill(4)[:2]) * 60 + int(str(t).zfill(4)[2:])
-            def to_hhmm(mins): return int(f"{mins // 60}{str(mins % 60).zfill(2)}")
-
-            prof_slots_free = []
-            prof_slots_busy = []
-
-            # 3. Generar Slots y Clasificar
-            for r_start, r_end in available_ranges_prof:
-                curr_min = to_min(r_start)
-                end_min = to_min(r_end)
-                
-                while curr_min + duration_mins <= end_min:
-                    slot_start = curr_min
-                    slot_end = curr_min + duration_mins
-                    
-                    # Checar colisión
-                    is_blocked = False
-                    for b_start, b_end in blocked_intervals_prof:
-                        bs, be = to_min(b_start), to_min(b_end)
-                        if (slot_start < be) and (slot_end > bs):
-                            is_blocked = True; break
-                    
-                    if is_blocked:
-                        prof_slots_busy.append(to_hhmm(slot_start))
-                    else: 
-                        prof_slots_free.append(to_hhmm(slot_start))
-                    
-                    curr_min += 30
-            
-            # 4. Convertir a Hora Estudiante
-            student_tz = get_user_timezone()
+            # 2. Convertir a Hora Estudiante
             final_free = get_slots_in_student_tz(prof_slots_free, date_str, student_tz)
             final_busy = get_slots_in_student_tz(prof_slots_busy, date_str, student_tz)
             
-            # 5. Unificar con etiqueta
+            # 3. Unificar con etiqueta
             combined_slots = []
             for t in final_free:
                 combined_slots.append({'time': t, 'status': 'free'})
@@ -242,16 +144,68 @@ def scheduleMaker():
         finally:
             session.close()
 
+    def _load_account_sync():
+        """
+        Auto-finaliza las clases ya pasadas y carga las próximas, el resumen del plan
+        y si el alumno está en modo prueba. Corre en el pool de BD.
+        Retorna (clases, stats, is_trial).
+        """
+        session = PostgresSession()
+        try:
+            now_int = int(datetime.now().strftime("%Y%m%d%H%M"))
+
+            pending_classes = session.query(AsignedClasses).filter(
+                AsignedClasses.username == username,
+                AsignedClasses.status.in_(['Pendiente', 'Prueba_Pendiente'])
+            ).all()
+
+            updates_made = False
+            for c in pending_classes:
+                class_dt_int = int(c.date.replace('-', '') + str(c.start_time).zfill(4))
+                if class_dt_int < now_int:
+                    c.status = 'Finalizada'
+                    updates_made = True
+
+            if updates_made: session.commit()
+
+            classes = session.query(AsignedClasses).filter(
+                AsignedClasses.username == username,
+                AsignedClasses.status.in_(['Pendiente', 'Prueba_Pendiente'])
+            ).all()
+            classes.sort(key=lambda x: (x.date, x.start_time))
+
+            pkg, limit, used_curr = get_current_package_usage(session, username)
+            total_lifetime = session.query(AsignedClasses).filter(
+                AsignedClasses.username == username,
+                AsignedClasses.status != 'Cancelled'
+            ).count()
+            reno = session.query(User.renovations).filter(User.username == username).scalar() or 0
+
+            stats = {'pkg': pkg, 'limit': limit, 'used': used_curr, 'total': total_lifetime}
+            return classes, stats, (total_lifetime == 0 and reno == 0)
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error cargando clases del alumno: {e}")
+            return state['my_classes'], state['stats'], state['is_trial']
+        finally:
+            session.close()
+
+    def _load_slots_sync(date_str, duration_mins):
+        """Zona del alumno, huecos del día y rangos preferidos. Corre en el pool de BD."""
+        student_tz = get_user_timezone()
+        slots = get_available_slots(date_str, duration_mins, student_tz)
+        return student_tz, slots, get_user_preferred_ranges(username, date_str)
+
     # --- BOOK CLASS ---
-    async def book_class(slot_int):
+    def _book_class_sync(slot_int, date_str, duration, is_trial):
+        """Parte bloqueante de la reserva (corre en el pool de BD). Retorna (ok, error)."""
         session = PostgresSession()
         try:
             pkg, limit, used = get_current_package_usage(session, username)
             
             # Solo validamos límite si NO es prueba
-            if not state['is_trial'] and limit > 0 and used >= limit:
-                ui.notify(f"Límite mensual alcanzado ({used}/{limit})", type='negative')
-                return False
+            if not is_trial and limit > 0 and used >= limit:
+                return False, f"Límite mensual alcanzado ({used}/{limit})"
             
             # Cálculo de histórico (Excluyendo pruebas)
             total_lifetime_used = session.query(AsignedClasses).filter(
@@ -262,7 +216,6 @@ def scheduleMaker():
 
             user_db = session.query(User).filter_by(username=username).first()
             student_tz = user_db.time_zone or "UTC"
-            duration = state['duration']
             
             # Cálculos de tiempo
             s_str = str(slot_int).zfill(4)
@@ -271,17 +224,17 @@ def scheduleMaker():
             end_dt = start_dt_obj + timedelta(minutes=duration)
             end_int = int(end_dt.strftime("%H%M"))
             
-            dt_obj = datetime.strptime(state['date'], '%Y-%m-%d')
+            dt_obj = datetime.strptime(date_str, '%Y-%m-%d')
             day_name = days_of_week[dt_obj.weekday()]
 
             sp_time, ep_time, prof_date = convert_student_to_teacher(
-                state['date'], slot_int, duration, student_tz
+                date_str, slot_int, duration, student_tz
             )
 
-            status_to_save = "Prueba_Pendiente" if state['is_trial'] else "Pendiente"
+            status_to_save = "Prueba_Pendiente" if is_trial else "Pendiente"
             
             # --- LÓGICA DE CONTADORES ---
-            if state['is_trial']:
+            if is_trial:
                 # Si es prueba, NO asignamos contadores numéricos
                 count_label = None 
                 new_total_classes_seq = None
@@ -297,7 +250,7 @@ def scheduleMaker():
 
             new_class = AsignedClasses(
                 username=username, name=user_db.name, surname=user_db.surname,
-                date=state['date'], days=day_name, 
+                date=date_str, days=day_name, 
                 start_time=slot_int, end_time=end_int, 
                 start_prof_time=sp_time, end_prof_time=ep_time,
                 date_prof=prof_date, duration=str(duration), package=pkg, 
@@ -307,30 +260,24 @@ def scheduleMaker():
             )
             session.add(new_class)
             session.commit()
+            return True, None
             
-            # Backup SQLite
-            try:
-                bk_sess = BackupSession()
-                bk_sess.add(AsignedClasses(
-                    username=username, name=user_db.name, surname=user_db.surname,
-                    date=state['date'], days=day_name, start_time=slot_int,
-                    end_time=end_int, duration=str(duration), package=pkg, 
-                    status=status_to_save,
-                    start_prof_time=sp_time, end_prof_time=ep_time, date_prof=prof_date,
-                    class_count=count_label, 
-                    total_classes=new_total_classes_seq
-                ))
-                bk_sess.commit(); bk_sess.close()
-            except: pass
-
-            return True
-            
+        except IntegrityError:
+            # uq_clases_username_slot: otra pestaña/petición reservó esta hora primero
+            session.rollback()
+            return False, "Ya tienes una clase reservada a esa hora."
         except Exception as e:
-            ui.notify(f"Error al guardar: {e}", type='negative')
-            return False
+            session.rollback()
+            return False, f"Error al guardar: {e}"
         finally:
             session.close()
 
+    async def book_class(slot_int):
+        ok, error = await run_db(_book_class_sync, slot_int, state['date'], state['duration'], state['is_trial'])
+        if error:
+            ui.notify(error, type='negative')
+        return ok
+
     # =================================================================
     # COMPONENTES DE INTERFAZ (VIEW)
     # =================================================================
@@ -361,11 +308,8 @@ def scheduleMaker():
                     confirm_btn.props('loading')
                     confirm_btn.disable()
                     
-                    # CORRECCIÓN 1: Pausa para renderizar la UI antes de bloquear
-                    await asyncio.sleep(0.1) 
-                    
                     try:
-                        # 2. Guardar en DB (Bloqueante)
+                        # 2. Guardar en DB (en el pool de BD, no bloquea la UI)
                         success = await book_class(slot)
                         
                         if success:
@@ -409,10 +353,9 @@ def scheduleMaker():
                 return
         except: return
 
-        current_duration = state['duration']
-        all_slots_data = get_available_slots(state['date'], current_duration)
-        pref_ranges = get_user_preferred_ranges(username, state['date'])
-        
+        # Datos ya cargados por update_dashboard (nunca se consulta la BD aquí)
+        all_slots_data = state['slots']
+        pref_ranges = state['pref_ranges']
 
         if not all_slots_data:
             with ui.column().classes('w-full items-center justify-center py-16 bg-white rounded-xl border border-dashed border-slate-300'):
@@ -508,31 +451,8 @@ def scheduleMaker():
 
     @ui.refreshable
     def render_my_classes():
-        session = PostgresSession()
-        now = datetime.now()
-        now_int = int(now.strftime("%Y%m%d%H%M"))
-        
-        pending_classes = session.query(AsignedClasses).filter(
-            AsignedClasses.username == username,
-            AsignedClasses.status.in_(['Pendiente', 'Prueba_Pendiente'])
-        ).all()
-        
-        updates_made = False
-        for c in pending_classes:
-            class_dt_int = int(c.date.replace('-', '') + str(c.start_time).zfill(4))
-            if class_dt_int < now_int:
-                c.status = 'Finalizada'
-                updates_made = True
-        
-        if updates_made: session.commit()
-
-        classes = session.query(AsignedClasses).filter(
-            AsignedClasses.username == username, 
-            AsignedClasses.status.in_(['Pendiente', 'Prueba_Pendiente'])
-        ).all()
-        
-        classes.sort(key=lambda x: (x.date, x.start_time))
-        session.close()
+        # Datos ya cargados por update_dashboard (_load_account_sync)
+        classes = state['my_classes']
 
         if not classes:
             with ui.column().classes('w-full items-center py-8 text-slate-400 italic'):
@@ -574,31 +494,39 @@ def scheduleMaker():
             with ui.row().classes('w-full justify-end mt-4 gap-2'):
                 ui.button('No', on_click=d.close).props('flat text-color=slate')
                 del_btn = ui.button('Sí, Cancelar').props('unelevated color=red')
-                async def do_del():
-                    del_btn.props('loading')
+                def _delete_class_sync(c_id):
                     sess = PostgresSession()
                     try:
-                        sess.query(AsignedClasses).filter(AsignedClasses.id == c_obj.id).delete()
+                        # Borrado por objeto: el hook de commit invalida solo sus fechas
+                        cls = sess.get(AsignedClasses, c_id)
+                        if cls is not None:
+                            sess.delete(cls)
                         sess.commit()
+                        return True
+                    except Exception as e:
+                        sess.rollback()
+                        logger.error(f"Error cancelando clase {c_id}: {e}")
+                        return False
+                    finally: sess.close()
+
+                async def do_del():
+                    del_btn.props('loading')
+                    if await run_db(_delete_class_sync, c_obj.id):
                         ui.notify('Clase cancelada', type='info')
                         d.close()
                         await update_dashboard() 
-                    except: pass
-                    finally: sess.close()
+                    else:
+                        del_btn.props(remove='loading')
                 del_btn.on('click', do_del)
         d.open()
 
     @ui.refreshable
     def render_stats_widget():
-        session = PostgresSession()
-        pkg, limit, used_curr = get_current_package_usage(session, username)
-        
-        total_lifetime = session.query(AsignedClasses).filter(
-            AsignedClasses.username == username,
-            AsignedClasses.status != 'Cancelled'
-        ).count()
-        session.close()
-        
+        # Datos ya cargados por update_dashboard (_load_account_sync)
+        stats = state['stats']
+        pkg, limit, used_curr = stats['pkg'], stats['limit'], stats['used']
+        total_lifetime = stats['total']
+
         percent = min(used_curr/limit, 1.0) if limit > 0 else 0
 
         # Contenedor de la tarjeta con degradado sutil y borde suave
@@ -649,7 +577,7 @@ def scheduleMaker():
         
 
             # === ZONA DE INFORMACIÓN (Estilo Moderno/Premium) ===
-            user_tz = get_user_timezone()
+            user_tz = state['student_tz']
 
         with ui.row().classes('w-full p-3 rounded-2xl bg-gradient-to-br from-white to-gray-50 border border-blue-100 shadow-sm items-center gap-3'):
                 
@@ -684,14 +612,17 @@ def scheduleMaker():
         # 3. Pausa para permitir repintado de UI
         await asyncio.sleep(0.1)
 
-        # 4. Cálculos pesados
-        lifetime_count = get_all_time_classes()
-        is_trial_now = (lifetime_count == 0)
-        
+        # 4. Cálculos pesados (en el pool de BD)
+        state['my_classes'], state['stats'], is_trial_now = await run_db(_load_account_sync)
+
         if state['is_trial'] != is_trial_now:
             state['is_trial'] = is_trial_now
             state['duration'] = 30 if is_trial_now else 60
 
+        state['student_tz'], state['slots'], state['pref_ranges'] = await run_db(
+            _load_slots_sync, state['date'], state['duration']
+        )
+
         render_header_area.refresh()
         render_my_classes.refresh()
         render_stats_widget.refresh()
@@ -701,6 +632,11 @@ def scheduleMaker():
         render_sidebar.refresh()
         render_slots_area.refresh()
 
+        if state['first_load']:
+            state['first_load'] = False
+            if state['is_trial']:
+                trial_dialog.open()
+
     async def on_date_change(e):
         await update_dashboard()
 
@@ -768,5 +704,8 @@ def scheduleMaker():
                 render_sidebar()
             with ui.column().classes('lg:col-span-8 w-full order-1 lg:order-2'):
                 render_main_content()
-        
+
+    # Primera carga de huecos (la página se pinta con el spinner)
+    ui.timer(0.1, update_dashboard, once=True)
+
     render_floating_chatbot('schedule')
\ No newline at end of file
@@ -5,7 +5,6 @@ import uuid
 from components.header import create_main_screen
 from components.headerAdmin import create_admin_screen
 from db.postgres_db import PostgresSession
-from db.sqlite_db import BackupSession
 from db.models import TeacherProfile, User 
 from prompts.chatbot import render_floating_chatbot
 
@@ -124,18 +123,6 @@ def teacher_profile_view():
         finally:
             pg_session.close()
 
-        try:
-            bk_session = BackupSession()
-            bk_prof = bk_session.query(TeacherProfile).first()
-            if not bk_prof:
-                bk_prof = TeacherProfile(username='admin')
-                bk_session.add(bk_prof)
-            bk_prof.reviews = new_reviews_list
-            bk_session.commit()
-            bk_session.close()
-        except Exception as e:
-            logger.warning(f"SQLite backup skipped: {e}")
-
     async def submit_review():
         if not form_state['comment'].strip():
             ui.notify('Escribe un comentario por favor.', type='warning')
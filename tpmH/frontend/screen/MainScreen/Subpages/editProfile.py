@@ -3,7 +3,6 @@ import logging
 from components.header import create_main_screen
 # --- IMPORTS ACTUALIZADOS ---
 from db.postgres_db import PostgresSession  # Fuente de la verdad
-from db.sqlite_db import BackupSession       # Respaldo
 from db.models import User, SchedulePref
 # ----------------------------
 from zoneinfo import available_timezones
@@ -272,7 +271,7 @@ def profile_edit():
             render_floating_chatbot('edit_profile')
 
             # =================================================
-            # LÓGICA DE GUARDADO (NEON -> SQLITE)
+            # LÓGICA DE GUARDADO (NEON; el respaldo SQLite lo replica el outbox)
             # =================================================
             
             # 1. Función Worker (Bloqueante, corre en otro hilo)
@@ -305,29 +304,6 @@ def profile_edit():
                 finally:
                     pg_session.close()
 
-                # FASE 2: SQLITE (Respaldo)
-                try:
-                    sqlite_session = BackupSession()
-                    u_sq = sqlite_session.query(User).filter(User.username == username).first()
-                    if u_sq:
-                        u_sq.name = user_update['name']
-                        u_sq.surname = user_update['surname']
-                        u_sq.time_zone = user_update['time_zone']
-                        u_sq.email = user_update['email']
-                        u_sq.goal = user_update['goal'] # También en el respaldo
-                        u_sq.payment_info = user_update['payment_info']   # <----- NUEVO
-                    
-                    sqlite_session.query(SchedulePref).filter(SchedulePref.username == username).delete()
-                    for item in schedules_list:
-                        sqlite_session.add(SchedulePref(**item))
-                    
-                    sqlite_session.commit()
-                    log_msgs.append("💾 Respaldo actualizado en SQLITE")
-                except Exception as e:
-                    log_msgs.append(f"⚠️ Error backup local: {e}")
-                finally:
-                    sqlite_session.close()
-                
                 return log_msgs
 
             # 2. Función UI (Asíncrona)
@@ -1,10 +1,7 @@
 from nicegui import ui, app
-from passlib.hash import pbkdf2_sha256
 
 # --- NUEVOS IMPORTS ---
-from db.models import User
-from db.postgres_db import PostgresSession  # Fuente de la verdad
-from db.sqlite_db import BackupSession       # Respaldo
+from auth.passwords import change_password, client_ip  # Neon es la fuente de la verdad
 from prompts.chatbot import render_floating_chatbot
 # ----------------------
 
@@ -51,7 +48,7 @@ def reset_password_screen():
     def render_reset_content():
         
         # --- LÓGICA DE CAMBIO DE CONTRASEÑA ACTUALIZADA ---
-        def try_reset():
+        async def try_reset():
             u = username_input.value.strip()
             old_p = old_password_input.value.strip()
             new_p = new_password_input.value.strip()
@@ -61,63 +58,33 @@ def reset_password_screen():
                 return
 
             # FASE 1: ACTUALIZAR EN LA NUBE (NEON - PRINCIPAL)
-            session_pg = PostgresSession()
-            success = False
-            
-            try:
-                user_pg = session_pg.query(User).filter_by(username=u).first()
-                
-                # 1. Verificar Usuario en Neon
-                if not user_pg:
-                    ui.notify('El usuario no existe.', type='negative', icon='person_off')
-                    username_input.props('error error-message="Usuario no encontrado"')
-                    return
-
-                # 2. Verificar Contraseña Antigua (Hash)
-                if not pbkdf2_sha256.verify(old_p, user_pg.password_hash):
-                    ui.notify('La contraseña actual es incorrecta.', type='negative', icon='gpp_bad')
-                    old_password_input.props('error') 
-                    return
-
-                # 3. Actualizar en Neon
-                new_hash = pbkdf2_sha256.hash(new_p)
-                user_pg.password_hash = new_hash
-                session_pg.commit()
-                
-                success = True # Marcamos éxito para proceder al backup
-                ui.notify('¡Contraseña actualizada correctamente!', type='positive', icon='check_circle')
-                
-                # Redirigir tras breve pausa
-                ui.timer(1.5, lambda: ui.navigate.to('/login'))
-
-            except Exception as e:
-                session_pg.rollback()
-                ui.notify(f"Error de conexión con el servidor: {str(e)}", type='negative')
+            # Verificación, hash y escritura fuera del loop (auth/passwords.py)
+            result = await change_password(u, old_p, new_p, client_ip(ui.context.client))
+
+            # 1. Verificar Usuario en Neon
+            if result.get('error') == 'not_found':
+                ui.notify('El usuario no existe.', type='negative', icon='person_off')
+                username_input.props('error error-message="Usuario no encontrado"')
+                return
+
+            # 2. Verificar Contraseña Antigua (Hash) / intentos
+            if result.get('error') == 'invalid':
+                ui.notify('La contraseña actual es incorrecta.', type='negative', icon='gpp_bad')
+                old_password_input.props('error') 
                 return
-            finally:
-                session_pg.close()
-
-            # FASE 2: ACTUALIZAR RESPALDO (SQLITE - SECUNDARIO)
-            # Solo si la fase 1 fue exitosa
-            if success:
-                try:
-                    session_sqlite = BackupSession()
-                    user_sqlite = session_sqlite.query(User).filter_by(username=u).first()
-                    
-                    if user_sqlite:
-                        # Si el usuario existe en el backup, actualizamos su contraseña también
-                        user_sqlite.password_hash = new_hash
-                        session_sqlite.commit()
-                        print(f"💾 Backup actualizado para usuario {u}")
-                    else:
-                        print(f"⚠️ El usuario {u} no existía en el backup local (se omitió actualización local).")
-                        
-                except Exception as e:
-                    # Si falla el backup, NO avisamos al usuario (ya que su contraseña real sí cambió)
-                    # Solo lo registramos en consola
-                    print(f"⚠️ Error actualizando backup local: {e}")
-                finally:
-                    session_sqlite.close()
+            if result.get('error') == 'throttled':
+                ui.notify(f"Demasiados intentos. Espera {int(result['retry_after']) + 1} segundos.",
+                          type='warning', icon='hourglass_top')
+                return
+            if not result['success']:
+                ui.notify(f"Error de conexión con el servidor: {result.get('detail', '')}", type='negative')
+                return
+
+            # 3. Actualizado en Neon
+            ui.notify('¡Contraseña actualizada correctamente!', type='positive', icon='check_circle')
+            
+            # Redirigir tras breve pausa
+            ui.timer(1.5, lambda: ui.navigate.to('/login'))
 
         # --- DISEÑO ---
         with ui.card().classes('w-full max-w-sm p-8 shadow-xl rounded-2xl bg-white border border-gray-100'):
@@ -1,13 +1,19 @@
 ﻿import logging
 import os
-from fastapi import Request
 from nicegui import ui, app
-from fastapi.responses import RedirectResponse
-from starlette.middleware.base import BaseHTTPMiddleware
 from dotenv import load_dotenv
 from frontend.ui import init_ui
 import db.postgres_db
 import db.sqlite_db
+from db.executor import shutdown_db_executor
+from db.postgres_db import dispose_async_engine
+from db.replication import start_replication, stop_replication
+from components.class_finalizer import start_class_finalizer, stop_class_finalizer
+from components.sync_scheduler import start_scheduler, stop_scheduler
+from auth.middleware import AuthMiddleware
+from auth.calendar_webhook import register_calendar_webhook
+from components.geoip import close_geoip
+from auth.passwords import start_password_pool, shutdown_password_pool
 
 # 1. CARGAR VARIABLES DE ENTORNO
 load_dotenv()
@@ -36,51 +42,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# =====================================================
-# CONFIGURACIÓN DE SEGURIDAD (MIDDLEWARE)
-# =====================================================
-
-unrestricted_page_routes = {
-    '/login', '/signup', '/resetpass', '/MainPage', '/method', '/planScreen'
-}
-
-class AuthMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        # A. No bloquear NiceGUI ni estáticos
-        if (request.url.path.startswith('/_nicegui') or
-                request.url.path.startswith('/static') or
-                request.url.path.startswith('/components') or 
-                request.url.path.startswith('/uploads')):
-            return await call_next(request)
-
-        # B. Verificar estado de autenticación y ROL
-        authenticated = app.storage.user.get('authenticated', False)
-        role = app.storage.user.get('role', 'client') # Obtenemos el rol (default 'client')
-        path = request.url.path
-
-        # C. USUARIO LOGUEADO
-        if authenticated:
-            # Si intenta entrar al Login, Signup o Landing Page estando ya logueado:
-            if path in {'/login', '/signup', '/MainPage', '/'}:
-                
-                # --- CORRECCIÓN AQUÍ: Redirección inteligente ---
-                if role == 'admin':
-                    return RedirectResponse('/admin') # Redirigir al panel de admin
-                else:
-                    return RedirectResponse('/mainscreen') # Redirigir al panel de estudiante
-                # -----------------------------------------------
-                
-            return await call_next(request)
-
-        # D. VISITANTE (NO LOGUEADO)
-        else:
-            if path == '/':
-                return RedirectResponse('/MainPage')
-            if path in unrestricted_page_routes:
-                return await call_next(request)
-            # Redirigir al login guardando la intención
-            return RedirectResponse(f'/login?redirect_to={path}')
-
 # =====================================================
 # FUNCIÓN PRINCIPAL
 # =====================================================
@@ -88,8 +49,10 @@ class AuthMiddleware(BaseHTTPMiddleware):
 def main():
     """Inicializa la aplicación NiceGUI."""
     
-    # 1. Activar Middleware
+    # 1. Activar Middleware (ASGI puro, ver auth/middleware.py)
     app.add_middleware(AuthMiddleware)
+    # Webhook de Google Calendar (ruta pública, ver auth/routes.py)
+    register_calendar_webhook()
 
     # 2. SERVIR ARCHIVOS ESTÁTICOS (CENTRALIZADO)
     
@@ -116,7 +79,21 @@ def main():
     else:
         logger.warning(f"⚠️ NO se encontró prompts: {prompts_dir}")
 
-    # 3. Iniciar UI
+    # 3. Tareas de fondo y cierre de los pools de BD al apagar
+    # (el pool de contraseñas primero: hace fork antes de que arranquen los hilos)
+    app.on_startup(start_password_pool)
+    app.on_startup(start_replication)
+    app.on_startup(start_class_finalizer)
+    app.on_startup(start_scheduler)
+    app.on_shutdown(stop_class_finalizer)
+    app.on_shutdown(stop_scheduler)
+    app.on_shutdown(shutdown_db_executor)
+    app.on_shutdown(dispose_async_engine)
+    app.on_shutdown(stop_replication)
+    app.on_shutdown(close_geoip)
+    app.on_shutdown(shutdown_password_pool)
+
+    # 4. Iniciar UI
     logger.info("Inicializando aplicación UI")
     init_ui()
     logger.info("Aplicación iniciada correctamente")
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Los módulos se importan como en la app (db.*, components.*), desde tpmH/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
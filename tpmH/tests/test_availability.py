@@ -0,0 +1,50 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from components.availability import SLOT_MEMO_SIZE, DayAvailability, load_days
+from db.models import AsignedClasses, Base, ScheduleProf
+
+DATE = "2025-03-03"  # Lunes
+
+
+@pytest.fixture
+def session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'availability.sqlite'}")
+    Base.metadata.create_all(engine)
+    with Session(engine) as s:
+        s.add(ScheduleProf(username="prof", days="Lunes", start_time=900, end_time=1200, availability="Libre"))
+        yield s
+
+
+def _add_class(session, start, end, status):
+    session.add(AsignedClasses(
+        username="alumno", date=DATE, date_prof=DATE,
+        start_time=start, end_time=end, start_prof_time=start, end_prof_time=end,
+        status=status,
+    ))
+    session.commit()
+
+
+@pytest.mark.parametrize("status, blocks", [
+    ("Pendiente", True),
+    ("Prueba_Pendiente", True),
+    ("Finalizada", False),
+    ("Completada", False),
+    ("Cancelada", False),
+])
+def test_only_active_classes_block(session, status, blocks):
+    _add_class(session, 1000, 1100, status)
+    free = load_days(session, [DATE])[DATE].free_slots(60)
+    assert (1000 not in free) is blocks
+    assert 900 in free and 1100 in free
+
+
+def test_slot_memo_is_bounded():
+    day = DayAvailability(DATE, [(540, 720)], [(600, 660, 1)])
+    for duration in range(30, 30 + SLOT_MEMO_SIZE * 2):
+        day.slots(duration)
+    assert len(day._slot_memo) == SLOT_MEMO_SIZE
+    # Los resultados no cambian por salir del memo
+    assert day.free_slots(60) == [900, 1100]
+    assert day.free_slots(60, exclude_class_id=1) == [900, 930, 1000, 1030, 1100]
@@ -0,0 +1,73 @@
+import pytest
+
+from components.geoip import RangeIndex
+
+RANGES = [
+    ("1.0.0.0", "1.0.0.255", "Australia/Sydney"),
+    ("2.16.0.0", "2.16.255.255", "Europe/Madrid"),
+    ("255.255.255.0", "255.255.255.255", "Etc/Broadcast"),
+    ("2001:db8::", "2001:db8::ffff", "America/Caracas"),
+    ("2001:db8:0:1::", "2001:db8:0:1:ffff:ffff:ffff:ffff", "America/Bogota"),
+]
+
+
+@pytest.fixture
+def index():
+    return RangeIndex.from_ranges(RANGES)
+
+
+@pytest.mark.parametrize("ip, expected", [
+    # Bordes de cada rango IPv4
+    ("1.0.0.0", "Australia/Sydney"),
+    ("1.0.0.255", "Australia/Sydney"),
+    ("2.16.0.0", "Europe/Madrid"),
+    ("2.16.255.255", "Europe/Madrid"),
+    ("255.255.255.255", "Etc/Broadcast"),
+    # Antes del primero, entre rangos y justo después de uno
+    ("0.255.255.255", None),
+    ("1.0.1.0", None),
+    ("2.15.255.255", None),
+    ("2.17.0.0", None),
+    # IPv6: bordes, entre rangos y fuera
+    ("2001:db8::", "America/Caracas"),
+    ("2001:db8::ffff", "America/Caracas"),
+    ("2001:db8::1:0", None),
+    ("2001:db8:0:1::", "America/Bogota"),
+    ("2001:db8:0:1:ffff:ffff:ffff:ffff", "America/Bogota"),
+    ("2001:db8:0:2::", None),
+    ("::1", None),
+])
+def test_lookup(index, ip, expected):
+    assert index.lookup(ip) == expected
+
+
+def test_ipv4_and_ipv6_do_not_mix(index):
+    # ::1.0.0.1 es el mismo entero que 1.0.0.1, pero es IPv6
+    assert index.lookup("1.0.0.1") == "Australia/Sydney"
+    assert index.lookup("::1.0.0.1") is None
+    assert len(index) == len(RANGES)
+
+
+def test_from_csv_formats(tmp_path):
+    cidr = tmp_path / "cidr.csv"
+    cidr.write_text("network,time_zone\n10.0.0.0/8,Europe/Madrid\n2001:db8::/32,America/Lima\n", encoding="utf-8")
+    index = RangeIndex.from_csv(cidr)
+    assert index.lookup("10.255.255.255") == "Europe/Madrid"
+    assert index.lookup("11.0.0.0") is None
+    assert index.lookup("2001:db8:ffff::1") == "America/Lima"
+
+    spans = tmp_path / "spans.csv"
+    spans.write_text("start_ip,end_ip,time_zone\n16777216,16777471,Australia/Sydney\n8.8.8.0,8.8.8.255,America/Chicago\n", encoding="utf-8")
+    index = RangeIndex.from_csv(spans)
+    assert index.lookup("1.0.0.128") == "Australia/Sydney"
+    assert index.lookup("8.8.8.8") == "America/Chicago"
+
+    blocks = tmp_path / "blocks.csv"
+    blocks.write_text("network,geoname_id\n5.0.0.0/16,3117735\n6.0.0.0/16,999\n", encoding="utf-8")
+    locations = tmp_path / "locations.csv"
+    locations.write_text("geoname_id,time_zone\n3117735,Europe/Madrid\n999,\n", encoding="utf-8")
+    index = RangeIndex.from_csv(blocks, locations)
+    assert index.lookup("5.0.1.1") == "Europe/Madrid"
+    # Bloque sin zona: se descarta
+    assert index.lookup("6.0.0.1") is None
+    assert len(index) == 1
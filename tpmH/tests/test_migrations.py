@@ -0,0 +1,63 @@
+from sqlalchemy import create_engine, inspect, select, text
+
+from db.migrations import MIGRATIONS, run_migrations, schema_migrations
+from db.models import Base
+
+# Columnas que agregan las migraciones (no existían en el esquema original)
+ADDED_COLUMNS = {
+    "clases_asignadas": ["start_at", "end_at", "calendar_event_id", "calendar_etag", "calendar_updated"],
+    "calendar_sync_state": ["channel_id", "channel_resource_id", "channel_token", "channel_expiration"],
+}
+TRACKED_TABLES = [
+    "users", "rangos_horarios", "clases_asignadas", "horario_prof", "horario_prof_esp",
+    "teacher_profile", "materials", "homework", "student_materials", "student_homework",
+]
+
+
+def _baseline_engine(path):
+    """BD SQLite con el esquema anterior a las migraciones (sin índices ni columnas nuevas)."""
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        for table in inspect(conn).get_table_names():
+            for index in inspect(conn).get_indexes(table):
+                conn.exec_driver_sql(f"DROP INDEX {index['name']}")
+        columns = dict(ADDED_COLUMNS)
+        for table in TRACKED_TABLES:
+            columns[table] = columns.get(table, []) + ["updated_at"]
+        for table, names in columns.items():
+            for name in names:
+                conn.exec_driver_sql(f"ALTER TABLE {table} DROP COLUMN {name}")
+    return engine
+
+
+def test_upgrade_baseline_database(tmp_path):
+    engine = _baseline_engine(tmp_path / "baseline.sqlite")
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO users (username, role, time_zone) VALUES ('prof', 'admin', 'Europe/Madrid')"
+        ))
+        conn.execute(text(
+            "INSERT INTO clases_asignadas (username, date, date_prof, start_time, end_time, "
+            "start_prof_time, end_prof_time, duration, status) "
+            "VALUES ('ana', '2025-03-10', '2025-03-10', 900, 1000, 1000, 1100, '60', 'Pendiente')"
+        ))
+
+    Base.metadata.create_all(engine)
+    assert run_migrations(engine, "test") == MIGRATIONS[-1][0]
+
+    with engine.connect() as conn:
+        applied = set(conn.execute(select(schema_migrations.c.version)).scalars())
+        row = conn.execute(text("SELECT start_at, end_at, updated_at FROM clases_asignadas")).one()
+    assert applied == {version for version, _, _ in MIGRATIONS}
+    assert row.start_at is not None and row.end_at is not None
+    # 10:00 en la zona del admin (Madrid, UTC+1 en marzo), no en la zona por defecto
+    assert str(row.start_at).startswith("2025-03-10 09:00")
+    assert row.updated_at is not None
+
+
+def test_migrations_run_once(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'new.sqlite'}")
+    Base.metadata.create_all(engine)
+    run_migrations(engine, "test")
+    assert run_migrations(engine, "test") == MIGRATIONS[-1][0]